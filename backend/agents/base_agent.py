@@ -1,9 +1,48 @@
 """Base agent class for all Dr. Document agents"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
-from openai import OpenAI
+from functools import lru_cache
+from typing import Dict, Any, Iterator, Optional, Union
+from openai import AsyncOpenAI, OpenAI, RateLimitError
+from backend.agents.llm_cache import LLMCache, llm_cache
+from backend.agents.llm_client import (
+    get_async_client, get_client, request_slots, token_budget,
+)
 from backend.config import settings
 from backend.logger import logger
+from backend.tokens import count_prompt_tokens, count_tokens, truncate
+
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+
+@lru_cache(maxsize=8)
+def _bounded_context(codebase_summary: str, max_tokens: int) -> str:
+    """
+    The codebase summary cut to ``max_tokens``, with a marker when truncated.
+    Cached so every agent of a run gets the same string without re-encoding it.
+    """
+    kept = truncate(codebase_summary, max_tokens)
+    if len(kept) == len(codebase_summary):
+        return codebase_summary
+    logger.warning(f"Codebase summary truncated to {max_tokens} tokens for agent prompts")
+    return f"{kept}\n... [truncated {len(codebase_summary) - len(kept)} chars]"
+
+
+def _prompt_cache_key(first_message: Dict[str, Any]) -> str:
+    """
+    Routing hint for provider prompt caches: calls whose leading message (the
+    shared codebase context) is identical get the same key, so the provider
+    can send them to the server already holding that prefix.
+    """
+    content = first_message.get('content', '')
+    if not isinstance(content, str):
+        content = ''.join(block.get('text', '') for block in content)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:32]
 
 
 class BaseAgent(ABC):
@@ -12,64 +51,214 @@ class BaseAgent(ABC):
     def __init__(self, agent_name: str, model: str = None):
         self.agent_name = agent_name
         self.model = model or settings.model_flash_lite  # Default to Flash Lite
-        self.client = self._initialize_client()
         logger.info(f"Initialized {agent_name} with model {self.model}", emoji='AGENT')
     
-    def _initialize_client(self) -> OpenAI:
-        """Initialize OpenAI client for LongCat"""
+    @property
+    def client(self) -> OpenAI:
+        """Shared sync LongCat client (created lazily, reused by all agents)"""
+        return get_client()
+    
+    @property
+    def aclient(self) -> AsyncOpenAI:
+        """Shared async LongCat client for the running event loop"""
+        return get_async_client()
+    
+    def _prompt_content(self, static_prefix: str, dynamic_suffix: str = '') -> Union[str, list]:
+        """
+        Build message content from a prefix that is stable across calls and a
+        per-call suffix. With settings.llm_prompt_cache_control the prefix is
+        sent as its own text block marked cache_control=ephemeral so providers
+        with prompt caching can reuse it; otherwise the two are concatenated.
+        """
+        if not settings.llm_prompt_cache_control:
+            return static_prefix + dynamic_suffix
+        blocks = [{"type": "text", "text": static_prefix, "cache_control": {"type": "ephemeral"}}]
+        if dynamic_suffix:
+            blocks.append({"type": "text", "text": dynamic_suffix})
+        return blocks
+    
+    def _codebase_context_message(self, codebase_summary: str) -> Dict[str, Any]:
+        """
+        Leading system message carrying the codebase summary (capped at
+        settings.codebase_context_max_tokens). Every agent builds it
+        identically, so all calls of a run start with the same prefix and
+        provider prompt caches can share it across agents.
+        """
+        context = _bounded_context(codebase_summary, settings.codebase_context_max_tokens)
+        return {"role": "system", "content": self._prompt_content(f"CODEBASE CONTEXT\n{context}")}
+    
+    def _log_cache_usage(self, response: Any):
+        """Log provider-side prompt-cache hits when the response reports them"""
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return
+        cached_tokens = getattr(usage, 'cache_read_input_tokens', None)
+        if cached_tokens is None:
+            details = getattr(usage, 'prompt_tokens_details', None)
+            cached_tokens = getattr(details, 'cached_tokens', None)
+        if cached_tokens:
+            logger.info(f"Prompt cache read {cached_tokens} tokens for {self.agent_name}", emoji='LLM')
+    
+    def _resolve_max_tokens(self, max_tokens: Optional[int], model: str) -> int:
+        """Determine max tokens based on model when not given explicitly"""
+        if max_tokens is None:
+            if 'lite' in model.lower():
+                return settings.max_tokens_lite
+            elif 'thinking' in model.lower():
+                return settings.max_tokens_thinking
+            else:
+                return settings.max_tokens_chat
+        return max_tokens
+    
+    def _log_llm_call(self, messages: list, max_tokens: int, temperature: float, model: str):
+        """Log the outgoing LLM input and call details"""
+        # Log LLM input
+        logger.llm_input(model, messages)
+        
+        # Log LLM call details
+        call_details = {
+            'model': model,
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+            'messages_count': len(messages)
+        }
+        logger.llm_call(model, call_details)
+    
+    def _rate_limit_delay(self, attempt: int) -> float:
+        """
+        Backoff before retrying a rate-limited call: a random delay of up to
+        2**attempt seconds (capped at 60), so calls limited together — e.g. by
+        concurrent workflows — do not retry in lockstep.
+        """
+        delay = random.uniform(1, min(60, 2 ** attempt))
+        logger.warning(
+            f"Rate limited on {self.agent_name} (attempt {attempt}/"
+            f"{settings.llm_max_retries}), retrying in {delay:.1f}s"
+        )
+        return delay
+
+    @staticmethod
+    def _request_tokens(messages: list, max_tokens: int) -> int:
+        """
+        Tokens a request counts against the tokens-per-minute budget: its
+        prompt plus max_tokens. Not counted (0) when the budget is disabled.
+        """
+        if not settings.llm_max_tokens_per_minute:
+            return 0
+        # System prompts are static, so their counts are memoized
+        prompt_tokens = sum(
+            count_prompt_tokens(str(message.get('content', ''))) if message.get('role') == 'system'
+            else count_tokens(str(message.get('content', '')))
+            for message in messages
+        )
+        return prompt_tokens + max_tokens
+    
+    def _cache_key(
+        self,
+        messages: list,
+        max_tokens: int,
+        temperature: float,
+        response_format: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None
+    ) -> Optional[str]:
+        """Response-cache key, or None when the call should not be cached"""
+        # High-temperature calls are meant to vary between runs — never cache them
+        if not settings.llm_cache_enabled or temperature > settings.llm_cache_max_temperature:
+            return None
+        return LLMCache.make_key(model or self.model, messages, max_tokens, temperature, response_format)
+    
+    def _request_kwargs(
+        self,
+        messages: list,
+        max_tokens: int,
+        temperature: float,
+        response_format: Optional[Dict[str, Any]],
+        model: str
+    ) -> Dict[str, Any]:
+        """Keyword arguments for chat.completions.create"""
+        kwargs: Dict[str, Any] = {
+            'model': model,
+            'messages': messages,
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+        }
+        if response_format is not None and settings.llm_json_mode:
+            kwargs['response_format'] = response_format
+        if settings.llm_prompt_cache_key and messages:
+            kwargs['extra_body'] = {'prompt_cache_key': _prompt_cache_key(messages[0])}
+        return kwargs
+    
+    @staticmethod
+    def _parse_json_object(reply: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Parse a JSON object from an LLM reply, tolerating surrounding prose or fences"""
         try:
-            client = OpenAI(
-                api_key=settings.longcat_api_key,
-                base_url=settings.longcat_base_url
-            )
-            logger.success(f"LongCat client initialized for {self.agent_name}")
-            return client
-        except Exception as e:
-            logger.error(f"Failed to initialize LongCat client: {str(e)}", exc_info=True)
-            raise
+            parsed = json.loads(reply)
+        except (json.JSONDecodeError, TypeError):
+            match = _JSON_OBJECT_RE.search(reply or '')
+            if not match:
+                return None
+            try:
+                parsed = json.loads(match.group(0))
+            except json.JSONDecodeError:
+                return None
+        return parsed if isinstance(parsed, dict) else None
+    
+    def _cached_response(self, cache_key: Optional[str]) -> Optional[str]:
+        """Look up a cached response, logging hits"""
+        if cache_key is None:
+            return None
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"LLM cache hit for {self.agent_name}", emoji='LLM')
+        return cached
     
     def _call_llm(
         self,
         messages: list,
         max_tokens: int = 8192,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        response_format: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None
     ) -> str:
-        """Call LLM and log the interaction"""
+        """
+        Call LLM and log the interaction (``model`` overrides self.model for this call).
+        Rate-limited calls (HTTP 429) are retried with jittered exponential backoff.
+        """
         try:
-            # Determine max tokens based on model
-            if max_tokens is None:
-                if 'lite' in self.model.lower():
-                    max_tokens = settings.max_tokens_lite
-                elif 'thinking' in self.model.lower():
-                    max_tokens = settings.max_tokens_thinking
-                else:
-                    max_tokens = settings.max_tokens_chat
-            
-            # Log LLM input
-            logger.llm_input(self.model, messages)
-            
-            # Log LLM call details
-            call_details = {
-                'model': self.model,
-                'max_tokens': max_tokens,
-                'temperature': temperature,
-                'messages_count': len(messages)
-            }
-            logger.llm_call(self.model, call_details)
-            
-            # Make the API call
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
+            model = model or self.model
+            max_tokens = self._resolve_max_tokens(max_tokens, model)
+            cache_key = self._cache_key(messages, max_tokens, temperature, response_format, model)
+            cached = self._cached_response(cache_key)
+            if cached is not None:
+                return cached
+            
+            self._log_llm_call(messages, max_tokens, temperature, model)
+            request_tokens = self._request_tokens(messages, max_tokens)
+            
+            # Make the API call, retrying with backoff when rate limited
+            for attempt in range(1, settings.llm_max_retries + 1):
+                token_budget().consume(request_tokens)
+                try:
+                    with request_slots():
+                        response = self.client.chat.completions.create(
+                            **self._request_kwargs(messages, max_tokens, temperature, response_format, model)
+                        )
+                    break
+                except RateLimitError:
+                    if attempt == settings.llm_max_retries:
+                        raise
+                    time.sleep(self._rate_limit_delay(attempt))
+            
+            self._log_cache_usage(response)
             
             # Extract response content
             result = response.choices[0].message.content
             
             # Log LLM output
-            logger.llm_output(self.model, result)
+            logger.llm_output(model, result)
+            
+            if cache_key is not None and result:
+                llm_cache.set(cache_key, result)
             
             return result
             
@@ -77,6 +266,130 @@ class BaseAgent(ABC):
             logger.error(f"LLM call failed for {self.agent_name}: {str(e)}", exc_info=True)
             raise
     
+    def _call_llm_stream(
+        self,
+        messages: list,
+        max_tokens: int = 8192,
+        temperature: float = 0.7,
+        response_format: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None
+    ) -> Iterator[str]:
+        """
+        Streaming variant of _call_llm — yields the reply in chunks as the
+        model produces them. A cached reply is yielded as a single chunk;
+        the complete reply is logged and cached once the stream ends.
+        Closing the generator early closes the underlying HTTP stream.
+        """
+        try:
+            model = model or self.model
+            max_tokens = self._resolve_max_tokens(max_tokens, model)
+            cache_key = self._cache_key(messages, max_tokens, temperature, response_format, model)
+            cached = self._cached_response(cache_key)
+            if cached is not None:
+                yield cached
+                return
+            
+            self._log_llm_call(messages, max_tokens, temperature, model)
+            
+            request_tokens = self._request_tokens(messages, max_tokens)
+            
+            # The slot is held until the stream is fully read or closed
+            slots = request_slots()
+            for attempt in range(1, settings.llm_max_retries + 1):
+                token_budget().consume(request_tokens)
+                slots.acquire()
+                try:
+                    stream = self.client.chat.completions.create(
+                        **self._request_kwargs(messages, max_tokens, temperature, response_format, model),
+                        stream=True
+                    )
+                    break
+                except RateLimitError:
+                    slots.release()
+                    if attempt == settings.llm_max_retries:
+                        raise
+                    time.sleep(self._rate_limit_delay(attempt))
+                except Exception:
+                    slots.release()
+                    raise
+            
+            parts = []
+            try:
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        logger.llm_output_chunk(model, content)
+                        parts.append(content)
+                        yield content
+            finally:
+                # Also runs when the consumer stops early — release the connection
+                close = getattr(stream, 'close', None)
+                if close is not None:
+                    close()
+                slots.release()
+            
+            result = ''.join(parts)
+            logger.llm_output(model, result)
+            
+            if cache_key is not None and result:
+                llm_cache.set(cache_key, result)
+            
+        except Exception as e:
+            logger.error(f"Streaming LLM call failed for {self.agent_name}: {str(e)}", exc_info=True)
+            raise
+    
+    async def _acall_llm(
+        self,
+        messages: list,
+        max_tokens: int = 8192,
+        temperature: float = 0.7,
+        response_format: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None
+    ) -> str:
+        """
+        Async variant of _call_llm — lets many calls share one event loop.
+        Rate-limited calls (HTTP 429) are retried with jittered exponential backoff.
+        """
+        try:
+            model = model or self.model
+            max_tokens = self._resolve_max_tokens(max_tokens, model)
+            cache_key = self._cache_key(messages, max_tokens, temperature, response_format, model)
+            cached = self._cached_response(cache_key)
+            if cached is not None:
+                return cached
+            
+            self._log_llm_call(messages, max_tokens, temperature, model)
+            request_tokens = self._request_tokens(messages, max_tokens)
+            
+            for attempt in range(1, settings.llm_max_retries + 1):
+                await token_budget().aconsume(request_tokens)
+                try:
+                    # Slot held only for the request itself, not the backoff sleep
+                    async with request_slots():
+                        response = await self.aclient.chat.completions.create(
+                            **self._request_kwargs(messages, max_tokens, temperature, response_format, model)
+                        )
+                    break
+                except RateLimitError:
+                    if attempt == settings.llm_max_retries:
+                        raise
+                    await asyncio.sleep(self._rate_limit_delay(attempt))
+            
+            self._log_cache_usage(response)
+            result = response.choices[0].message.content
+            logger.llm_output(model, result)
+            
+            if cache_key is not None and result:
+                llm_cache.set(cache_key, result)
+            
+            return result
+            
+        except Exception as e:
+            logger.error(f"Async LLM call failed for {self.agent_name}: {str(e)}", exc_info=True)
+            raise
+    
     @abstractmethod
     def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Process input and return result. Must be implemented by subclasses."""
@@ -92,3 +405,18 @@ class BaseAgent(ABC):
         except Exception as e:
             logger.agent_failed(self.agent_name, str(e))
             raise
+    
+    async def aprocess(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Async process. Defaults to running process() in a worker thread."""
+        return await asyncio.to_thread(self.process, input_data)
+    
+    async def arun(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Async counterpart of run()"""
+        try:
+            logger.agent_start(self.agent_name, f"Processing input: {str(input_data)[:100]}")
+            result = await self.aprocess(input_data)
+            logger.agent_complete(self.agent_name, f"Successfully processed")
+            return result
+        except Exception as e:
+            logger.agent_failed(self.agent_name, str(e))
+            raise
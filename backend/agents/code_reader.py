@@ -1,8 +1,28 @@
 """Agent 1: Code Reader - Analyzes code files"""
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 from backend.agents.base_agent import BaseAgent
 from backend.config import settings
 from backend.logger import logger
+from backend.tokens import truncate
+
+# Token budget for the analyzed file content
+_MAX_FILE_TOKENS = 800
+
+# Static prompt text, identical across calls so providers can cache it
+_SYSTEM_PROMPT = "You are a code analysis expert. Analyze code thoroughly and provide structured insights."
+_INSTRUCTIONS = """Analyze the code file below and provide a comprehensive analysis.
+
+Please analyze and provide:
+1. Main purpose and functionality
+2. List of functions/methods with brief descriptions
+3. List of classes/interfaces with brief descriptions
+4. External dependencies and imports
+5. Key algorithms or patterns used
+6. Overall code quality observations
+
+Format your response as a structured analysis.
+
+"""
 
 
 class CodeReaderAgent(BaseAgent):
@@ -48,34 +68,23 @@ class CodeReaderAgent(BaseAgent):
                 'summary': 'No content to analyze'
             }
         
-        # Prepare prompt for LLM
-        prompt = f"""Analyze the following code file and provide a comprehensive analysis.
-
-File: {file_path}
+        # Prepare prompt for LLM — the static _INSTRUCTIONS prefix comes
+        # first so providers can cache it; the file itself comes last
+        file_block = f"""File: {file_path}
 
 Code:
 ```
-{file_content[:3000]}  # Limit to first 3000 chars
-```
-
-Please analyze and provide:
-1. Main purpose and functionality
-2. List of functions/methods with brief descriptions
-3. List of classes/interfaces with brief descriptions
-4. External dependencies and imports
-5. Key algorithms or patterns used
-6. Overall code quality observations
-
-Format your response as a structured analysis."""
+{truncate(file_content, _MAX_FILE_TOKENS)}
+```"""
         
         messages = [
             {
                 "role": "system",
-                "content": "You are a code analysis expert. Analyze code thoroughly and provide structured insights."
+                "content": _SYSTEM_PROMPT
             },
             {
                 "role": "user",
-                "content": prompt
+                "content": self._prompt_content(_INSTRUCTIONS, file_block)
             }
         ]
         
@@ -83,12 +92,13 @@ Format your response as a structured analysis."""
         analysis_result = self._call_llm(messages, max_tokens=8192)
         
         # Parse the analysis (simplified extraction)
+        functions, classes, dependencies = self._extract_all(analysis_result)
         result = {
             'file_path': file_path,
             'analysis': analysis_result,
-            'functions': self._extract_functions(analysis_result),
-            'classes': self._extract_classes(analysis_result),
-            'dependencies': self._extract_dependencies(analysis_result),
+            'functions': functions,
+            'classes': classes,
+            'dependencies': dependencies,
             'summary': self._extract_summary(analysis_result)
         }
         
@@ -96,40 +106,28 @@ Format your response as a structured analysis."""
         
         return result
     
-    def _extract_functions(self, analysis: str) -> list:
-        """Extract function names from analysis"""
-        # Simple extraction - look for function mentions
-        functions = []
-        lines = analysis.split('\n')
-        for line in lines:
-            if 'function' in line.lower() or 'method' in line.lower():
-                # Simple extraction logic
-                parts = line.split(':')
-                if len(parts) >= 2:
-                    functions.append(parts[0].strip())
-        return functions[:20]  # Limit to 20 functions
-    
-    def _extract_classes(self, analysis: str) -> list:
-        """Extract class names from analysis"""
-        classes = []
-        lines = analysis.split('\n')
-        for line in lines:
-            if 'class' in line.lower():
-                parts = line.split(':')
-                if len(parts) >= 2:
-                    classes.append(parts[0].strip())
-        return classes[:20]  # Limit to 20 classes
-    
-    def _extract_dependencies(self, analysis: str) -> list:
-        """Extract dependencies from analysis"""
-        dependencies = []
-        lines = analysis.split('\n')
-        for line in lines:
-            if 'import' in line.lower() or 'dependency' in line.lower() or 'require' in line.lower():
-                parts = line.split(':')
-                if len(parts) >= 2:
-                    dependencies.append(parts[1].strip())
-        return dependencies[:30]  # Limit to 30 dependencies
+    def _extract_all(self, analysis: str) -> Tuple[list, list, list]:
+        """
+        Extract function names, class names and dependencies from the
+        analysis in a single pass over its lines.
+
+        Returns:
+            (functions, classes, dependencies), limited to 20, 20 and 30 entries
+        """
+        functions, classes, dependencies = [], [], []
+        for line in analysis.split('\n'):
+            if ':' not in line:
+                continue
+            low = line.lower()
+            if len(functions) < 20 and ('function' in low or 'method' in low):
+                functions.append(line.split(':', 1)[0].strip())
+            if len(classes) < 20 and 'class' in low:
+                classes.append(line.split(':', 1)[0].strip())
+            if len(dependencies) < 30 and ('import' in low or 'dependency' in low or 'require' in low):
+                dependencies.append(line.split(':', 2)[1].strip())
+            if len(functions) >= 20 and len(classes) >= 20 and len(dependencies) >= 30:
+                break
+        return functions, classes, dependencies
     
     def _extract_summary(self, analysis: str) -> str:
         """Extract summary from analysis"""
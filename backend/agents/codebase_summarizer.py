@@ -1,13 +1,77 @@
 """Agent 1: Codebase Summarizer - Creates concise per-file summaries → codebase.txt"""
-from typing import Dict, Any, List
+import asyncio
+import fnmatch
+import hashlib
+import os
+import re
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
 from backend.agents.base_agent import BaseAgent
+from backend.agents.llm_cache import LLMCache, llm_cache, normalize_source
 from backend.config import settings
 from backend.logger import logger
+from backend.tokens import count_prompt_tokens, count_tokens, truncate, truncate_counted
+
+# Token budget for the content of a single file
+_MAX_FILE_TOKENS = 1000
+
+# Static system prompts, kept identical across calls so providers can cache them
+_SYSTEM_PROMPT = (
+    "You are a codebase analyst. For the given file, output a single short sentence "
+    "describing what the file implements, its main features, or its purpose. "
+    "Be extremely concise — one sentence max. "
+    "Do NOT include the filename in your response."
+)
+_BATCH_SYSTEM_PROMPT = (
+    "You are a codebase analyst. For each given file, write a single short sentence "
+    "describing what the file implements, its main features, or its purpose. "
+    "Be extremely concise — one sentence max per file. "
+    "Do NOT include the filename in the sentence. "
+    "Return ONLY a JSON object mapping each file path, exactly as given, "
+    "to its sentence."
+)
+
+# Files shorter than this (stripped) are described by their own content
+_TRIVIAL_FILE_CHARS = 40
+
+# Generated or asset files that get a fixed summary instead of an LLM call
+# (patterns are matched case-insensitively against the file name)
+_FIXED_SUMMARIES = {
+    'package-lock.json': 'npm lockfile pinning exact versions of the installed dependencies.',
+    'yarn.lock': 'Yarn lockfile pinning exact versions of the installed dependencies.',
+    'pnpm-lock.yaml': 'pnpm lockfile pinning exact versions of the installed dependencies.',
+    'poetry.lock': 'Poetry lockfile pinning exact versions of the installed dependencies.',
+    'cargo.lock': 'Cargo lockfile pinning exact versions of the installed dependencies.',
+    'composer.lock': 'Composer lockfile pinning exact versions of the installed dependencies.',
+    'gemfile.lock': 'Bundler lockfile pinning exact versions of the installed dependencies.',
+    '*.min.*': 'Minified build artifact.',
+    '*.map': 'Source map for a compiled bundle.',
+    '*.svg': 'SVG image asset.',
+}
+# License files by exact name only, so source files such as license_check.ts
+# still reach the LLM
+_FIXED_SUMMARIES.update(dict.fromkeys(
+    (
+        'license', 'license.md', 'license.txt', 'licence', 'licence.md', 'licence.txt',
+        'copying', 'copying.md', 'copying.txt',
+    ),
+    'License text for the project.',
+))
+# The same patterns as regexes, compiled once (checked against every file name)
+_FIXED_SUMMARY_RES = [
+    (re.compile(fnmatch.translate(pattern)), pattern, summary)
+    for pattern, summary in _FIXED_SUMMARIES.items()
+]
+
+# Share of control characters (first 1 KiB) above which content is treated as binary
+_BINARY_RATIO = 0.3
+# Control characters other than tab, newline, form feed and carriage return
+_CONTROL_CHAR_RE = re.compile('[\x00-\x08\x0b\x0e-\x1f\x7f]')
 
 
 class CodebaseSummarizerAgent(BaseAgent):
     """
-    Reads each repository file one at a time and produces a single-line summary.
+    Reads the repository files and produces a single-line summary per file
+    (several small files may share one LLM call).
     Output is written to codebase.txt in the format:
         filename = what this file implements / features
     """
@@ -36,33 +100,121 @@ class CodebaseSummarizerAgent(BaseAgent):
 
         logger.file_process(file_path, 'Summarizing')
 
-        if not file_content.strip():
-            return {'file_path': file_path, 'summary': 'Empty file'}
+        summary = self._local_summary(file_path, file_content)
+        if summary is not None:
+            return {'file_path': file_path, 'summary': summary}
+
+        file_content = truncate(file_content, _MAX_FILE_TOKENS)
+        semantic_key = self._semantic_cache_key(file_path, file_content)
+        summary = self._cached_response(semantic_key)
+        if summary is None:
+            summary = self._call_llm(
+                self._build_messages(file_path, file_content), max_tokens=200, temperature=0.3
+            )
+            summary = summary.strip().replace('\n', ' ')
+            if semantic_key is not None:
+                llm_cache.set(semantic_key, summary)
+
+        return {'file_path': file_path, 'summary': summary}
+
+    async def aprocess(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Async variant of process() using the async LLM client."""
+        file_path = input_data.get('file_path', 'unknown')
+        file_content = input_data.get('file_content', '')
 
-        messages = [
+        logger.file_process(file_path, 'Summarizing')
+
+        summary = self._local_summary(file_path, file_content)
+        if summary is not None:
+            return {'file_path': file_path, 'summary': summary}
+
+        file_content = truncate(file_content, _MAX_FILE_TOKENS)
+        semantic_key = self._semantic_cache_key(file_path, file_content)
+        summary = self._cached_response(semantic_key)
+        if summary is None:
+            summary = await self._acall_llm(
+                self._build_messages(file_path, file_content), max_tokens=200, temperature=0.3
+            )
+            summary = summary.strip().replace('\n', ' ')
+            if semantic_key is not None:
+                llm_cache.set(semantic_key, summary)
+
+        return {'file_path': file_path, 'summary': summary}
+
+    @staticmethod
+    def _local_summary(file_path: str, file_content: str) -> Optional[str]:
+        """
+        Summarize files that do not need the LLM: empty or tiny files,
+        lockfiles and generated assets, and binary-looking content.
+
+        Returns:
+            The summary, or None if the file should go to the LLM
+        """
+        stripped = file_content.strip()
+        if not stripped:
+            return 'Empty file'
+
+        if len(stripped) < _TRIVIAL_FILE_CHARS:
+            logger.info(f"Skipping LLM for {file_path}: trivial file")
+            return f"Tiny file containing: {' '.join(stripped.split())}"
+
+        name = os.path.basename(file_path).lower()
+        for pattern_re, pattern, summary in _FIXED_SUMMARY_RES:
+            if pattern_re.match(name):
+                logger.info(f"Skipping LLM for {file_path}: matches {pattern}")
+                return summary
+
+        sample = file_content[:1024]
+        control = len(_CONTROL_CHAR_RE.findall(sample))
+        if control / len(sample) > _BINARY_RATIO:
+            logger.info(f"Skipping LLM for {file_path}: binary-looking content")
+            return 'Binary or non-text content.'
+
+        return None
+
+    def _semantic_cache_key(self, file_path: str, file_content: str) -> Optional[str]:
+        """
+        Cache key over the normalized (already truncated) file content, so
+        re-indented or comment-tweaked files reuse an earlier summary. None
+        when the content cannot be normalized safely (see normalize_source).
+        """
+        if not (settings.llm_cache_enabled and settings.enable_semantic_cache):
+            return None
+        normalized = normalize_source(file_content, file_path)
+        if normalized is None:
+            return None
+        extension = os.path.splitext(file_path)[1].lower()
+        return LLMCache.make_key(self.model, ['summary', extension, normalized], 200, 0.3)
+
+    def codebase_cache_key(self, head_sha: Optional[str], file_paths: List[str]) -> Optional[str]:
+        """
+        Cache key for the complete codebase.txt of one commit, or None when
+        the commit is unknown or codebase caching is disabled. The selected
+        file paths are part of the key, so changes to the file limits or
+        allowed extensions are never served a stale summary.
+        """
+        if not (head_sha and settings.llm_cache_enabled and settings.enable_codebase_cache):
+            return None
+        return LLMCache.make_key(
+            self.model, ['codebase', head_sha, file_paths], _MAX_FILE_TOKENS, 0
+        )
+
+    def _build_messages(self, file_path: str, file_content: str) -> List[Dict[str, str]]:
+        """Build the chat messages for summarizing one (already truncated) file."""
+        return [
             {
                 "role": "system",
-                "content": (
-                    "You are a codebase analyst. For the given file, output a single short sentence "
-                    "describing what the file implements, its main features, or its purpose. "
-                    "Be extremely concise — one sentence max. "
-                    "Do NOT include the filename in your response."
-                ),
+                "content": self._prompt_content(_SYSTEM_PROMPT),
             },
             {
                 "role": "user",
                 "content": (
                     f"File: {file_path}\n\n"
-                    f"```\n{file_content[:4000]}\n```"
+                    f"```\n{file_content}\n```"
                 ),
             },
         ]
 
-        summary = self._call_llm(messages, max_tokens=200, temperature=0.3)
-        summary = summary.strip().replace('\n', ' ')
-
-        return {'file_path': file_path, 'summary': summary}
-
     def summarize_all(self, files_data: List[Dict]) -> str:
         """
         Summarize every file and return the complete codebase.txt content.
@@ -73,8 +225,234 @@ class CodebaseSummarizerAgent(BaseAgent):
         Returns:
             codebase.txt content as a string
         """
-        lines = []
+        return asyncio.run(self.summarize_all_async(files_data))
+
+    async def summarize_all_async(
+        self,
+        files_data: List[Dict],
+        progress_callback: Optional[Callable[[int, int], Awaitable[None]]] = None,
+        out_path: Optional[str] = None,
+    ) -> str:
+        """
+        Summarize every file and return the complete codebase.txt content in input order.
+
+        Files without a cached summary are packed into batches (see _pack_batch)
+        so that one LLM call summarizes several files; batches run concurrently
+        with at most ``settings.llm_max_concurrency`` requests in flight.
+        Files that cannot be summarized are logged and left out.
+
+        Args:
+            files_data: list of {'file_path': str, 'file_content': str}
+            progress_callback: optional coroutine called as (done, total)
+                after each batch completes
+            out_path: optional file that summary lines are appended to as soon
+                as they are available (completion order); callers rewrite it
+                with the ordered result once this returns
+        """
+        # Hashing, cache lookups, truncation and packing are CPU/disk work —
+        # keep them off the event loop so in-flight requests keep progressing
+        ready, pending, copies = await asyncio.to_thread(self._plan, files_data)
+        batches = await asyncio.to_thread(self._pack_batch, pending)
+
+        summaries: Dict[str, str] = {}
+        out_file = None
+        if out_path:
+            try:
+                out_file = open(out_path, 'w', encoding='utf-8')
+            except OSError as exc:
+                logger.warning(f"Cannot stream summaries to {out_path}: {exc}")
+
+        def emit(new: Dict[str, str]):
+            summaries.update(new)
+            if out_file is not None:
+                out_file.writelines(f"{path} = {summary}\n" for path, summary in new.items())
+                out_file.flush()
+
+        emit(ready)
+
+        total = len(files_data)
+        done = total - len(pending) - sum(len(copies[f['file_path']]) for f in pending)
+        sem = asyncio.Semaphore(settings.llm_max_concurrency)
+
+        async def summarize(batch: List[Dict]):
+            nonlocal done
+            async with sem:
+                result = await self._asummarize_batch(batch)
+            for file_path, summary in list(result.items()):
+                result.update({other: summary for other in copies.get(file_path, [])})
+            emit(result)
+            done += sum(1 + len(copies[f['file_path']]) for f in batch)
+            if progress_callback:
+                await progress_callback(done, total)
+
+        try:
+            await asyncio.gather(*(summarize(batch) for batch in batches))
+        finally:
+            if out_file is not None:
+                out_file.close()
+
+        paths = (file_data.get('file_path', 'unknown') for file_data in files_data)
+        return '\n'.join(f"{path} = {summaries[path]}" for path in paths if path in summaries)
+
+    # ------------------------------------------------------------------
+    # Batching helpers
+    # ------------------------------------------------------------------
+
+    def _plan(self, files_data: List[Dict]) -> Tuple[Dict[str, str], List[Dict], Dict[str, List[str]]]:
+        """
+        Work out which files need the LLM.
+
+        Identical files are summarized once: the first path with a given
+        content stands for the others, which are listed in ``copies``. With
+        settings.enable_semantic_cache, files of the same known language that
+        only differ in whitespace or comment-only lines (see normalize_source)
+        count as identical too, as they do for the summary cache; files that
+        cannot be normalized are only merged with byte-identical copies.
+
+        Returns:
+            (ready, pending, copies) — summaries already known without the
+            LLM (local rules, cache, copies of cached files), the truncated
+            files still to summarize, and representative path → duplicate paths
+        """
+        ready: Dict[str, str] = {}
+        pending: List[Dict] = []
+        first_path_by_hash: Dict[str, str] = {}
+        copies: Dict[str, List[str]] = {}
+        semantic = settings.enable_semantic_cache
         for file_data in files_data:
-            result = self.run(file_data)
-            lines.append(f"{result['file_path']} = {result['summary']}")
-        return '\n'.join(lines)
+            file_content = file_data.get('file_content', '')
+            file_path = file_data.get('file_path', 'unknown')
+            local = self._local_summary(file_path, file_content)
+            if local is not None:
+                ready[file_path] = local
+                continue
+            normalized = normalize_source(file_content, file_path) if semantic else None
+            if normalized is not None:
+                # Tagged with the extension so normalized text never matches
+                # the raw content of another file
+                dedupe_text = f"{os.path.splitext(file_path)[1].lower()}\0{normalized}"
+            else:
+                dedupe_text = f"\0{file_content}"
+            digest = hashlib.sha1(dedupe_text.encode('utf-8', 'surrogatepass')).hexdigest()
+            if digest in first_path_by_hash:
+                copies[first_path_by_hash[digest]].append(file_path)
+                continue
+            first_path_by_hash[digest] = file_path
+            copies[file_path] = []
+            # Encode each file once: the truncated text and its token count are
+            # reused for the cache key, batch packing and the prompt
+            truncated, token_count = truncate_counted(file_content, _MAX_FILE_TOKENS)
+            cached = self._cached_response(self._semantic_cache_key(file_path, truncated))
+            if cached is not None:
+                ready[file_path] = cached
+            else:
+                pending.append({**file_data, 'file_content': truncated, 'token_count': token_count})
+
+        # Copies of cached files are complete already
+        for file_path, others in copies.items():
+            if file_path in ready:
+                ready.update({other: ready[file_path] for other in others})
+        return ready, pending, copies
+
+    def _pack_batch(self, files: List[Dict]) -> List[List[Dict]]:
+        """
+        Greedily group (already truncated) files into batches whose combined
+        content plus the batch system prompt stays within
+        ``settings.summary_batch_max_tokens`` and which hold at most
+        ``settings.summary_batch_max_files`` files. Sizes come from each
+        file's precomputed ``token_count`` when present.
+        """
+        prompt_tokens = count_prompt_tokens(_BATCH_SYSTEM_PROMPT)
+        batches: List[List[Dict]] = []
+        current: List[Dict] = []
+        current_tokens = prompt_tokens
+        for file_data in files:
+            size = file_data.get('token_count')
+            if size is None:
+                size = count_tokens(file_data.get('file_content', ''))
+            if current and (
+                current_tokens + size > settings.summary_batch_max_tokens
+                or len(current) >= settings.summary_batch_max_files
+            ):
+                batches.append(current)
+                current, current_tokens = [], prompt_tokens
+            current.append(file_data)
+            current_tokens += size
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _asummarize_batch(self, batch: List[Dict]) -> Dict[str, str]:
+        """
+        Summarize a batch of files with a single LLM call returning JSON.
+        Files missing from the reply fall back to individual calls.
+        """
+        if len(batch) == 1:
+            return await self._asummarize_single(batch[0])
+
+        logger.info(f"Summarizing batch of {len(batch)} files", emoji='FILE')
+        try:
+            reply = await self._acall_llm(
+                self._build_batch_messages(batch),
+                max_tokens=200 * len(batch),
+                temperature=0.3,
+                response_format={"type": "json_object"},
+            )
+        except Exception as exc:
+            logger.warning(f"Batch summary failed, falling back to per-file calls: {exc}")
+            reply = None
+
+        summaries, missing = await asyncio.to_thread(self._store_batch_reply, batch, reply)
+        for file_data in missing:
+            summaries.update(await self._asummarize_single(file_data))
+        return summaries
+
+    def _store_batch_reply(self, batch: List[Dict], reply: Optional[str]) -> Tuple[Dict[str, str], List[Dict]]:
+        """
+        Parse a batch reply and cache each summary found in it.
+
+        Returns:
+            (summaries by path, files missing from the reply)
+        """
+        parsed = self._parse_json_object(reply) or {}
+        summaries: Dict[str, str] = {}
+        missing: List[Dict] = []
+        for file_data in batch:
+            file_path = file_data.get('file_path', 'unknown')
+            summary = parsed.get(file_path)
+            if isinstance(summary, str) and summary.strip():
+                summary = summary.strip().replace('\n', ' ')
+                summaries[file_path] = summary
+                semantic_key = self._semantic_cache_key(file_path, file_data.get('file_content', ''))
+                if semantic_key is not None:
+                    llm_cache.set(semantic_key, summary)
+            else:
+                missing.append(file_data)
+        return summaries, missing
+
+    async def _asummarize_single(self, file_data: Dict) -> Dict[str, str]:
+        """Summarize one file via aprocess, logging (not raising) failures."""
+        try:
+            result = await self.arun(file_data)
+            return {result['file_path']: result['summary']}
+        except Exception as exc:
+            logger.error(f"Failed to summarize {file_data.get('file_path', 'unknown')}: {exc}")
+            return {}
+
+    def _build_batch_messages(self, batch: List[Dict]) -> List[Dict[str, str]]:
+        """Build the chat messages for summarizing several (already truncated) files in one call."""
+        files_block = '\n\n'.join(
+            f"### {f.get('file_path', 'unknown')}\n"
+            f"```\n{f.get('file_content', '')}\n```"
+            for f in batch
+        )
+        return [
+            {
+                "role": "system",
+                "content": self._prompt_content(_BATCH_SYSTEM_PROMPT),
+            },
+            {
+                "role": "user",
+                "content": f"Summarize each file.\n\n{files_block}",
+            },
+        ]
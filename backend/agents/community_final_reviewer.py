@@ -144,7 +144,7 @@ class CommunityFinalReviewerAgent(BaseAgent):
                 stripped = line.strip()
                 if stripped and stripped[0].isdigit() and '.' in stripped[:5]:
                     break
-                if stripped and (stripped.startswith('-') or stripped.startswith('•')):
+                if stripped and stripped.startswith(('-', '•')):
                     item = stripped.lstrip('-• ')
                     if item:
                         items.append(item)
@@ -1,15 +1,79 @@
 """Final Reviewer Agent - Reviews the complete combined README and approves or requests a full redo"""
 import re
-from typing import Dict, Any, List
+from dataclasses import dataclass, field
+from itertools import chain
+from typing import Dict, Any, List, Optional, Tuple
 from backend.agents.base_agent import BaseAgent
 from backend.config import settings
 from backend.logger import logger
+from backend.tokens import count_tokens
+
+# Parsing patterns, compiled once at import
+_SCORE_PATTERNS = [
+    re.compile(r'(\d{1,3})\s*/\s*100'),
+    re.compile(r'[Ss]core[:\s]+(\d{1,3})'),
+    re.compile(r'(\d{1,3})\s+out of 100'),
+    re.compile(r':\s*(\d{1,3})'),
+]
+_APPROVE_RE = re.compile(r'\bAPPROVED?\b')
+_REJECT_RE = re.compile(r'\bREJECT\b')
+# A digit followed by a '.' within the first five characters, e.g. "3. ISSUES"
+_SECTION_NUM_RE = re.compile(r'\d.{0,3}\.')
+# Review section headings: an upper-cased line that starts with a section
+# keyword, optionally after Markdown markup, a number ("3.") or "FINAL"
+_SECTION_HEADING_RE = re.compile(
+    r'[#*_\s]*(?:\d.{0,3}\.)?[#*_\s]*(?:FINAL\s+)?'
+    r'(COMPLETENESS|ACCURACY|ISSUES|IMPROVEMENT|VERDICT)'
+)
+# Line starts that mark an item in a review list
+_LIST_ITEM_PREFIXES = ('-', '•')
+
+
+def _index_sections(lines: List[str], upper_lines: List[str]) -> Dict[str, List[List[str]]]:
+    """
+    Split a review into sections in a single pass over its lines.
+
+    A heading line (see _SECTION_HEADING_RE) opens a new section, and any
+    other numbered line such as "4. Other notes" closes it; lines that merely
+    mention a keyword ("Several accuracy problems remain:") stay in the
+    current section. Each keyword maps to its segments in order of
+    appearance, each segment starting with its heading line.
+    """
+    sections: Dict[str, List[List[str]]] = {}
+    current = None
+    for line, upper_line in zip(lines, upper_lines):
+        heading = _SECTION_HEADING_RE.match(upper_line)
+        if heading:
+            current = [line]
+            sections.setdefault(heading.group(1), []).append(current)
+        elif _SECTION_NUM_RE.match(line.strip()):
+            current = None
+        elif current is not None:
+            current.append(line)
+    return sections
+
+
+@dataclass
+class _ParsedReview:
+    """Review text split, upper-cased and indexed once, shared by every parser."""
+    text: str
+    upper: str = field(init=False)
+    lines: List[str] = field(init=False)
+    upper_lines: List[str] = field(init=False)
+    sections: Dict[str, List[List[str]]] = field(init=False)
+
+    def __post_init__(self):
+        self.upper = self.text.upper()
+        self.lines = self.text.split('\n')
+        self.upper_lines = self.upper.split('\n')
+        self.sections = _index_sections(self.lines, self.upper_lines)
 
 
 class FinalReviewerAgent(BaseAgent):
     """
     Reviews the assembled README as a whole.
-    Uses the thinking model for thorough validation.
+    Uses the thinking model for thorough validation; small READMEs get a
+    lite-model first pass that is only escalated when it is not a clear approval.
     On rejection, provides improvement details so the section-writing cycle
     can be restarted (up to 3 full cycles total).
     """
@@ -48,51 +112,62 @@ class FinalReviewerAgent(BaseAgent):
             logger.error("Empty README content provided for final review")
             return self._rejection_result("README content is empty")
 
-        prompt = (
-            f'You are conducting a final quality review of a generated README for "{repo_name}".\n\n'
-            f'CODEBASE CONTEXT\n'
-            f'{codebase_summary}\n\n'
-            f'GENERATED README:\n'
+        # Codebase context first (shared with the other agents), then the static
+        # rubric, then the README under review — so the longest possible prefix
+        # can be served from the provider's prompt cache.
+        system_prompt = (
+            "You are a senior documentation reviewer with expertise in technical writing "
+            "and software documentation standards. Be thorough but avoid unnecessary restarts.\n\n"
+            "You conduct final quality reviews of generated READMEs. "
+            "Validate each README thoroughly:\n\n"
+            "1. COMPLETENESS CHECK (0-100):\n"
+            "   - Are all essential sections present?\n"
+            "   - Is technical information comprehensive?\n"
+            "   - Are usage examples provided?\n"
+            "   - Is setup/installation covered?\n\n"
+            "2. ACCURACY CHECK (0-100):\n"
+            "   - Does content match the codebase?\n"
+            "   - Are technical details correct?\n"
+            "   - Are features accurately described?\n\n"
+            "3. ISSUES FOUND:\n"
+            "   - List any problems, inaccuracies, or missing critical information.\n\n"
+            "4. IMPROVEMENT DETAILS (only if rejecting):\n"
+            "   - Very specific, actionable notes for the next documentation cycle.\n"
+            "   - Focus only on critical missing/incorrect content.\n\n"
+            "5. FINAL VERDICT:\n"
+            "   - APPROVE or REJECT with clear reasoning.\n"
+            "   - Only REJECT if there are critical issues that significantly "
+            "undermine the usefulness of the README.\n\n"
+            "Return ONLY a JSON object of the form:\n"
+            '{"approved": bool, "completeness": int, "accuracy": int, '
+            '"issues": [str], "improvement_details": str, "verdict": str}\n'
+            'where "improvement_details" is empty when approving and "verdict" '
+            "is your reasoning."
+        )
+        readme_block = (
+            f'GENERATED README for "{repo_name}":\n'
             f'{readme_content}\n\n'
-            f'Please validate the README thoroughly:\n\n'
-            f'1. COMPLETENESS CHECK (0-100):\n'
-            f'   - Are all essential sections present?\n'
-            f'   - Is technical information comprehensive?\n'
-            f'   - Are usage examples provided?\n'
-            f'   - Is setup/installation covered?\n\n'
-            f'2. ACCURACY CHECK (0-100):\n'
-            f'   - Does content match the codebase?\n'
-            f'   - Are technical details correct?\n'
-            f'   - Are features accurately described?\n\n'
-            f'3. ISSUES FOUND:\n'
-            f'   - List any problems, inaccuracies, or missing critical information.\n\n'
-            f'4. IMPROVEMENT DETAILS (only if rejecting):\n'
-            f'   - Very specific, actionable notes for the next documentation cycle.\n'
-            f'   - Focus only on critical missing/incorrect content.\n\n'
-            f'5. FINAL VERDICT:\n'
-            f'   - APPROVE or REJECT with clear reasoning.\n'
-            f'   - Only REJECT if there are critical issues that significantly '
-            f'undermine the usefulness of the README.'
+            f'Please validate this README following the review structure above.'
         )
 
         messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You are a senior documentation reviewer with expertise in technical writing "
-                    "and software documentation standards. Be thorough but avoid unnecessary restarts."
-                ),
-            },
-            {"role": "user", "content": prompt},
+            self._codebase_context_message(codebase_summary),
+            {"role": "system", "content": self._prompt_content(system_prompt)},
+            {"role": "user", "content": readme_block},
         ]
 
-        review = self._call_llm(messages, max_tokens=2048)
-
-        approved = self._extract_approval(review)
-        completeness = self._extract_score(review, 'COMPLETENESS')
-        accuracy = self._extract_score(review, 'ACCURACY')
-        issues = self._extract_list(review, 'ISSUES')
-        improvement_details = '' if approved else self._extract_improvement_details(review)
+        # Cheap first pass for small READMEs; escalate only when it is not a clear approval
+        verdict = None
+        if (settings.final_review_cascade
+                and count_tokens(readme_content) <= settings.final_review_cascade_max_tokens):
+            verdict = self._review(messages, settings.model_flash_lite)
+            approved, completeness, accuracy = verdict[:3]
+            if not approved or min(completeness, accuracy) < settings.final_review_min_score:
+                logger.info(f"Escalating final review to {self.model}", emoji='REVIEW')
+                verdict = None
+        if verdict is None:
+            verdict = self._review(messages, self.model)
+        approved, completeness, accuracy, issues, improvement_details, review = verdict
 
         overall = (completeness + accuracy) / 2
 
@@ -110,98 +185,136 @@ class FinalReviewerAgent(BaseAgent):
             'final_verdict': review,
         }
 
+    def _review(self, messages: list, model: str) -> Tuple[bool, int, int, List[str], str, str]:
+        """
+        Run one review with ``model``.
+
+        Returns:
+            (approved, completeness, accuracy, issues, improvement_details, review)
+        """
+        # temperature=0 keeps the verdict deterministic (and response-cacheable);
+        # streamed so the review shows up in the logs while it is generated
+        review = ''.join(self._call_llm_stream(
+            messages, max_tokens=2048, temperature=0,
+            response_format={"type": "json_object"}, model=model
+        ))
+
+        data = self._parse_json_review(review)
+        if data is not None:
+            approved, completeness, accuracy, issues, improvement_details = data
+        else:
+            # Free-form reply — fall back to the prose parsers
+            logger.warning("Final review was not valid JSON, parsing as text")
+            parsed = _ParsedReview(review)
+            approved = self._extract_approval(parsed)
+            completeness = self._extract_score(parsed, 'COMPLETENESS')
+            accuracy = self._extract_score(parsed, 'ACCURACY')
+            issues = self._extract_list(parsed, 'ISSUES')
+            improvement_details = '' if approved else self._extract_improvement_details(parsed)
+        return approved, completeness, accuracy, issues, improvement_details, review
+
     # ------------------------------------------------------------------
     # Parsing helpers
     # ------------------------------------------------------------------
 
-    def _extract_approval(self, review: str) -> bool:
+    def _parse_json_review(self, review: str) -> Optional[Tuple[bool, int, int, List[str], str]]:
+        """
+        Read (approved, completeness, accuracy, issues, improvement_details)
+        from a JSON review. Returns None if the reply is not usable JSON.
+        """
+        data = self._parse_json_object(review)
+        if data is None or not isinstance(data.get('approved'), bool):
+            return None
+        try:
+            completeness = min(100, max(0, int(data.get('completeness', 0))))
+            accuracy = min(100, max(0, int(data.get('accuracy', 0))))
+        except (TypeError, ValueError):
+            return None
+        raw_issues = data.get('issues') or []
+        if isinstance(raw_issues, str):
+            raw_issues = [raw_issues]
+        issues = [str(item) for item in raw_issues][:15]
+        improvement_details = '' if data['approved'] else str(data.get('improvement_details') or '')
+        if not data['approved'] and not improvement_details:
+            improvement_details = '\n'.join(issues)
+        return data['approved'], completeness, accuracy, issues, improvement_details
+
+    def _extract_approval(self, parsed: _ParsedReview) -> bool:
         """Extract final approval decision."""
-        upper = review.upper()
+        upper = parsed.upper
 
         # Check VERDICT section first
         if 'VERDICT' in upper:
-            verdict_part = upper.split('VERDICT')[1][:300]
-            verdict_reject = bool(re.search(r'\bREJECT\b', verdict_part))
-            verdict_approve = bool(re.search(r'\bAPPROVED?\b', verdict_part))
+            verdict_part = upper.split('VERDICT', 2)[1][:300]
+            verdict_reject = bool(_REJECT_RE.search(verdict_part))
+            verdict_approve = bool(_APPROVE_RE.search(verdict_part))
             if verdict_approve and not verdict_reject:
                 return True
             if verdict_reject:
                 return False
 
-        has_approval = bool(re.search(r'\bAPPROVED?\b', upper))
-        has_rejection = bool(re.search(r'\bREJECT\b', upper))
+        has_approval = bool(_APPROVE_RE.search(upper))
+        has_rejection = bool(_REJECT_RE.search(upper))
 
         if has_approval and not has_rejection:
             return True
         return False
 
-    def _extract_score(self, review: str, category: str) -> int:
-        """Extract numeric score for a category section."""
-        lines = review.split('\n')
-        for i, line in enumerate(lines):
-            if category.upper() in line.upper():
-                search_text = '\n'.join(lines[i: i + 5])
-                patterns = [
-                    r'(\d{1,3})\s*/\s*100',
-                    r'[Ss]core[:\s]+(\d{1,3})',
-                    r'(\d{1,3})\s+out of 100',
-                    r':\s*(\d{1,3})',
-                ]
-                for pattern in patterns:
-                    match = re.search(pattern, search_text)
-                    if match:
-                        return min(100, max(0, int(match.group(1))))
-        return 75 if self._extract_approval(review) else 60
-
-    def _extract_list(self, review: str, section_name: str) -> List[str]:
+    def _extract_score(self, parsed: _ParsedReview, category: str) -> int:
+        """
+        Extract numeric score from the heading and first lines of a category
+        section, or else from any line naming the category (bullet items such
+        as "- Completeness: 85/100" never open a section).
+        """
+        category = category.upper()
+        search_texts = chain(
+            ('\n'.join(segment[:5]) for segment in parsed.sections.get(category, [])),
+            (
+                '\n'.join(parsed.lines[i: i + 5])
+                for i, upper_line in enumerate(parsed.upper_lines) if category in upper_line
+            ),
+        )
+        for search_text in search_texts:
+            for pattern in _SCORE_PATTERNS:
+                match = pattern.search(search_text)
+                if match:
+                    return min(100, max(0, int(match.group(1))))
+        return 75 if self._extract_approval(parsed) else 60
+
+    def _extract_list(self, parsed: _ParsedReview, section_name: str) -> List[str]:
         """Extract bullet-point items from a named section."""
+        segments = parsed.sections.get(section_name.upper())
+        if not segments:
+            return []
+
         items: List[str] = []
-        lines = review.split('\n')
-        in_section = False
-
-        for line in lines:
-            if section_name.upper() in line.upper():
-                in_section = True
-                continue
-            if in_section:
-                stripped = line.strip()
-                # Stop at next numbered section
-                if stripped and stripped[0].isdigit() and '.' in stripped[:5]:
-                    break
-                if stripped and (
-                    stripped.startswith('-')
-                    or stripped.startswith('•')
-                    or (stripped[0].isdigit() and '.' in stripped[:3])
-                ):
-                    item = stripped.lstrip('-•0123456789. ')
-                    if item:
-                        items.append(item)
+        for line in segments[0][1:]:
+            stripped = line.strip()
+            if stripped and (
+                stripped.startswith(_LIST_ITEM_PREFIXES)
+                or (stripped[0].isdigit() and '.' in stripped[:3])
+            ):
+                item = stripped.lstrip('-•0123456789. ')
+                if item:
+                    items.append(item)
 
         return items[:15]
 
-    def _extract_improvement_details(self, review: str) -> str:
+    def _extract_improvement_details(self, parsed: _ParsedReview) -> str:
         """Extract improvement details for the next documentation cycle."""
-        lines = review.split('\n')
-        in_section = False
+        segments = parsed.sections.get('IMPROVEMENT')
         details: List[str] = []
-
-        for line in lines:
-            upper_line = line.upper()
-            if 'IMPROVEMENT' in upper_line or ('DETAIL' in upper_line and in_section):
-                in_section = True
-                continue
-            if in_section:
+        if segments:
+            for line in segments[0][1:]:
                 stripped = line.strip()
-                # Stop at next numbered section
-                if stripped and stripped[0].isdigit() and '.' in stripped[:5]:
-                    break
-                if stripped:
+                # Skip sub-headings such as "Details:"
+                if stripped and 'DETAIL' not in stripped.upper():
                     details.append(stripped)
 
         if details:
             return '\n'.join(details)
         # Fallback: include the full issues list
-        return '\n'.join(self._extract_list(review, 'ISSUES'))
+        return '\n'.join(self._extract_list(parsed, 'ISSUES'))
 
     def _rejection_result(self, reason: str) -> Dict[str, Any]:
         """Return a structured rejection result."""
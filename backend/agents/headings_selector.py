@@ -1,5 +1,5 @@
 """Agent 2: Headings Selector - Decides which documentation headings to include → headings.txt"""
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Union
 from backend.agents.base_agent import BaseAgent
 from backend.config import settings
 from backend.logger import logger
@@ -40,6 +40,38 @@ CANDIDATE_HEADINGS: List[str] = [
     "Acknowledgments",
 ]
 
+# Prompt fragment listing the candidates, built once
+_CANDIDATE_LIST_TEXT = '\n'.join(f"- {h}" for h in CANDIDATE_HEADINGS)
+
+# Bullet, numbering and whitespace characters stripped from the start of each reply line
+_BULLET_CHARS = '-•* 0123456789.\t'
+
+# Static system prompt (identical on every call, so providers can cache it)
+_SYSTEM_PROMPT = (
+    'You are a documentation architect. '
+    'Select the most relevant README sections for the given project.\n\n'
+    'You are given a concise summary of every file in a codebase (CODEBASE CONTEXT) '
+    'and the repository name, and must decide which documentation sections to include '
+    'in its README.\n\n'
+    f'Here are candidate headings:\n{_CANDIDATE_LIST_TEXT}\n\n'
+    'Rules:\n'
+    '1. Select between 8 and 14 headings (14 is the maximum). Include all headings that '
+    'are clearly and directly supported by the codebase summary. Aim for comprehensive '
+    'coverage — do not omit important sections just to keep the list short. '
+    'If more than 14 headings are supported, select the 14 most important ones.\n'
+    '2. NEVER include a heading unless the codebase summary explicitly evidences it '
+    '(e.g., "Dataset & Training Details" ONLY if ML/DL code is present, '
+    '"API Endpoints" ONLY if there are route definitions, '
+    '"Deployment" ONLY if deploy config/scripts exist).\n'
+    '3. Do NOT suggest additional headings beyond the candidate list.\n'
+    '4. Return headings in a logical documentation order: overview/description first, '
+    'then features/highlights, then tech stack/dependencies, then setup/installation, '
+    'then usage/API, then contributing/license/acknowledgments at the end. '
+    'NEVER put Tech Stack or Dependencies before Features.\n'
+    '5. Return ONLY the list of selected headings, one per line, nothing else. '
+    'No numbering, no bullets, no explanations.'
+)
+
 
 class HeadingsSelectorAgent(BaseAgent):
     """
@@ -58,68 +90,62 @@ class HeadingsSelectorAgent(BaseAgent):
             input_data: {
                 'codebase_summary': str,  # content of codebase.txt
                 'repo_name': str,
+                'need_txt': bool (optional, default True),
             }
 
         Returns:
             {
                 'headings': List[str],
-                'headings_txt': str,    # newline-separated for saving
+                'headings_txt': str,    # newline-separated for saving; '' unless need_txt
             }
         """
+        raw = self._call_llm(self._build_messages(input_data), max_tokens=512, temperature=0.3)
+        return self._parse_headings(input_data, raw)
+
+    async def aprocess(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Async variant of process() using the async LLM client."""
+        raw = await self._acall_llm(self._build_messages(input_data), max_tokens=512, temperature=0.3)
+        return self._parse_headings(input_data, raw)
+
+    def _build_messages(self, input_data: Dict[str, Any]) -> list:
+        """Build the chat messages for one selection (see process() for input_data)."""
         codebase_summary = input_data.get('codebase_summary', '')
         repo_name = input_data.get('repo_name', 'Unknown Repository')
 
         logger.workflow_step("Headings Selection", f"Selecting headings for {repo_name}")
 
-        candidate_list = '\n'.join(f"- {h}" for h in CANDIDATE_HEADINGS)
-
-        prompt = (
-            f'You are deciding which documentation sections to include in a README for the '
-            f'repository "{repo_name}".\n\n'
-            f'Below is a concise summary of every file in the codebase:\n'
-            f'{codebase_summary}\n\n'
-            f'Here are candidate headings:\n{candidate_list}\n\n'
-            f'Rules:\n'
-            f'1. Select between 8 and 14 headings (14 is the maximum). Include all headings that '
-            f'are clearly and directly supported by the codebase above. Aim for comprehensive '
-            f'coverage — do not omit important sections just to keep the list short. '
-            f'If more than 14 headings are supported, select the 14 most important ones.\n'
-            f'2. NEVER include a heading unless the codebase summary explicitly evidences it '
-            f'(e.g., "Dataset & Training Details" ONLY if ML/DL code is present, '
-            f'"API Endpoints" ONLY if there are route definitions, '
-            f'"Deployment" ONLY if deploy config/scripts exist).\n'
-            f'3. Do NOT suggest additional headings beyond the candidate list.\n'
-            f'4. Return headings in a logical documentation order: overview/description first, '
-            f'then features/highlights, then tech stack/dependencies, then setup/installation, '
-            f'then usage/API, then contributing/license/acknowledgments at the end. '
-            f'NEVER put Tech Stack or Dependencies before Features.\n'
-            f'5. Return ONLY the list of selected headings, one per line, nothing else. '
-            f'No numbering, no bullets, no explanations.'
-        )
-
+        # The codebase summary leads (shared with the other agents), then the static
+        # instructions and candidates; only the repository name varies per call
         messages = [
+            self._codebase_context_message(codebase_summary),
+            {"role": "system", "content": self._prompt_content(_SYSTEM_PROMPT)},
             {
-                "role": "system",
-                "content": (
-                    "You are a documentation architect. "
-                    "Select the most relevant README sections for the given project."
-                ),
+                "role": "user",
+                "content": f'Select the README headings for the repository "{repo_name}".',
             },
-            {"role": "user", "content": prompt},
         ]
+        return messages
 
-        raw = self._call_llm(messages, max_tokens=512, temperature=0.3)
+    def _parse_headings(self, input_data: Dict[str, Any], raw: str) -> Dict[str, Any]:
+        """Turn the one-heading-per-line reply into the result process() returns."""
+        repo_name = input_data.get('repo_name', 'Unknown Repository')
+        if not raw or not raw.strip():
+            logger.warning(f"Headings selector returned an empty reply for {repo_name}")
+            return {'headings': [], 'headings_txt': ''}
 
         # Parse headings — one per line, strip whitespace / bullet chars; deduplicate
-        headings: List[str] = []
-        seen: set = set()
+        # case-insensitively, keeping the first spelling in first-seen order
+        # (ASCII headings are keyed by their lower-cased bytes, which hash cheaper)
+        unique: Dict[Union[bytes, str], str] = {}
         for line in raw.strip().split('\n'):
-            heading = line.strip().lstrip('-•* 0123456789.')
-            if heading and heading.lower() not in seen:
-                headings.append(heading)
-                seen.add(heading.lower())
-
-        headings_txt = '\n'.join(headings)
+            heading = line.strip().lstrip(_BULLET_CHARS)
+            if heading:
+                key = heading.encode('ascii').lower() if heading.isascii() else heading.lower()
+                unique.setdefault(key, heading)
+        headings: List[str] = list(unique.values())
+
+        # Only build the text form for callers that save it
+        headings_txt = '\n'.join(headings) if input_data.get('need_txt', True) else ''
 
         logger.success(f"Selected {len(headings)} headings for {repo_name}")
         logger.info(f"Headings: {headings}")
@@ -0,0 +1,56 @@
+"""Provider Batch API helper: submit many chat completions as one JSONL job"""
+import asyncio
+import time
+from typing import Dict, List
+import orjson
+from backend.agents.llm_client import get_async_client
+from backend.config import settings
+from backend.logger import logger
+
+_ENDPOINT = "/v1/chat/completions"
+
+# Terminal batch states other than "completed"
+_FAILED_STATES = {"failed", "expired", "cancelled", "cancelling"}
+
+
+async def run_batch(requests: List[Dict]) -> Dict[str, str]:
+    """
+    Submit batch request lines ({'custom_id', 'method', 'url', 'body'}), wait for
+    the job to finish and return {custom_id: reply content}.
+    Raises RuntimeError when the job fails or exceeds settings.batch_timeout_seconds.
+    """
+    client = get_async_client()
+    payload = b''.join(orjson.dumps(r) + b'\n' for r in requests)
+
+    input_file = await client.files.create(
+        file=("batch.jsonl", payload), purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=input_file.id, endpoint=_ENDPOINT, completion_window="24h"
+    )
+    logger.info(f"Submitted batch {batch.id} with {len(requests)} request(s)", emoji='API')
+
+    deadline = time.monotonic() + settings.batch_timeout_seconds
+    while batch.status != "completed":
+        if batch.status in _FAILED_STATES:
+            raise RuntimeError(f"Batch {batch.id} ended with status '{batch.status}'")
+        if time.monotonic() > deadline:
+            await client.batches.cancel(batch.id)
+            raise RuntimeError(f"Batch {batch.id} timed out after {settings.batch_timeout_seconds}s")
+        await asyncio.sleep(settings.batch_poll_interval_seconds)
+        batch = await client.batches.retrieve(batch.id)
+
+    output = await client.files.content(batch.output_file_id)
+    results: Dict[str, str] = {}
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        record = orjson.loads(line)
+        response = record.get('response') or {}
+        if response.get('status_code') != 200:
+            logger.warning(f"Batch request '{record.get('custom_id')}' failed: {record.get('error')}")
+            continue
+        results[record['custom_id']] = response['body']['choices'][0]['message']['content']
+
+    logger.success(f"Batch {batch.id} completed: {len(results)}/{len(requests)} replies")
+    return results
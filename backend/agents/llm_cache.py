@@ -0,0 +1,165 @@
+"""Disk-backed exact-match cache for deterministic LLM responses"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional
+import orjson
+from backend.config import settings
+from backend.logger import logger
+
+# Comment syntax by file extension: (line-comment prefixes, has /* */ blocks).
+# Only languages listed here are normalized; in anything else (Markdown, JSON,
+# HTML, text, ...) a leading '#', '*' or '--' is content, not a comment
+_HASH_COMMENTS = (('#',), False)
+_C_COMMENTS = (('//',), True)
+_COMMENT_SYNTAX = {
+    **dict.fromkeys(('.py', '.rb', '.yaml', '.yml', '.sh'), _HASH_COMMENTS),
+    **dict.fromkeys(
+        (
+            '.js', '.ts', '.tsx', '.jsx', '.java', '.c', '.h', '.cpp', '.cs', '.go',
+            '.rs', '.php', '.swift', '.kt', '.scala', '.scss',
+        ),
+        _C_COMMENTS,
+    ),
+    '.css': ((), True),
+}
+# Normalized text shorter than this share of the original (non-blank, stripped)
+# text is not trusted as a cache key: too much was thrown away
+_MIN_NORMALIZED_RATIO = 0.5
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_source(text: str, file_path: str) -> Optional[str]:
+    """
+    Canonicalize source text so that formatting-only edits (re-indentation,
+    blank lines, comment-only lines) map to the same cache key.
+
+    Comment syntax is chosen by the file extension. Returns None when the
+    language is not known, or when the result is empty or much shorter than
+    the original — such text must not be used as a cache key.
+    """
+    syntax = _COMMENT_SYNTAX.get(os.path.splitext(file_path)[1].lower())
+    if syntax is None:
+        return None
+    prefixes, block_comments = syntax
+    lines = []
+    original_chars = 0
+    in_block = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        original_chars += len(stripped)
+        if in_block:
+            if '*/' not in stripped:
+                continue
+            in_block = False
+            stripped = stripped.split('*/', 1)[1].strip()
+        elif block_comments and stripped.startswith('/*'):
+            if '*/' not in stripped[2:]:
+                in_block = True
+                continue
+            stripped = stripped[2:].split('*/', 1)[1].strip()
+        if not stripped or stripped.startswith(prefixes):
+            continue
+        lines.append(_WHITESPACE_RE.sub(' ', stripped))
+    normalized = '\n'.join(lines)
+    if not normalized or len(normalized) < original_chars * _MIN_NORMALIZED_RATIO:
+        return None
+    return normalized
+
+
+class LLMCache:
+    """
+    SQLite-backed response cache keyed by a SHA-256 of the full request
+    (model, messages, max_tokens, temperature).
+
+    The connection is opened lazily on first use; if the database cannot be
+    opened the cache disables itself and every lookup is a miss.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int):
+        self.path = os.path.expanduser(path)
+        self.ttl_seconds = ttl_seconds
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._disabled = False
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: list,
+        max_tokens: int,
+        temperature: float,
+        response_format: Optional[dict] = None,
+    ) -> str:
+        """Hash every request parameter that can change the response."""
+        params = [model, messages, max_tokens, temperature]
+        if response_format is not None:
+            params.append(response_format)
+        return hashlib.sha256(orjson.dumps(params, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._conn is None and not self._disabled:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS responses '
+                    '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+                )
+                conn.commit()
+                self._conn = conn
+            except Exception as e:
+                logger.warning(f"LLM cache unavailable at {self.path}: {e}")
+                self._disabled = True
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for ``key`` or None on miss/expiry."""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute(
+                    'SELECT value, expires_at FROM responses WHERE key = ?', (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"LLM cache read failed: {e}")
+                return None
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at < time.time():
+                # Best effort: a locked database (another worker writing) must
+                # not fail the lookup; set() replaces the row on the next store
+                try:
+                    conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"LLM cache cleanup failed: {e}")
+                return None
+            return value
+
+    def set(self, key: str, value: str):
+        """Store ``value`` under ``key`` for ``ttl_seconds``."""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, value, time.time() + self.ttl_seconds),
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"LLM cache write failed: {e}")
+
+
+# Global cache instance
+llm_cache = LLMCache(settings.llm_cache_path, settings.llm_cache_ttl_seconds)
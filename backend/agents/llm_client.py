@@ -0,0 +1,220 @@
+"""Shared LongCat (OpenAI-compatible) clients used by every agent"""
+import asyncio
+import importlib.util
+import threading
+import time
+import weakref
+from collections import deque
+from functools import lru_cache
+from typing import Deque, Tuple, Union
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+from backend.config import settings
+from backend.logger import logger
+
+# One keep-alive pool shared by all agents
+_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+# Multiplex concurrent requests over HTTP/2 when the optional h2 package is
+# installed (httpx[http2]); httpx falls back to HTTP/1.1 if the server declines
+_HTTP2 = importlib.util.find_spec('h2') is not None
+
+# httpx async connection pools are bound to the event loop that opened them,
+# so async clients are shared per loop rather than per process
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+class RequestSlots:
+    """
+    Counting semaphore shared by threads and by tasks on any event loop, so
+    sync and async LLM requests draw from one budget. Waiters are served in
+    arrival order; a released slot is handed straight to the next waiter.
+    """
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._free = limit
+        self._lock = threading.Lock()
+        # threading.Event for blocked threads, (loop, future) for waiting tasks
+        self._waiters: Deque[Union[threading.Event, Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = deque()
+
+    def acquire(self):
+        """Block the calling thread until a slot is free."""
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()
+
+    async def aacquire(self):
+        """Wait (without blocking the event loop) until a slot is free."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(waiter)
+                    handed_over = False
+                except ValueError:
+                    handed_over = True
+            if handed_over:
+                # The slot was handed to this task as it was cancelled; pass it on
+                self.release()
+            raise
+
+    def release(self):
+        """Return a slot, handing it to the longest-waiting thread or task."""
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, future = waiter
+                try:
+                    loop.call_soon_threadsafe(_wake, future)
+                    return
+                except RuntimeError:
+                    continue  # that waiter's loop is closed; try the next one
+            if self._free >= self._limit:
+                raise ValueError("RequestSlots released too many times")
+            self._free += 1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    async def __aenter__(self):
+        await self.aacquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+def _wake(future: asyncio.Future):
+    # A cancelled waiter releases the slot itself (see RequestSlots.aacquire)
+    if not future.done():
+        future.set_result(None)
+
+
+class TokenBudget:
+    """
+    Tokens-per-minute bucket shared by threads and by tasks on any event loop.
+    It starts full, refills continuously at tokens_per_minute / 60 per second,
+    and callers wait until their request's estimated tokens are available.
+    A budget of 0 tokens per minute is unlimited.
+    """
+
+    def __init__(self, tokens_per_minute: int):
+        self._capacity = float(tokens_per_minute)
+        self._available = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: int) -> float:
+        """Take ``tokens`` if available and return 0, else the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._available = min(
+                self._capacity, self._available + (now - self._updated) * self._capacity / 60
+            )
+            self._updated = now
+            # A request larger than the whole budget waits for a full bucket
+            needed = min(float(tokens), self._capacity)
+            if self._available >= needed:
+                self._available -= needed
+                return 0.0
+            return (needed - self._available) * 60 / self._capacity
+
+    def consume(self, tokens: int):
+        """Block the calling thread until ``tokens`` fit in the budget."""
+        if not self._capacity:
+            return
+        wait = self._reserve(tokens)
+        while wait:
+            time.sleep(wait)
+            wait = self._reserve(tokens)
+
+    async def aconsume(self, tokens: int):
+        """Wait (without blocking the event loop) until ``tokens`` fit in the budget."""
+        if not self._capacity:
+            return
+        wait = self._reserve(tokens)
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self._reserve(tokens)
+
+
+# Process-wide cap on in-flight LLM requests across every agent, job, worker
+# thread and event loop, so concurrent workflows cannot burst past the
+# provider's rate limit together
+_request_slots = RequestSlots(settings.llm_max_concurrency)
+# Process-wide tokens-per-minute budget (prompt plus max_tokens per request)
+_token_budget = TokenBudget(settings.llm_max_tokens_per_minute)
+
+
+@lru_cache(maxsize=1)
+def get_client() -> OpenAI:
+    """Return the process-wide sync client, creating it on first use."""
+    try:
+        client = OpenAI(
+            api_key=settings.longcat_api_key,
+            base_url=settings.longcat_base_url,
+            http_client=DefaultHttpxClient(limits=_LIMITS, http2=_HTTP2),
+        )
+        logger.success("LongCat client initialized")
+        return client
+    except Exception as e:
+        logger.error(f"Failed to initialize LongCat client: {str(e)}", exc_info=True)
+        raise
+
+
+def get_async_client() -> AsyncOpenAI:
+    """Return the async client for the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        try:
+            client = AsyncOpenAI(
+                api_key=settings.longcat_api_key,
+                base_url=settings.longcat_base_url,
+                http_client=DefaultAsyncHttpxClient(limits=_LIMITS, http2=_HTTP2),
+            )
+        except Exception as e:
+            logger.error(f"Failed to initialize async LongCat client: {str(e)}", exc_info=True)
+            raise
+        _async_clients[loop] = client
+        logger.success("Async LongCat client initialized")
+    return client
+
+
+async def aclose_async_client():
+    """Close the running event loop's async client, if one was created."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+def request_slots() -> RequestSlots:
+    """Slots held by LLM requests (sync or async) while they are in flight."""
+    return _request_slots
+
+
+def token_budget() -> TokenBudget:
+    """Tokens-per-minute budget every LLM request (sync or async) draws from."""
+    return _token_budget
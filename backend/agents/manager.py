@@ -1,20 +1,76 @@
 """Manager Agent - Reviews individual README sections and provides actionable feedback"""
 import re
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 from backend.agents.base_agent import BaseAgent
+from backend.agents.llm_cache import LLMCache, llm_cache
 from backend.config import settings
 from backend.logger import logger
+from backend.tokens import truncate
+
+# Static system prompt with the review rubric (identical on every call, so
+# providers can cache it)
+_SYSTEM_PROMPT = (
+    'You are a senior engineering manager reviewing documentation quality. '
+    'Provide thorough, constructive reviews with actionable feedback.\n\n'
+    'You are given a summary of the codebase (CODEBASE CONTEXT) and one section '
+    'of its README.\n\n'
+    'Review the section and provide:\n'
+    '1. QUALITY SCORE (0-100): How good is this section?\n'
+    '2. APPROVAL DECISION: APPROVE or REJECT\n'
+    '3. FEEDBACK: What is good about this section?\n'
+    '4. IMPROVEMENT NOTES (only if rejecting): Specific, actionable improvements needed. '
+    'Be very precise about what is missing, wrong, or needs to change.\n\n'
+    'IMPORTANT: Reject the section if ANY of the following are present:\n'
+    '- Content that is NOT evidenced by the codebase context (hallucination)\n'
+    '- Claims about features, technologies, or files that do not appear in the codebase\n'
+    '- The section body exceeds ~600 words without sufficient detail to justify the length\n'
+    '- The section content is wrapped in a markdown code fence (e.g. ```markdown ... ```)\n'
+    '- Unclosed code blocks (missing closing ```)\n'
+    '- Missing blank lines before or after headings and code blocks\n'
+    '- Incorrect heading levels (e.g. using # instead of ## for a section heading)'
+)
+
+# Review length budget: a base allowance plus one token per
+# _REVIEW_CHARS_PER_TOKEN characters of section content, capped
+_REVIEW_BASE_TOKENS = 400
+_REVIEW_MAX_TOKENS = 1024
+_REVIEW_CHARS_PER_TOKEN = 6
+
+# Section content beyond this many tokens is cut before review
+_MAX_SECTION_TOKENS = 3000
+
+# Parsing patterns, compiled once at import
+_SCORE_PATTERNS = [
+    re.compile(r'(\d{1,3})\s*/\s*100'),
+    re.compile(r'[Ss]core[:\s]+(\d{1,3})'),
+    re.compile(r'(\d{1,3})\s+out of 100'),
+]
+_APPROVE_RE = re.compile(r'\bAPPROVED?\b')
+_REJECT_RE = re.compile(r'\bREJECT\b')
+# A line naming the improvement notes (lines after it, up to the next numbered item, are notes)
+_NOTES_HEADING_RE = re.compile(r'IMPROVEMENT|MISSING|NEEDS', re.IGNORECASE)
+_LINE_RE = re.compile(r'[^\n]+')
+
+# System prompt for reviewing several sections in one call
+_BATCH_SYSTEM_PROMPT = (
+    _SYSTEM_PROMPT + '\n\n'
+    'You may be given several numbered sections. Review each one independently '
+    'and answer with one block per section, in the same order, each block starting '
+    'with a line of the form ===SECTION <number>=== followed by the review above.'
+)
+# Start of one section's block in a batched review reply
+_BATCH_BLOCK_RE = re.compile(r'^\s*=+\s*SECTION\s+(\d+)\s*=+\s*$', re.MULTILINE | re.IGNORECASE)
 
 
 class ManagerAgent(BaseAgent):
     """
     Reviews the quality of a single README section.
-    Uses the thinking model for thorough analysis.
+    Uses the lite model — the rubric is mechanical (score, verdict, notes).
     Returns approve / reject with improvement notes on rejection.
     """
 
     def __init__(self):
-        # Use thinking model for complex review decisions
+        # Section reviews are short and rubric-driven; a non-thinking model suffices
         super().__init__("Manager", settings.model_flash_lite)
 
     def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -44,45 +100,159 @@ class ManagerAgent(BaseAgent):
 
         logger.workflow_step("Manager Review", f"Reviewing '{heading}' section for {repo_name}")
 
+        review_key = self._review_cache_key(input_data)
+        cached = self._cached_response(review_key)
+        if cached is not None:
+            return self._review_result(heading, cached)
+
+        # Codebase context first (shared with the other agents), then the static
+        # rubric, then the section under review — so the longest possible prefix
+        # can be served from the provider's prompt cache
         prompt = (
-            f'You are a senior documentation manager reviewing the "{heading}" section '
-            f'of a README for the repository "{repo_name}".\n\n'
-            f'CODEBASE CONTEXT\n'
-            f'{codebase_summary}\n\n'
-            f'SECTION CONTENT TO REVIEW:\n'
-            f'{section_content}\n\n'
-            f'Review this section and provide:\n'
-            f'1. QUALITY SCORE (0-100): How good is this section?\n'
-            f'2. APPROVAL DECISION: APPROVE or REJECT\n'
-            f'3. FEEDBACK: What is good about this section?\n'
-            f'4. IMPROVEMENT NOTES (only if rejecting): Specific, actionable improvements needed. '
-            f'Be very precise about what is missing, wrong, or needs to change.\n\n'
-            f'IMPORTANT: Reject the section if ANY of the following are present:\n'
-            f'- Content that is NOT evidenced by the codebase context above (hallucination)\n'
-            f'- Claims about features, technologies, or files that do not appear in the codebase\n'
-            f'- The section body exceeds ~600 words without sufficient detail to justify the length\n'
-            f'- The section content is wrapped in a markdown code fence (e.g. ```markdown ... ```)\n'
-            f'- Unclosed code blocks (missing closing ```)\n'
-            f'- Missing blank lines before or after headings and code blocks\n'
-            f'- Incorrect heading levels (e.g. using # instead of ## for a section heading)\n'
+            f'Repository: "{repo_name}"\n\n'
+            f'SECTION TO REVIEW: "{heading}"\n'
+            f'{self._bounded_section(heading, section_content)}'
         )
 
         messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You are a senior engineering manager reviewing documentation quality. "
-                    "Provide thorough, constructive reviews with actionable feedback."
-                ),
-            },
+            self._codebase_context_message(codebase_summary),
+            {"role": "system", "content": self._prompt_content(_SYSTEM_PROMPT)},
             {"role": "user", "content": prompt},
         ]
 
-        review = self._call_llm(messages, max_tokens=1024)
+        review = self._stream_review(messages, self._review_budget(section_content))
+        if review_key is not None and review:
+            llm_cache.set(review_key, review)
 
-        approved = self._extract_approval(review)
-        quality_score = self._extract_quality_score(review)
-        improvement_notes = '' if approved else self._extract_improvement_notes(review)
+        return self._review_result(heading, review)
+
+    def process_batch(self, sections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Review several sections with one LLM call per
+        ``settings.manager_review_batch_size`` sections.
+
+        Args:
+            sections: list of process() inputs; they are expected to share
+                'codebase_summary' and 'repo_name' (the first entry's are used)
+
+        Returns:
+            One process() result per section, in input order. Sections reviewed
+            before with identical inputs reuse the cached review; sections
+            missing from a batched reply are reviewed individually.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(sections)
+        uncached: List[int] = []
+        for i, section in enumerate(sections):
+            cached = self._cached_response(self._review_cache_key(section))
+            if cached is not None:
+                results[i] = self._review_result(section.get('heading', 'Unknown'), cached)
+            else:
+                uncached.append(i)
+
+        size = max(1, settings.manager_review_batch_size)
+        for start in range(0, len(uncached), size):
+            indices = uncached[start:start + size]
+            chunk = [sections[i] for i in indices]
+            reviewed = [self.run(chunk[0])] if len(chunk) == 1 else self._review_chunk(chunk)
+            for i, result in zip(indices, reviewed):
+                results[i] = result
+        return results
+
+    def _review_chunk(self, sections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Review up to settings.manager_review_batch_size sections in a single call."""
+        codebase_summary = sections[0].get('codebase_summary', '')
+        repo_name = sections[0].get('repo_name', 'Unknown Repository')
+        headings = [s.get('heading', 'Unknown') for s in sections]
+
+        logger.workflow_step("Manager Review", f"Reviewing {len(sections)} sections for {repo_name}: {headings}")
+
+        sections_block = '\n\n'.join(
+            f'SECTION {i} TO REVIEW: "{heading}"\n'
+            f'{self._bounded_section(heading, section.get("section_content", ""))}'
+            for i, (heading, section) in enumerate(zip(headings, sections), 1)
+        )
+
+        messages = [
+            self._codebase_context_message(codebase_summary),
+            {"role": "system", "content": self._prompt_content(_BATCH_SYSTEM_PROMPT)},
+            {"role": "user", "content": f'Repository: "{repo_name}"\n\n{sections_block}'},
+        ]
+
+        try:
+            blocks = self._split_batch_reply(self._call_llm(
+                messages,
+                max_tokens=sum(self._review_budget(s.get('section_content', '')) for s in sections),
+            ))
+        except Exception as exc:
+            logger.warning(f"Batched review failed, reviewing sections one by one: {exc}")
+            blocks = {}
+
+        results: List[Dict[str, Any]] = []
+        for i, (heading, section) in enumerate(zip(headings, sections), 1):
+            review = blocks.get(i)
+            if not review:
+                results.append(self.run(section))
+                continue
+            review_key = self._review_cache_key(section)
+            if review_key is not None:
+                llm_cache.set(review_key, review)
+            results.append(self._review_result(heading, review))
+        return results
+
+    def _stream_review(self, messages: list, max_tokens: int) -> str:
+        """
+        Stream a single-section review and stop as soon as it is a settled
+        approval: a complete decision line that approves without rejecting,
+        plus an "N/100" score. The rest of an approving review is not
+        needed, and the parsed result is the same as for the full text.
+        """
+        parts: List[str] = []
+        stream = self._call_llm_stream(messages, max_tokens=max_tokens)
+        try:
+            for chunk in stream:
+                parts.append(chunk)
+                if '\n' in chunk and self._is_settled_approval(''.join(parts)):
+                    logger.info("Approving review complete — stopping stream early", emoji='REVIEW')
+                    break
+        finally:
+            stream.close()
+        return ''.join(parts)
+
+    @staticmethod
+    def _is_settled_approval(partial: str) -> bool:
+        """True if the complete lines of a partial review already fix an approval and its score."""
+        if not _SCORE_PATTERNS[0].search(partial):
+            return False
+        complete = partial[:partial.rfind('\n')].upper()
+        return any(
+            ('DECISION' in line or 'APPROVAL' in line)
+            and _APPROVE_RE.search(line) and not _REJECT_RE.search(line)
+            for line in complete.split('\n')
+        )
+
+    def _review_cache_key(self, section: Dict[str, Any]) -> Optional[str]:
+        """
+        Response-cache key for one section review, shared by single and
+        batched reviews, or None when review caching is disabled.
+        """
+        if not (settings.llm_cache_enabled and settings.enable_review_cache):
+            return None
+        return LLMCache.make_key(
+            self.model,
+            [
+                'review',
+                section.get('heading', 'Unknown'),
+                section.get('section_content', ''),
+                section.get('codebase_summary', ''),
+                section.get('repo_name', 'Unknown Repository'),
+            ],
+            0,
+            0,
+        )
+
+    def _review_result(self, heading: str, review: str) -> Dict[str, Any]:
+        """Parse a review into the process() result, logging the verdict."""
+        approved, quality_score, improvement_notes = self._parse_review(review)
 
         if approved:
             logger.success(f"Manager APPROVED '{heading}' — Score: {quality_score}/100")
@@ -96,53 +266,93 @@ class ManagerAgent(BaseAgent):
             'improvement_notes': improvement_notes,
         }
 
+    @staticmethod
+    def _bounded_section(heading: str, section_content: str) -> str:
+        """Section content cut to _MAX_SECTION_TOKENS, with a marker when truncated."""
+        kept = truncate(section_content, _MAX_SECTION_TOKENS)
+        if len(kept) == len(section_content):
+            return section_content
+        logger.warning(f"Section '{heading}' truncated to {_MAX_SECTION_TOKENS} tokens for review")
+        return f"{kept}\n... [truncated {len(section_content) - len(kept)} chars]"
+
+    @staticmethod
+    def _review_budget(section_content: str) -> int:
+        """max_tokens for reviewing one section, scaled to its length."""
+        return min(_REVIEW_MAX_TOKENS, _REVIEW_BASE_TOKENS + len(section_content) // _REVIEW_CHARS_PER_TOKEN)
+
+    @staticmethod
+    def _split_batch_reply(reply: str) -> Dict[int, str]:
+        """Split a batched review into {section number: review text}."""
+        matches = list(_BATCH_BLOCK_RE.finditer(reply))
+        blocks: Dict[int, str] = {}
+        for match, following in zip(matches, matches[1:] + [None]):
+            end = following.start() if following else len(reply)
+            blocks.setdefault(int(match.group(1)), reply[match.end():end].strip())
+        return blocks
+
     # ------------------------------------------------------------------
     # Parsing helpers
     # ------------------------------------------------------------------
 
-    def _extract_approval(self, review: str) -> bool:
-        """Extract approval decision from review text."""
+    def _parse_review(self, review: str) -> Tuple[bool, int, str]:
+        """
+        Parse (approved, quality_score, improvement_notes) from review text,
+        upper-casing it only once.
+        """
         upper = review.upper()
+        approved = self._extract_approval(review, upper)
+        quality_score = self._extract_quality_score(review, approved)
+        improvement_notes = '' if approved else self._extract_improvement_notes(review)
+        return approved, quality_score, improvement_notes
+
+    def _extract_approval(self, review: str, upper: Optional[str] = None) -> bool:
+        """Extract approval decision from review text (``upper``: review.upper(), if already computed)."""
+        if upper is None:
+            upper = review.upper()
         # Use word-boundary matching to avoid "REJECTION" triggering REJECT
-        has_reject = bool(re.search(r'\bREJECT\b', upper))
-        has_approve = bool(re.search(r'\bAPPROVED?\b', upper))
+        has_reject = bool(_REJECT_RE.search(upper))
+        has_approve = bool(_APPROVE_RE.search(upper))
         # Explicit APPROVE without standalone REJECT
         if has_approve and not has_reject:
             return True
         # Check decision / approval lines
         for line in upper.split('\n'):
             if 'DECISION' in line or 'APPROVAL' in line:
-                line_has_reject = bool(re.search(r'\bREJECT\b', line))
-                line_has_approve = bool(re.search(r'\bAPPROVED?\b', line))
+                line_has_reject = bool(_REJECT_RE.search(line))
+                line_has_approve = bool(_APPROVE_RE.search(line))
                 if line_has_approve and not line_has_reject:
                     return True
         return False
 
-    def _extract_quality_score(self, review: str) -> int:
-        """Extract numeric quality score (0-100) from review text."""
-        patterns = [
-            r'(\d{1,3})\s*/\s*100',
-            r'[Ss]core[:\s]+(\d{1,3})',
-            r'(\d{1,3})\s+out of 100',
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, review)
+    def _extract_quality_score(self, review: str, approved: Optional[bool] = None) -> int:
+        """
+        Extract numeric quality score (0-100) from review text.
+        Falls back to 70/50 depending on ``approved`` (parsed from the review if not given).
+        """
+        for pattern in _SCORE_PATTERNS:
+            match = pattern.search(review)
             if match:
                 return min(100, max(0, int(match.group(1))))
-        return 70 if self._extract_approval(review) else 50
+        if approved is None:
+            approved = self._extract_approval(review)
+        return 70 if approved else 50
 
     def _extract_improvement_notes(self, review: str) -> str:
         """Extract actionable improvement notes from a rejected review."""
-        lines = review.split('\n')
-        in_notes = False
-        notes: list = []
+        if not review:
+            return ''
 
-        for line in lines:
-            upper_line = line.upper()
-            if 'IMPROVEMENT' in upper_line or 'MISSING' in upper_line or 'NEEDS' in upper_line:
-                in_notes = True
-                continue
-            if in_notes:
+        notes: list = []
+        heading = _NOTES_HEADING_RE.search(review)
+        if heading:
+            # Scan lazily from the line after the first notes heading; earlier
+            # lines are never split out or copied
+            line_end = review.find('\n', heading.end())
+            start = len(review) if line_end == -1 else line_end + 1
+            for match in _LINE_RE.finditer(review, start):
+                line = match.group(0)
+                if _NOTES_HEADING_RE.search(line):
+                    continue
                 # Stop at next top-level numbered section
                 stripped = line.strip()
                 if stripped and stripped[0].isdigit() and '.' in stripped[:5]:
@@ -153,4 +363,4 @@ class ManagerAgent(BaseAgent):
         if notes:
             return '\n'.join(notes)
         # Fallback: last 500 chars of review as context
-        return review[-500:].strip()
+        return (review if len(review) <= 500 else review[-500:]).strip()
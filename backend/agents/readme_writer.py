@@ -1,57 +1,51 @@
 """Agent 4: README Writer - Generates comprehensive README.md"""
-from typing import Dict, Any
+import asyncio
+import re
+from collections import Counter
+from typing import Dict, Any, Callable, List, Optional
 from backend.agents.base_agent import BaseAgent
+from backend.agents.section_writer import write_sections
 from backend.config import settings
 from backend.logger import logger
 
+# Markdown header lines
+_HEADER_RE = re.compile(r'^[ \t]*#+(.*)$', re.MULTILINE)
 
-class ReadmeWriterAgent(BaseAgent):
-    """Generates comprehensive README documentation"""
-    
-    def __init__(self):
-        # Use chat model for content generation
-        super().__init__("README Writer", settings.model_flash_chat)
+
+class _HeaderNameTable(dict):
+    """
+    str.translate table keeping alphanumerics, whitespace, '-' and '_' and
+    dropping everything else (emojis, punctuation). Filled in lazily, so each
+    distinct code point is classified once and later lookups stay in C.
+    """
     
-    def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        """
-        Generate README from approved analyses
-        
-        Args:
-            input_data: {
-                'repo_name': str,
-                'code_analyses': List[Dict],
-                'requirements': Dict,
-                'manager_feedback': str (optional)
-            }
-        
-        Returns:
-            {
-                'readme_content': str,
-                'sections': List[str],
-                'word_count': int
-            }
-        """
-        repo_name = input_data.get('repo_name', 'Project')
-        code_analyses = input_data.get('code_analyses', [])
-        requirements = input_data.get('requirements', {})
-        manager_feedback = input_data.get('manager_feedback', '')
-        
-        logger.workflow_step("README Generation", f"Writing documentation for {repo_name}")
-        
-        # Prepare comprehensive context
-        context = self._prepare_context(repo_name, code_analyses, requirements, manager_feedback)
-        
-        # Prepare prompt for README generation
-        prompt = f"""Generate a comprehensive, professional README.md file for a GitHub repository.
+    def __missing__(self, codepoint: int):
+        char = chr(codepoint)
+        kept = char if char.isalnum() or char.isspace() or char in '-_' else None
+        self[codepoint] = kept
+        return kept
 
-{context}
 
-Create a complete README with the following sections:
+_HEADER_NAME_TABLE = _HeaderNameTable()
 
-1. PROJECT TITLE with emoji
-2. BADGES SECTION - Include GitHub badges using shields.io right after the title. Use this exact format (replace OWNER/REPO with the actual repo name):
+# Sections written (in this order) below the title and badge block
+_README_HEADINGS = [
+    "Description",
+    "Features",
+    "Tech Stack",
+    "Architecture",
+    "Project Structure",
+    "Installation",
+    "Usage",
+    "API Documentation",
+    "Configuration",
+    "Contributing",
+    "License",
+    "Acknowledgments",
+]
 
-<p>
+# Repository badges shown right after the title (OWNER/REPO is filled in)
+_BADGES_TEMPLATE = """<p>
   <img src="https://img.shields.io/github/license/OWNER/REPO?style=for-the-badge&color=blue" alt="GitHub License">
   <img src="https://img.shields.io/github/stars/OWNER/REPO?style=for-the-badge&color=yellow" alt="GitHub Stars">
   <img src="https://img.shields.io/github/forks/OWNER/REPO?style=for-the-badge&color=green" alt="GitHub Forks">
@@ -78,49 +72,59 @@ Create a complete README with the following sections:
   <img src="https://img.shields.io/badge/PRs-welcome-brightgreen.svg?style=for-the-badge" alt="PRs Welcome">
   <img src="https://img.shields.io/badge/maintained-yes-green.svg?style=for-the-badge" alt="Maintained">
   <img src="https://img.shields.io/badge/Open%20Source-%E2%9D%A4-red.svg?style=for-the-badge" alt="Open Source">
-</p>
+</p>"""
 
-3. DESCRIPTION - Clear, engaging overview
-4. FEATURES - Key capabilities and highlights
-5. TECH STACK BADGES - Use shields.io badges for all technologies. Format each technology as a badge:
-   <img src="https://img.shields.io/badge/TECHNOLOGY_NAME-COLOR?style=for-the-badge&logo=LOGO_NAME&logoColor=white">
-   Use appropriate colors and logos from simpleicons.org (e.g., Python=3776AB, React=61DAFB, FastAPI=009688, Docker=2496ED, PostgreSQL=4169E1, TypeScript=3178C6, JavaScript=F7DF1E, Node.js=339933, etc.)
-   Group them in <p> tags.  
-6. ARCHITECTURE - System design and patterns
-7. Project Stucture - All the main folders and files.
-8. INSTALLATION/Usage - Setup instructions
-9. API DOCUMENTATION (if applicable)
-10. CONFIGURATION - Environment variables and settings
-11. CONTRIBUTING - Guidelines for contributors
-12. LICENSE - License information
-13. ACKNOWLEDGMENTS - Credits and thanks
 
-Requirements:
-- Use proper Markdown formatting
-- Include emojis where appropriate (🚀 📚 ⚙️ etc.)
-- Be professional and engaging
-- Include code examples where relevant
-- Make it comprehensive and detailed
-- Use tables, lists, and formatting for readability
-- ALWAYS include the shields.io badges section right after the title
-- ALWAYS render the tech stack as badges instead of plain text
-- Never mention the file name or any other irrelevant things only releated to the README content
-
-Generate a README that will make developers excited to use this project!"""
+class ReadmeWriterAgent(BaseAgent):
+    """Generates comprehensive README documentation"""
+    
+    def __init__(self):
+        # Use chat model for content generation
+        super().__init__("README Writer", settings.model_flash_chat)
+    
+    def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Synchronous wrapper around aprocess() for callers without an event
+        loop; code already running on a loop should await arun()/aprocess().
+        """
+        return asyncio.run(self.aprocess(input_data))
+    
+    async def aprocess(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Generate README from approved analyses.
+        Each section is written by its own SectionWriterAgent, concurrently,
+        on the caller's event loop (sharing its LLM client and request slots).
         
-        messages = [
-            {
-                "role": "system",
-                "content": "You are an expert technical writer specializing in GitHub documentation. Create clear, comprehensive, and engaging README files."
-            },
+        Args:
+            input_data: {
+                'repo_name': str,
+                'code_analyses': List[Dict],
+                'requirements': Dict,
+                'manager_feedback': str (optional),
+                'on_section': Callable[[Dict], None] (optional — called with each
+                              {'heading', 'content'} as soon as it is written,
+                              so consumers need not wait for the whole README)
+            }
+        
+        Returns:
             {
-                "role": "user",
-                "content": prompt
+                'readme_content': str,
+                'sections': List[str],
+                'word_count': int
             }
-        ]
+        """
+        repo_name = input_data.get('repo_name', 'Project')
+        code_analyses = input_data.get('code_analyses', [])
+        requirements = input_data.get('requirements', {})
+        manager_feedback = input_data.get('manager_feedback', '')
         
-        # Call LLM to generate README
-        readme_content = self._call_llm(messages, max_tokens=8192)
+        logger.workflow_step("README Generation", f"Writing documentation for {repo_name}")
+        
+        # Prepare comprehensive context (includes any manager feedback)
+        context = self._prepare_context(repo_name, code_analyses, requirements, manager_feedback)
+        
+        sections = await self._fanout_sections(context, repo_name, input_data.get('on_section'))
+        readme_content = '\n\n'.join([self._header(repo_name)] + sections)
         
         # Process the generated README
         result = {
@@ -134,47 +138,48 @@ Generate a README that will make developers excited to use this project!"""
         
         return result
     
+    async def _fanout_sections(
+        self, context: str, repo_name: str, on_section: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> List[str]:
+        """
+        Write every README section in parallel; returns their content in heading order.
+        on_section, if given, receives each section as soon as it is finished.
+        """
+        inputs = [
+            {'heading': heading, 'codebase_summary': context, 'repo_name': repo_name}
+            for heading in _README_HEADINGS
+        ]
+        results = await write_sections(inputs, on_section)
+        return [result['content'] for result in results]
+    
+    def _header(self, repo_name: str) -> str:
+        """Title plus the repository shields.io badge block"""
+        return f"# {repo_name}\n\n" + _BADGES_TEMPLATE.replace('OWNER/REPO', repo_name)
+    
     def _prepare_context(self, repo_name: str, analyses: list, requirements: Dict, feedback: str) -> str:
         """Prepare context for README generation"""
-        context_parts = []
-        
-        context_parts.append(f"Repository Name: {repo_name}")
-        context_parts.append("")
-        
-        # Add technical stack
-        tech_stack = requirements.get('technical_stack', [])
-        if tech_stack:
-            context_parts.append("Technical Stack:")
-            for tech in tech_stack[:15]:
-                context_parts.append(f"- {tech}")
-            context_parts.append("")
-        
-        # Add functional requirements
-        functional = requirements.get('functional_requirements', [])
-        if functional:
-            context_parts.append("Key Features/Capabilities:")
-            for req in functional[:10]:
-                context_parts.append(f"- {req}")
-            context_parts.append("")
-        
-        # Add architecture patterns
-        patterns = requirements.get('architecture_patterns', [])
-        if patterns:
-            context_parts.append("Architecture Patterns:")
-            for pattern in patterns[:5]:
-                context_parts.append(f"- {pattern}")
-            context_parts.append("")
+        context_parts = [f"Repository Name: {repo_name}", ""]
+        
+        # Add technical stack, functional requirements and architecture patterns;
+        # empty lists are skipped entirely
+        requirement_lists = (
+            ("Technical Stack:", requirements.get('technical_stack', []), 15),
+            ("Key Features/Capabilities:", requirements.get('functional_requirements', []), 10),
+            ("Architecture Patterns:", requirements.get('architecture_patterns', []), 5),
+        )
+        for title, items, limit in requirement_lists:
+            if items:
+                context_parts.append(title)
+                context_parts.extend(f"- {item}" for item in items[:limit])
+                context_parts.append("")
         
         # Add code structure overview
         if analyses:
             context_parts.append(f"Project Structure ({len(analyses)} files analyzed):")
-            file_types = {}
-            for analysis in analyses:
-                file_path = analysis.get('file_path', '')
-                ext = file_path.split('.')[-1] if '.' in file_path else 'other'
-                file_types[ext] = file_types.get(ext, 0) + 1
+            paths = (analysis.get('file_path', '') for analysis in analyses)
+            file_types = Counter(path.rpartition('.')[2] if '.' in path else 'other' for path in paths)
             
-            for ext, count in sorted(file_types.items(), key=lambda x: x[1], reverse=True)[:10]:
+            for ext, count in file_types.most_common(10):
                 context_parts.append(f"- .{ext}: {count} files")
             context_parts.append("")
         
@@ -187,19 +192,10 @@ Generate a README that will make developers excited to use this project!"""
         return '\n'.join(context_parts)
     
     def _extract_sections(self, readme: str) -> list:
-        """Extract section headers from README"""
+        """Extract section headers from README (emojis and punctuation removed)"""
         sections = []
-        lines = readme.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            # Look for markdown headers
-            if line.startswith('#'):
-                # Remove # symbols and clean up
-                section = line.lstrip('#').strip()
-                # Remove emojis for clean section names
-                section = ''.join(c for c in section if c.isalnum() or c.isspace() or c in ['-', '_'])
-                if section:
-                    sections.append(section.strip())
-        
+        for match in _HEADER_RE.finditer(readme):
+            section = match.group(1).translate(_HEADER_NAME_TABLE).strip()
+            if section:
+                sections.append(section)
         return sections
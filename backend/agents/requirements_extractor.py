@@ -1,9 +1,24 @@
 """Agent 2: Requirements Extractor - Extracts functional and non-functional requirements"""
+import re
 from typing import Dict, Any, List
 from backend.agents.base_agent import BaseAgent
 from backend.config import settings
 from backend.logger import logger
 
+# Bullet item line (after strip): the bullet/numbering prefix, then the item text
+_BULLET_RE = re.compile(r'[-•*][-•*0-9. ]*(.*)')
+# Numbered line such as "2. ..." or "10. ..." (starts the next major section)
+_NUMBERED_RE = re.compile(r'\d.?\.')
+
+# Section header lines, e.g. "2. NON-FUNCTIONAL REQUIREMENTS:" or "### Technical Stack"
+_SECTION_RE = re.compile(
+    r'^[\s#*]*(?:\d+\.)?[\s*]*(NON-FUNCTIONAL|FUNCTIONAL|TECHNICAL\s+STACK|ARCHITECTURE)',
+    re.IGNORECASE,
+)
+
+# Upper bound on the combined analyses text sent to the LLM
+_MAX_COMBINED_CHARS = 60_000
+
 
 class RequirementsExtractorAgent(BaseAgent):
     """Extracts functional and non-functional requirements from code analysis"""
@@ -89,11 +104,12 @@ Format each section clearly with bullet points."""
         requirements_text = self._call_llm(messages, max_tokens=8192)
         
         # Parse the requirements
+        sections = self._parse_sections(requirements_text)
         result = {
-            'functional_requirements': self._extract_section(requirements_text, 'FUNCTIONAL'),
-            'non_functional_requirements': self._extract_section(requirements_text, 'NON-FUNCTIONAL'),
-            'technical_stack': self._extract_section(requirements_text, 'TECHNICAL STACK'),
-            'architecture_patterns': self._extract_section(requirements_text, 'ARCHITECTURE'),
+            'functional_requirements': sections.get('FUNCTIONAL', []),
+            'non_functional_requirements': sections.get('NON-FUNCTIONAL', []),
+            'technical_stack': sections.get('TECHNICAL STACK', []),
+            'architecture_patterns': sections.get('ARCHITECTURE', []),
             'full_specification': requirements_text
         }
         
@@ -104,45 +120,55 @@ Format each section clearly with bullet points."""
         return result
     
     def _combine_analyses(self, analyses: List[Dict]) -> str:
-        """Combine multiple code analyses into one text"""
+        """Combine multiple code analyses into one text (capped at _MAX_COMBINED_CHARS)"""
         combined = []
-        for analysis in analyses:
+        used = 0
+        for index, analysis in enumerate(analyses):
             file_path = analysis.get('file_path', 'unknown')
             summary = analysis.get('summary', '')
             analysis_text = analysis.get('analysis', '')
             
-            combined.append(f"\nFile: {file_path}")
-            combined.append(f"Summary: {summary}")
-            combined.append(f"Analysis: {analysis_text[:500]}")  # Limit each analysis
+            # Limit each analysis
+            chunk = f"\nFile: {file_path}\nSummary: {summary}\nAnalysis: {analysis_text[:500]}"
+            if used + len(chunk) > _MAX_COMBINED_CHARS:
+                omitted = len(analyses) - index
+                logger.warning(f"Combined analysis capped at {_MAX_COMBINED_CHARS} chars; {omitted} file(s) omitted")
+                combined.append(f"\n... (truncated, {omitted} more files)")
+                break
+            combined.append(chunk)
+            used += len(chunk) + 1
         
         return '\n'.join(combined)
     
-    def _extract_section(self, text: str, section_name: str) -> List[str]:
-        """Extract items from a specific section"""
-        items = []
-        in_section = False
-        lines = text.split('\n')
+    def _parse_sections(self, text: str) -> Dict[str, List[str]]:
+        """
+        Parse the LLM reply in one pass into {section key: items}, where the
+        keys are 'FUNCTIONAL', 'NON-FUNCTIONAL', 'TECHNICAL STACK' and 'ARCHITECTURE'.
+        """
+        sections: Dict[str, List[str]] = {}
+        current = None
         
-        for line in lines:
-            if section_name.upper() in line.upper():
-                in_section = True
+        for line in text.split('\n'):
+            header = _SECTION_RE.match(line)
+            if header:
+                key = ' '.join(header.group(1).upper().split())
+                # Only the first occurrence of a section counts
+                current = None if key in sections else sections.setdefault(key, [])
+                continue
+            
+            if current is None:
                 continue
             
-            if in_section:
-                # Stop at next major section
-                if line.strip() and line.strip()[0].isdigit() and '.' in line[:3]:
-                    break
-                
-                # Extract bullet points or numbered items
-                line = line.strip()
-                if line and (line.startswith('-') or line.startswith('•') or line.startswith('*') or
-                           (line[0].isdigit() and '.' in line[:3])):
-                    # Remove bullet/number prefix
-                    item = line.lstrip('-•*0123456789. ')
-                    if item:
-                        items.append(item)
+            line = line.strip()
+            # Any other numbered line starts the next major section
+            if _NUMBERED_RE.match(line):
+                current = None
+                continue
+            bullet = _BULLET_RE.match(line)
+            if bullet and bullet.group(1) and len(current) < 15:  # Limit to 15 items per section
+                current.append(bullet.group(1))
         
-        return items[:15]  # Limit to 15 items per section
+        return sections
     
     def _empty_requirements(self) -> Dict[str, Any]:
         """Return empty requirements structure"""
@@ -1,6 +1,11 @@
 """Section Writer Agent - Writes a single README section based on codebase context"""
-from typing import Dict, Any
+import asyncio
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from backend.agents.base_agent import BaseAgent
+from backend.agents.llm_cache import LLMCache, llm_cache
 from backend.config import settings
 from backend.logger import logger
 
@@ -16,6 +21,163 @@ MINIMAL_CODE_HEADINGS = {
     "development",
 }
 
+# Badge instruction for tech / dependency sections
+_BADGE_INSTRUCTION = (
+    '\n\nIMPORTANT: Render every technology / package / tool as a shields.io badge '
+    'using this exact format:\n'
+    '<img src="https://img.shields.io/badge/{NAME}-{HEX_COLOR}?style=for-the-badge'
+    '&logo={LOGO_SLUG}&logoColor=white" alt="{NAME}">\n'
+    'Group related badges inside <p> tags. '
+    'Use hex colours from simpleicons.org '
+    '(e.g. Python=3776AB, React=61DAFB, FastAPI=009688, Docker=2496ED, '
+    'PostgreSQL=4169E1, TypeScript=3178C6, Node.js=339933).'
+)
+_TECH_STACK_EXTRA = (
+    ' Also include any critical third-party dependencies or packages as badges '
+    '(e.g. key libraries, frameworks, or tools the project depends on).'
+)
+
+# Minimal-code instruction for quickstart / development / deployment
+_MINIMAL_CODE_INSTRUCTION = (
+    '\n\nIMPORTANT: Keep code examples minimal. '
+    'Show only the essential commands needed to get started. '
+    'Do NOT include exhaustive configuration files, long scripts, or '
+    'step-by-step code blocks. Use short, focused snippets only.'
+)
+
+# Lower-cased heading -> extra prompt instructions for that heading
+_HEADING_INSTRUCTIONS = {
+    **{h: _BADGE_INSTRUCTION for h in BADGE_HEADINGS},
+    **{h: _MINIMAL_CODE_INSTRUCTION for h in MINIMAL_CODE_HEADINGS},
+    'tech stack': _BADGE_INSTRUCTION + _TECH_STACK_EXTRA,
+}
+
+# Headings that only need the parts of the codebase summary mentioning one of
+# these keywords; every other heading gets the full (shared-prefix) summary
+_HEADING_KEYWORDS = {
+    'prerequisites': ('requirements', 'pyproject', 'package.json', 'setup', 'version', 'dockerfile', 'install'),
+    'dependencies & packages': ('requirements', 'pyproject', 'package.json', 'setup', 'dependenc', 'import', 'librar'),
+    'installation': ('requirements', 'pyproject', 'package.json', 'setup', 'install', 'dockerfile', 'makefile', 'script'),
+    'api endpoints': ('route', 'endpoint', 'router', 'api', 'handler', 'request', 'websocket'),
+    'configuration': ('config', 'settings', 'env', '.yml', '.yaml', '.toml', '.ini', 'option'),
+    'environment variables': ('env', 'config', 'settings', 'secret', 'api key', 'token'),
+    'deployment': ('docker', 'deploy', 'compose', 'kubernetes', 'workflow', 'nginx', 'server', 'build'),
+    'security': ('security', 'auth', 'token', 'secret', 'password', 'permission', 'cors', 'sanitiz'),
+    'contributing': ('contribut', 'test', 'lint', 'workflow', 'pre-commit', 'format', 'makefile'),
+    'code of conduct': ('conduct', 'contribut', 'community'),
+    'citation': ('citation', 'cite', 'paper', 'author'),
+    'contact': ('author', 'contact', 'email', 'maintainer'),
+}
+_HEADING_KEYWORD_RES = {
+    heading: re.compile('|'.join(map(re.escape, keywords)), re.IGNORECASE)
+    for heading, keywords in _HEADING_KEYWORDS.items()
+}
+
+# With fewer keyword matches than this, the longest summary lines are added too
+_MIN_RELEVANT_LINES = 5
+_FALLBACK_LINES = 20
+
+# Output token budget per heading: short boilerplate sections need far less than
+# the default, badge-heavy ones (long <img> tags) a little more
+_DEFAULT_MAX_TOKENS = 1500
+_HEADING_MAX_TOKENS = {
+    'acknowledgments': 512,
+    'contact': 512,
+    'citation': 512,
+    'code of conduct': 512,
+    'table of contents': 768,
+    'submodules': 768,
+    'tech stack': 2048,
+    'dependencies & packages': 2048,
+}
+
+# Retries that carry the rejected draft ask for an edit, not a rewrite: the
+# reply is about as long as the draft (~2 tokens per word leaves headroom)
+_EDIT_TOKENS_PER_WORD = 2
+_MIN_EDIT_TOKENS = 512
+
+# First drafts written with a self-check reply in JSON; escaping the markdown
+# and the verdict fields need some room beyond the section's own budget
+_SELF_CHECK_EXTRA_TOKENS = 256
+_SELF_CHECK_INSTRUCTION = (
+    '\n\nAfter writing, review your section as a strict documentation manager would. '
+    'Reject it if it mentions anything not evidenced by the CODEBASE CONTEXT, is wrapped '
+    'in a code fence, has unclosed code blocks, is missing blank lines around headings '
+    'and code blocks, or uses the wrong heading level.\n'
+    'Reply with a JSON object only: {"content": "<the markdown section>", '
+    '"self_approved": true or false, "notes": "<what still needs fixing, empty if approved>"}'
+)
+
+# Sections whose content is fixed, written without an LLM call. The workflow
+# always generates an MIT LICENSE file, so the License section is known upfront.
+_TEMPLATE_SECTIONS = {
+    'license': (
+        '## 📜 License\n\n'
+        'This project is licensed under the **MIT License**. '
+        'See the [LICENSE](LICENSE) file for the full text.'
+    ),
+}
+
+# Lines that matter when trimming a reply to one section: code fences (``` or
+# ~~~, with the rest of the line) and H1/H2 headings, after any indentation
+_TRIM_LINE_RE = re.compile(
+    r'^[^\S\n]*(?:(?P<fence>```|~~~)[^\n]*|#{1,2} [^\n]*\S)', re.MULTILINE
+)
+
+# Static system prompt, shared by every heading
+_SYSTEM_PROMPT = (
+    "You are an expert technical writer. "
+    "Write clear, accurate, and engaging documentation sections "
+    "based on the provided codebase analysis."
+)
+
+
+
+@lru_cache(maxsize=64)
+def _prompt_parts(heading: str) -> Tuple[str, str]:
+    """
+    The heading-dependent user prompt, split around the repository name, built
+    once per heading and reused on every retry and cycle.
+    """
+    # Extra instructions for badge / minimal-code headings
+    heading_instruction = _HEADING_INSTRUCTIONS.get(heading.lower(), '')
+    intro = (
+        f'You are writing the **{heading}** section for the README of the '
+        f'repository "'
+    )
+    instructions = (
+        f'".\n\n'
+        f'The CODEBASE CONTEXT above is a concise summary of every file in the '
+        f'codebase — use it as your ONLY source of truth.\n\n'
+        f'Write ONLY the content for the "{heading}" section. '
+        f'Start directly with the markdown heading (e.g., ## {heading}).\n'
+        f'CRITICAL RULES:\n'
+        f'- ONLY mention things that are explicitly evidenced by the CODEBASE CONTEXT. '
+        f'Do NOT invent, assume, or hallucinate any features, technologies, files, or '
+        f'capabilities that are not directly mentioned in the CODEBASE CONTEXT.\n'
+        f'- Be comprehensive and detailed. Aim for 150–600 words of body text. '
+        f'Include all relevant sub-sections, examples, and details supported by the codebase.\n'
+        f'- Use proper Markdown formatting with emojis where appropriate.\n'
+        f'- Do NOT include any other sections — only "{heading}".'
+        f'{heading_instruction}'
+    )
+    return intro, instructions
+
+
+def _edit_prompt(heading: str, repo_name: str, prior_content: str, improvement_notes: str) -> str:
+    """User prompt asking for a minimal revision of a rejected section draft."""
+    return (
+        f'You previously wrote the **{heading}** section for the README of the '
+        f'repository "{repo_name}". The manager rejected it with these notes:\n\n'
+        f'{improvement_notes}\n\n'
+        f'CURRENT SECTION:\n{prior_content}\n\n'
+        f'Revise the CURRENT SECTION to address ALL of the notes with the smallest '
+        f'possible changes — keep every other line exactly as it is. The CODEBASE '
+        f'CONTEXT above remains your ONLY source of truth.\n'
+        f'Return the complete revised "{heading}" section only, starting with its '
+        f'markdown heading — no commentary and no other sections.'
+    )
+
 
 class SectionWriterAgent(BaseAgent):
     """
@@ -24,9 +186,9 @@ class SectionWriterAgent(BaseAgent):
     """
 
     def __init__(self, heading: str):
-        safe_name = heading.replace(' ', '_').replace('&', 'and')[:40]
         super().__init__(f"Section Writer [{heading}]", settings.model_flash_lite)
         self.heading = heading
+        self.max_tokens = _HEADING_MAX_TOKENS.get(heading.lower(), _DEFAULT_MAX_TOKENS)
 
     def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -38,94 +200,185 @@ class SectionWriterAgent(BaseAgent):
                 'codebase_summary': str,
                 'repo_name': str,
                 'improvement_notes': str   (optional — provided on retries)
+                'prior_content': str       (optional — the rejected draft; with
+                                            improvement_notes, asks for an edit)
+                'self_check': bool         (optional — also review the draft in
+                                            the same call)
+                'temperature': float       (optional, default 0.5)
             }
 
         Returns:
             {
                 'heading': str,
                 'content': str,   # Markdown content for this section
+                'self_approved': bool,    # only with self_check (missing on cache hits)
+                'self_check_notes': str,  # only with self_check
             }
         """
         heading = input_data.get('heading', self.heading)
-        codebase_summary = input_data.get('codebase_summary', '')
-        repo_name = input_data.get('repo_name', 'Unknown Repository')
-        improvement_notes = input_data.get('improvement_notes', '')
-
-        logger.workflow_step("Section Writing", f"Writing '{heading}' for {repo_name}")
-
-        # Build optional improvement block (for retries)
-        improvement_block = ''
-        if improvement_notes:
-            improvement_block = (
-                f'\n\nIMPROVEMENT NOTES FROM MANAGER (address ALL of these):\n'
-                f'{improvement_notes}'
+        if self.is_templated:
+            return self._finish(heading, _TEMPLATE_SECTIONS[heading.lower()])
+        section_key = self._section_cache_key(input_data)
+        cached = self._cached_response(section_key)
+        if cached is not None:
+            return {'heading': heading, 'content': cached}
+        if input_data.get('self_check'):
+            reply = self._call_llm(
+                self._build_messages(input_data),
+                max_tokens=self._max_tokens_for(input_data) + _SELF_CHECK_EXTRA_TOKENS,
+                temperature=input_data.get('temperature', 0.5),
+                response_format={"type": "json_object"},
             )
+            return self._finish_self_checked(heading, reply, section_key)
+        content = self._call_llm(
+            self._build_messages(input_data), max_tokens=self._max_tokens_for(input_data),
+            temperature=input_data.get('temperature', 0.5),
+        )
+        return self._finish(heading, content, section_key)
 
-        # Badge instruction for tech / dependency sections
-        badge_instruction = ''
-        if heading.lower() in BADGE_HEADINGS:
-            extra = (
-                ' Also include any critical third-party dependencies or packages as badges '
-                '(e.g. key libraries, frameworks, or tools the project depends on).'
-                if heading.lower() == 'tech stack'
-                else ''
-            )
-            badge_instruction = (
-                '\n\nIMPORTANT: Render every technology / package / tool as a shields.io badge '
-                'using this exact format:\n'
-                '<img src="https://img.shields.io/badge/{NAME}-{HEX_COLOR}?style=for-the-badge'
-                '&logo={LOGO_SLUG}&logoColor=white" alt="{NAME}">\n'
-                'Group related badges inside <p> tags. '
-                'Use hex colours from simpleicons.org '
-                '(e.g. Python=3776AB, React=61DAFB, FastAPI=009688, Docker=2496ED, '
-                f'PostgreSQL=4169E1, TypeScript=3178C6, Node.js=339933).{extra}'
+    async def aprocess(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Async variant of process() using the async LLM client."""
+        heading = input_data.get('heading', self.heading)
+        if self.is_templated:
+            return self._finish(heading, _TEMPLATE_SECTIONS[heading.lower()])
+        section_key = self._section_cache_key(input_data)
+        cached = self._cached_response(section_key)
+        if cached is not None:
+            return {'heading': heading, 'content': cached}
+        if input_data.get('self_check'):
+            reply = await self._acall_llm(
+                self._build_messages(input_data),
+                max_tokens=self._max_tokens_for(input_data) + _SELF_CHECK_EXTRA_TOKENS,
+                temperature=input_data.get('temperature', 0.5),
+                response_format={"type": "json_object"},
             )
+            return self._finish_self_checked(heading, reply, section_key)
+        content = await self._acall_llm(
+            self._build_messages(input_data), max_tokens=self._max_tokens_for(input_data),
+            temperature=input_data.get('temperature', 0.5),
+        )
+        return self._finish(heading, content, section_key)
 
-        # Minimal-code instruction for quickstart / development / deployment
-        minimal_code_instruction = ''
-        if heading.lower() in MINIMAL_CODE_HEADINGS:
-            minimal_code_instruction = (
-                '\n\nIMPORTANT: Keep code examples minimal. '
-                'Show only the essential commands needed to get started. '
-                'Do NOT include exhaustive configuration files, long scripts, or '
-                'step-by-step code blocks. Use short, focused snippets only.'
-            )
+    @property
+    def is_templated(self) -> bool:
+        """Whether this heading is filled from a fixed template (no LLM call)."""
+        return self.heading.lower() in _TEMPLATE_SECTIONS
 
-        prompt = (
-            f'You are writing the **{heading}** section for the README of the '
-            f'repository "{repo_name}".\n\n'
-            f'Here is a concise summary of every file in the codebase '
-            f'(use this as your ONLY source of truth):\n'
-            f'{codebase_summary}\n\n'
-            f'Write ONLY the content for the "{heading}" section. '
-            f'Start directly with the markdown heading (e.g., ## {heading}).\n'
-            f'CRITICAL RULES:\n'
-            f'- ONLY mention things that are explicitly evidenced by the codebase summary above. '
-            f'Do NOT invent, assume, or hallucinate any features, technologies, files, or '
-            f'capabilities that are not directly mentioned in the codebase summary.\n'
-            f'- Be comprehensive and detailed. Aim for 150–600 words of body text. '
-            f'Include all relevant sub-sections, examples, and details supported by the codebase.\n'
-            f'- Use proper Markdown formatting with emojis where appropriate.\n'
-            f'- Do NOT include any other sections — only "{heading}".'
-            f'{badge_instruction}'
-            f'{minimal_code_instruction}'
-            f'{improvement_block}'
+    def build_batch_request(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """One Batch API request line for this section, keyed by its heading."""
+        body = self._request_kwargs(
+            self._build_messages(input_data), self._max_tokens_for(input_data), 0.5, None, self.model,
         )
+        body.update(body.pop('extra_body', {}))  # SDK-only wrapper; batch bodies are raw JSON
+        return {
+            'custom_id': input_data.get('heading', self.heading),
+            'method': 'POST',
+            'url': '/v1/chat/completions',
+            'body': body,
+        }
+
+    def finish_batch_reply(self, content: str) -> Dict[str, Any]:
+        """Turn a Batch API reply into the same result process() returns."""
+        return self._finish(self.heading, content)
 
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def _build_messages(self, input_data: Dict[str, Any]) -> list:
+        """Build the chat messages for one section (see process() for input_data)."""
+        heading = input_data.get('heading', self.heading)
+        codebase_summary = input_data.get('codebase_summary', '')
+        repo_name = input_data.get('repo_name', 'Unknown Repository')
+        improvement_notes = input_data.get('improvement_notes', '')
+        prior_content = input_data.get('prior_content', '')
+
+        logger.workflow_step("Section Writing", f"Writing '{heading}' for {repo_name}")
+
+        if improvement_notes and prior_content:
+            # Retry with the rejected draft: patch it rather than start over
+            prompt = _edit_prompt(heading, repo_name, prior_content, improvement_notes)
+        else:
+            # Build optional improvement block (for retries)
+            improvement_block = ''
+            if improvement_notes:
+                improvement_block = (
+                    f'\n\nIMPROVEMENT NOTES FROM MANAGER (address ALL of these):\n'
+                    f'{improvement_notes}'
+                )
+
+            intro, instructions = _prompt_parts(heading)
+            prompt = f'{intro}{repo_name}{instructions}{improvement_block}'
+
+        if input_data.get('self_check'):
+            prompt += _SELF_CHECK_INSTRUCTION
+
+        # Codebase context (for most headings) and system prompt are identical for
+        # every heading, so they form a shared prefix; only the user message differs.
         messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You are an expert technical writer. "
-                    "Write clear, accurate, and engaging documentation sections "
-                    "based on the provided codebase analysis."
-                ),
-            },
+            self._codebase_context_message(self._relevant_summary(heading, codebase_summary)),
+            {"role": "system", "content": self._prompt_content(_SYSTEM_PROMPT)},
             {"role": "user", "content": prompt},
         ]
+        return messages
 
-        content = self._call_llm(messages, max_tokens=1500, temperature=0.5)
+    @staticmethod
+    def _relevant_summary(heading: str, codebase_summary: str) -> str:
+        """
+        The codebase summary lines ("path = summary") relevant to a heading.
+        Headings without a keyword filter get the whole summary unchanged.
+        """
+        pattern = _HEADING_KEYWORD_RES.get(heading.lower())
+        if pattern is None:
+            return codebase_summary
+
+        lines = codebase_summary.splitlines()
+        keep = {i for i, line in enumerate(lines) if pattern.search(line)}
+        if len(keep) < _MIN_RELEVANT_LINES:
+            longest = sorted(range(len(lines)), key=lambda i: len(lines[i]), reverse=True)
+            keep.update(longest[:_FALLBACK_LINES])
+        if len(keep) == len(lines):
+            return codebase_summary
+
+        logger.info(f"Using {len(keep)}/{len(lines)} summary lines for '{heading}'")
+        return '\n'.join(lines[i] for i in sorted(keep))
+
+    def _max_tokens_for(self, input_data: Dict[str, Any]) -> int:
+        """Output budget for this call: sized to the draft when editing one."""
+        prior_content = input_data.get('prior_content', '')
+        if not (prior_content and input_data.get('improvement_notes')):
+            return self.max_tokens
+        edit_tokens = _EDIT_TOKENS_PER_WORD * len(prior_content.split())
+        return min(self.max_tokens, max(_MIN_EDIT_TOKENS, edit_tokens))
+
+    def _section_cache_key(self, input_data: Dict[str, Any]) -> Optional[str]:
+        """
+        Response-cache key for this section, or None when section caching is
+        disabled. Rewrites are keyed on their improvement notes and prior draft
+        too, so only a rewrite for exactly the same feedback is reused (e.g.
+        when the same repository is documented again). Calls with an explicit
+        temperature (speculative alternatives) are never cached.
+        """
+        if not (settings.llm_cache_enabled and settings.enable_section_cache):
+            return None
+        if 'temperature' in input_data:
+            return None
+        return LLMCache.make_key(
+            self.model,
+            [
+                'section',
+                input_data.get('heading', self.heading),
+                input_data.get('codebase_summary', ''),
+                input_data.get('repo_name', 'Unknown Repository'),
+                unicodedata.normalize('NFC', input_data.get('improvement_notes', '')),
+                input_data.get('prior_content', ''),
+            ],
+            self._max_tokens_for(input_data),
+            0,
+        )
 
+    def _finish(self, heading: str, content: str, section_key: Optional[str] = None) -> Dict[str, Any]:
+        """Clean up the raw LLM reply into the section result dict (cached under section_key)."""
         # Remove any outer markdown code fence that the LLM may have wrapped the
         # entire response in (e.g. ```markdown … ```).
         content = self._strip_markdown_fence(content.strip())
@@ -136,38 +389,47 @@ class SectionWriterAgent(BaseAgent):
 
         logger.success(f"Wrote section '{heading}' ({len(content.split())} words)")
 
+        if section_key is not None and content.strip():
+            llm_cache.set(section_key, content.strip())
+
         return {
             'heading': heading,
             'content': content.strip(),
         }
 
-    # ------------------------------------------------------------------
-    # Helpers
-    # ------------------------------------------------------------------
+    def _finish_self_checked(self, heading: str, reply: str, section_key: Optional[str]) -> Dict[str, Any]:
+        """
+        Like _finish() for a self-checked reply: the section comes from the JSON
+        "content" field, and the writer's verdict is returned alongside it. A
+        reply that is not the expected JSON is used as the section itself and
+        counts as not approved, so it still goes to the Manager.
+        """
+        data = self._parse_json_object(reply)
+        if data is None or not isinstance(data.get('content'), str):
+            logger.warning(f"Self-checked reply for '{heading}' was not valid JSON, using it as written")
+            return {**self._finish(heading, reply, section_key), 'self_approved': False, 'self_check_notes': ''}
+        result = self._finish(heading, data['content'], section_key)
+        result['self_approved'] = data.get('self_approved') is True and bool(result['content'])
+        result['self_check_notes'] = '' if result['self_approved'] else str(data.get('notes') or '')
+        return result
 
     def _strip_markdown_fence(self, content: str) -> str:
         """
         Remove an outer markdown code fence if the LLM wrapped its entire
         response in one (e.g. ```markdown … ``` or ``` … ```).
         """
-        lines = content.split('\n')
-
-        # Find the first and last non-empty lines
-        start = 0
-        while start < len(lines) and not lines[start].strip():
-            start += 1
-        end = len(lines) - 1
-        while end >= 0 and not lines[end].strip():
-            end -= 1
-
-        if start > end:
+        stripped = content.strip()
+        if not stripped.startswith('```'):
             return content
 
-        first_line = lines[start].strip()
-        last_line = lines[end].strip()
+        # Slice between the opening fence line and the closing one instead of
+        # splitting the whole response into lines
+        first_nl = stripped.find('\n')
+        last_nl = stripped.rfind('\n')
+        last_line = stripped[last_nl + 1:].strip()
 
-        if first_line.startswith('```') and last_line.startswith('```') and not last_line.lstrip('`'):
-            return '\n'.join(lines[start + 1:end])
+        if last_line.startswith('```') and not last_line.lstrip('`'):
+            return stripped[first_nl + 1:last_nl] if first_nl < last_nl else ''
 
         return content
 
@@ -184,38 +446,59 @@ class SectionWriterAgent(BaseAgent):
         Code fences (``` or ~~~) are tracked so that ``#`` characters inside
         code blocks are never mistaken for Markdown headings.
         """
-        lines = content.split('\n')
-        result: list[str] = []
         found_main = False
         in_code_fence = False
 
-        for line in lines:
-            stripped = line.strip()
-
-            # Track code-fence boundaries (``` or ~~~).
-            # Only toggle when the rest of the line after the fence marker is
-            # empty or a simple language identifier (no spaces), so that a line
-            # like "```python # example" inside a code block is NOT treated as
-            # a fence boundary.
-            if stripped.startswith('```') or stripped.startswith('~~~'):
-                fence_char = stripped[0]
-                rest = stripped.lstrip(fence_char).strip()
-                if ' ' not in rest:
+        # Only fence and H1/H2 lines can change the outcome, so scan just those
+        for match in _TRIM_LINE_RE.finditer(content):
+            if match.group('fence'):
+                # Only toggle when the rest of the line after the fence marker is
+                # empty or a simple language identifier (no spaces), so that a line
+                # like "```python # example" inside a code block is NOT treated as
+                # a fence boundary.
+                line = match.group(0).strip()
+                if ' ' not in line.lstrip(line[0]).strip():
                     in_code_fence = not in_code_fence
+            elif not in_code_fence:
+                # Stop at the next H1/H2 — that belongs to a different section
+                if found_main:
+                    return content[:match.start()].strip()
+                found_main = True
 
-            # Only treat a line as a heading when we are NOT inside a code fence
-            is_h1 = not in_code_fence and stripped.startswith('# ')
-            is_h2 = not in_code_fence and stripped.startswith('## ')
-            is_top_heading = is_h1 or is_h2
+        return content.strip()
 
-            if not found_main:
-                result.append(line)
-                if is_top_heading:
-                    found_main = True
-            else:
-                # Stop at the next H1/H2 — that belongs to a different section
-                if is_top_heading:
-                    break
-                result.append(line)
 
-        return '\n'.join(result).strip()
+@lru_cache(maxsize=128)
+def get_section_writer(heading: str) -> SectionWriterAgent:
+    """
+    Shared SectionWriterAgent for a heading. The agents keep no per-call state,
+    so one instance serves every attempt, cycle and job.
+    """
+    return SectionWriterAgent(heading)
+
+
+async def write_sections(
+    inputs: List[Dict[str, Any]],
+    on_section: Optional[Callable[[Dict[str, Any]], None]] = None,
+    sem: Optional[asyncio.Semaphore] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Write several sections concurrently (see SectionWriterAgent.process for the
+    input dicts), all sharing the same codebase-context prefix. At most
+    settings.llm_max_concurrency calls run at once unless a shared semaphore is
+    given. Results come back in input order; on_section, if given, receives each
+    one as soon as it is finished.
+    """
+    sem = sem or asyncio.Semaphore(settings.llm_max_concurrency)
+
+    async def write(input_data: Dict[str, Any]) -> Dict[str, Any]:
+        async with sem:
+            result = await get_section_writer(input_data['heading']).arun(input_data)
+        if on_section is not None:
+            try:
+                on_section(result)
+            except Exception as e:
+                logger.warning(f"on_section callback failed for '{input_data['heading']}': {e}")
+        return result
+
+    return list(await asyncio.gather(*(write(i) for i in inputs)))
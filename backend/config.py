@@ -1,7 +1,7 @@
 """Configuration management for Dr. Document"""
 import os
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -17,25 +17,118 @@ class Settings(BaseSettings):
     model_flash_thinking: str = "LongCat-Flash-Thinking"
     model_flash_thinking_2601: str = "LongCat-Flash-Thinking-2601"
     
+    # Server Configuration
+    # Uvicorn worker processes for `python main.py`. 1 runs the auto-reloading dev
+    # server; more disables reload. Status and result are served by any worker
+    # from the persisted job state (persist_job_state), but a job's WebSocket
+    # updates only come from the worker running it, so /ws needs sticky routing.
+    server_workers: int = 1
+    
+    # Browser origins allowed to call the API (the Vite dev server by default).
+    # Set CORS_ORIGINS as a JSON list, e.g. '["https://docs.example.com"]'.
+    cors_origins: List[str] = ["http://localhost:5173", "http://127.0.0.1:5173"]
+    
+    # Concurrent WebSocket connections; further clients are closed with 1013
+    # (try again later) so per-connection buffers stay within a fixed budget
+    max_ws_connections: int = 1000
+    
     # Storage Configuration
     storage_path: str = "./backend/storage"
     
+    # Job retention: finished jobs are dropped from memory (and their storage
+    # removed) after job_ttl_seconds without access, or earlier when more than
+    # max_jobs are held. Running jobs are never evicted.
+    max_jobs: int = 1024
+    # Workflows executing at once (worker tasks); further jobs wait in the pending state
+    max_concurrent_workflows: int = 4
+    job_ttl_seconds: int = 24 * 3600
+    job_sweep_interval_seconds: int = 10 * 60
+    # Persist job status/results to SQLite so every worker (and a restarted
+    # server) can answer /api/status and /api/result
+    persist_job_state: bool = True
+    job_state_path: str = "./backend/storage/jobs.sqlite3"
+    
     # GitHub Configuration
     github_token: Optional[str] = None
     
     # Application Settings
     max_file_size: int = 1024 * 1024 * 10  # 10MB
+    max_file_read_chars: int = 32 * 1024  # Only the start of each file is read (summaries use ≤16K chars)
     max_files_to_analyze: int = 90  # Maximum files to analyze per repository
-    allowed_file_extensions: list = [
+    allowed_file_extensions: frozenset = frozenset({
         ".py", ".js", ".ts", ".tsx", ".jsx", ".java", ".cpp", ".c", ".h",
         ".cs", ".go", ".rs", ".rb", ".php", ".swift", ".kt", ".scala",
         ".html", ".css", ".scss", ".json", ".yaml", ".yml", ".md", ".txt"
-    ]
+    })  # frozenset: checked once per discovered file
     
     # LLM Configuration
     max_tokens_lite: int = 8192
     max_tokens_chat: int = 8192
     max_tokens_thinking: int = 8192
+    llm_max_concurrency: int = 16  # Max in-flight LLM requests per process (sync and async together)
+    llm_max_retries: int = 5  # Attempts per call when rate limited (HTTP 429)
+    # Tokens per minute sent to the provider per process (prompt plus max_tokens
+    # of each request, counted before it is sent); 0 = no limit
+    llm_max_tokens_per_minute: int = 0
+    summary_batch_max_files: int = 10  # Files summarized per LLM call
+    summary_batch_max_tokens: int = 6000  # File-content tokens per summary batch
+    manager_review_batch_size: int = 5  # README sections reviewed per Manager LLM call
+    codebase_context_max_tokens: int = 8000  # Cap on the codebase summary sent to agents
+    
+    # Submit README section prompts through the provider Batch API (half price, but
+    # asynchronous). Only for providers that implement /v1/batches; any failure
+    # falls back to concurrent direct calls.
+    use_batch_api: bool = False
+    batch_poll_interval_seconds: int = 10
+    batch_timeout_seconds: int = 30 * 60
+    
+    # While the Manager reviews a section that is often rejected (rejection rate at
+    # or above the threshold, as seen by this process), write a speculative
+    # rewrite in parallel and use it if the review fails. Trades tokens for latency.
+    speculative_section_retry: bool = False
+    speculative_retry_min_reject_rate: float = 0.3
+    
+    # Write first drafts with a self-check in the same call (JSON reply carrying the
+    # section and the writer's verdict). Self-approved sections skip the Manager
+    # review; the rest, and every retry, go through the usual write → review loop.
+    section_self_check: bool = False
+    
+    # Final review cascade: READMEs up to final_review_cascade_max_tokens are reviewed
+    # by the lite model first and only re-reviewed by the thinking model when the
+    # cheap pass rejects them or scores either check below final_review_min_score
+    final_review_cascade: bool = True
+    final_review_cascade_max_tokens: int = 3000
+    final_review_min_score: int = 70
+    
+    # Send response_format={"type": "json_object"} for agents that expect JSON replies
+    llm_json_mode: bool = True
+    
+    # Mark stable prompt prefixes with cache_control (Anthropic-style prompt caching).
+    # Only enable for providers that accept structured message content.
+    llm_prompt_cache_control: bool = False
+    # Send OpenAI-style prompt_cache_key (a hash of the leading context message) so
+    # calls sharing the codebase-context prefix are routed to the same cache
+    llm_prompt_cache_key: bool = False
+    
+    # LLM Response Cache (only used for low-temperature, i.e. near-deterministic, calls)
+    llm_cache_enabled: bool = True
+    llm_cache_path: str = "~/.drdoc/llm_cache.sqlite3"
+    llm_cache_ttl_seconds: int = 7 * 24 * 3600  # 1 week
+    llm_cache_max_temperature: float = 0.3
+    # Also match summaries on normalized file content (ignores whitespace/comment-only edits)
+    enable_semantic_cache: bool = True
+    # Return the earlier result when the same commit of a repository is documented
+    # again with the same models, file limits and prompt/workflow code, without
+    # running any agent (requests with "force": true always regenerate)
+    enable_result_cache: bool = True
+    # Reuse the whole codebase summary when the same commit is documented again
+    # (same HEAD SHA and selected files), skipping the summarizer entirely
+    enable_codebase_cache: bool = True
+    # Reuse Manager reviews of identical sections (same heading, content and codebase summary)
+    enable_review_cache: bool = True
+    # Reuse README sections for identical inputs (heading, codebase summary, repo,
+    # and for rewrites the improvement notes and prior draft)
+    enable_section_cache: bool = True
     
     class Config:
         env_file = ".env"
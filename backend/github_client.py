@@ -3,12 +3,44 @@ import os
 import stat
 import tempfile
 import shutil
+import threading
+from operator import itemgetter
 from typing import List, Dict, Any, Optional
 from git import Repo
-from pathlib import Path
 from backend.config import settings
 from backend.logger import logger
 
+# Only the tip of the default branch is read, so skip history and other refs;
+# never prompt for credentials (private/missing repos fail fast instead)
+_CLONE_OPTIONS = ['--depth=1', '--single-branch', '--no-tags']
+
+# Directories never descended into during file discovery
+_EXCLUDED_DIRS = frozenset({
+    'node_modules', '.git', '__pycache__', 'venv', 'env',
+    'dist', 'build', '.next', '.vscode', '.idea', 'coverage',
+    'target', 'bin', 'obj', '.pytest_cache', '.mypy_cache'
+})
+
+# Files to exclude from analysis (existing documentation that could cause
+# circular or confused output in the generated README)
+_EXCLUDED_FILENAMES = frozenset({'readme.md', 'readme.rst', 'readme.txt'})
+
+
+class _SharedClone:
+    """A clone used by every concurrent job on the same repository URL."""
+    
+    def __init__(self):
+        self.path: Optional[str] = None
+        self.error: Optional[Exception] = None
+        self.users = 1
+        self.ready = threading.Event()  # set once the clone finished or failed
+
+
+# repo_url -> clone in use. Entries are removed when their last user cleans
+# up, so jobs that do not overlap in time always clone afresh.
+_shared_clones: Dict[str, _SharedClone] = {}
+_shared_clones_lock = threading.Lock()
+
 
 def _handle_remove_readonly(func, path, exc_info):
     """Error handler for shutil.rmtree to handle read-only files on Windows."""
@@ -24,11 +56,15 @@ class GitHubClient:
     
     def __init__(self):
         self.temp_dir = None
+        self._shared: Optional[_SharedClone] = None
+        self._shared_url: Optional[str] = None
         logger.info("GitHub client initialized")
     
     def clone_repository(self, repo_url: str) -> str:
         """
-        Clone a GitHub repository to a temporary directory
+        Clone a GitHub repository to a temporary directory. While another job
+        is using a clone of the same URL, that clone is shared instead (same
+        commit, no second download); it is removed when its last user cleans up.
         
         Args:
             repo_url: GitHub repository URL
@@ -36,6 +72,35 @@ class GitHubClient:
         Returns:
             Path to cloned repository
         """
+        with _shared_clones_lock:
+            shared = _shared_clones.get(repo_url)
+            owner = shared is None
+            if owner:
+                shared = _shared_clones[repo_url] = _SharedClone()
+            else:
+                shared.users += 1
+        
+        if owner:
+            try:
+                shared.path = self._clone(repo_url)
+            except Exception as e:
+                shared.error = e
+                with _shared_clones_lock:
+                    del _shared_clones[repo_url]
+                raise
+            finally:
+                shared.ready.set()
+        else:
+            shared.ready.wait()
+            if shared.error is not None:
+                raise shared.error
+            logger.info(f"Reusing clone of {repo_url} at {shared.path}")
+        
+        self.temp_dir, self._shared, self._shared_url = shared.path, shared, repo_url
+        return shared.path
+    
+    def _clone(self, repo_url: str) -> str:
+        """Clone ``repo_url`` into a new temporary directory (see clone_repository)."""
         try:
             logger.workflow_step("Repository Cloning", f"Cloning {repo_url}")
             
@@ -45,7 +110,12 @@ class GitHubClient:
             
             # Clone the repository
             logger.info(f"Starting git clone operation...")
-            repo = Repo.clone_from(repo_url, self.temp_dir)
+            repo = Repo.clone_from(
+                repo_url,
+                self.temp_dir,
+                multi_options=_CLONE_OPTIONS,
+                env={'GIT_TERMINAL_PROMPT': '0'},
+            )
             
             logger.success(f"Successfully cloned repository to {self.temp_dir}")
             logger.info(f"Repository branch: {repo.active_branch}")
@@ -71,69 +141,75 @@ class GitHubClient:
             logger.workflow_step("File Discovery", f"Scanning {repo_path}")
             
             files = []
-            excluded_dirs = {
-                'node_modules', '.git', '__pycache__', 'venv', 'env',
-                'dist', 'build', '.next', '.vscode', '.idea', 'coverage',
-                'target', 'bin', 'obj', '.pytest_cache', '.mypy_cache'
-            }
-            
-            repo_root = Path(repo_path)
-            
-            # Files to exclude from analysis (existing documentation that could cause
-            # circular or confused output in the generated README)
-            excluded_filenames = {'readme.md', 'readme.rst', 'readme.txt'}
-
-            # Walk through directory
-            for file_path in repo_root.rglob('*'):
-                # Skip if it's not a file
-                if not file_path.is_file():
-                    continue
+            # Loop-invariant settings, bound once rather than per file
+            allowed_extensions = settings.allowed_file_extensions
+            max_file_size = settings.max_file_size
 
-                # Skip excluded filenames (e.g. existing README files)
-                if file_path.name.lower() in excluded_filenames:
-                    logger.info(f"Skipping existing documentation file: {file_path.name}")
-                    continue
-                
-                # Skip excluded directories
-                if any(excluded in file_path.parts for excluded in excluded_dirs):
-                    continue
-                
-                # Check file extension
-                if file_path.suffix not in settings.allowed_file_extensions:
-                    continue
-                
-                # Check file size
+            # Walk the tree with os.scandir, never descending into excluded
+            # directories; DirEntry caches the type/stat info from readdir
+            pending_dirs = [repo_path]
+            while pending_dirs:
+                dir_path = pending_dirs.pop()
                 try:
-                    file_size = file_path.stat().st_size
-                    if file_size > settings.max_file_size:
-                        logger.warning(f"Skipping large file: {file_path} ({file_size} bytes)")
+                    entries = list(os.scandir(dir_path))
+                except OSError as e:
+                    logger.warning(f"Could not scan directory {dir_path}: {e}")
+                    continue
+
+                discovered = 0
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in _EXCLUDED_DIRS:
+                            pending_dirs.append(entry.path)
+                        continue
+
+                    # Check file extension first — a pure string test, while
+                    # is_file() has to stat symlinks
+                    extension = os.path.splitext(entry.name)[1]
+                    if extension not in allowed_extensions:
                         continue
-                    
-                    if file_size == 0:
-                        logger.warning(f"Skipping empty file: {file_path}")
+
+                    # Skip if it's not a file
+                    if not entry.is_file():
                         continue
-                    
-                except Exception as e:
-                    logger.warning(f"Could not stat file {file_path}: {e}")
-                    continue
-                
-                # Get relative path from repo root
-                relative_path = file_path.relative_to(repo_root)
-                
-                files.append({
-                    'path': str(file_path),
-                    'relative_path': str(relative_path),
-                    'name': file_path.name,
-                    'extension': file_path.suffix,
-                    'size': file_size
-                })
-                
-                logger.file_process(str(relative_path), 'Discovered')
+
+                    # Skip excluded filenames (e.g. existing README files)
+                    if entry.name.lower() in _EXCLUDED_FILENAMES:
+                        logger.info(f"Skipping existing documentation file: {entry.name}")
+                        continue
+
+                    # Check file size
+                    try:
+                        file_size = entry.stat().st_size
+                        if file_size > max_file_size:
+                            logger.warning(f"Skipping large file: {entry.path} ({file_size} bytes)")
+                            continue
+
+                        if file_size == 0:
+                            logger.warning(f"Skipping empty file: {entry.path}")
+                            continue
+
+                    except Exception as e:
+                        logger.warning(f"Could not stat file {entry.path}: {e}")
+                        continue
+
+                    files.append({
+                        'path': entry.path,
+                        'relative_path': os.path.relpath(entry.path, repo_path),
+                        'name': entry.name,
+                        'extension': extension,
+                        'size': file_size
+                    })
+                    discovered += 1
+
+                if discovered:
+                    relative_dir = os.path.relpath(dir_path, repo_path)
+                    logger.info(f"Discovered {discovered} file(s) in {relative_dir}", emoji='FOLDER')
             
             logger.success(f"Found {len(files)} files to process")
             
             # Sort files by size (process smaller files first)
-            files.sort(key=lambda x: x['size'])
+            files.sort(key=itemgetter('size'))
             
             return files
             
@@ -143,7 +219,8 @@ class GitHubClient:
     
     def read_file_content(self, file_path: str) -> Optional[str]:
         """
-        Read content of a file
+        Read the content of a file, up to settings.max_file_read_chars
+        characters (the summarizer never looks further into a file)
         
         Args:
             file_path: Path to file
@@ -153,15 +230,29 @@ class GitHubClient:
         """
         try:
             with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            
-            logger.file_process(file_path, 'Read')
+                content = f.read(settings.max_file_read_chars)
             return content
             
         except Exception as e:
             logger.error(f"Failed to read file {file_path}: {str(e)}")
             return None
     
+    def get_head_sha(self, repo_path: str) -> Optional[str]:
+        """
+        Commit SHA checked out in a cloned repository
+        
+        Args:
+            repo_path: Path to cloned repository
+        
+        Returns:
+            Hex commit SHA or None if it cannot be read
+        """
+        try:
+            return Repo(repo_path).head.commit.hexsha
+        except Exception as e:
+            logger.warning(f"Failed to read HEAD commit of {repo_path}: {str(e)}")
+            return None
+    
     def extract_repo_name(self, repo_url: str) -> str:
         """
         Extract repository name from URL
@@ -187,7 +278,15 @@ class GitHubClient:
         return "unknown-repo"
     
     def cleanup(self):
-        """Clean up temporary directory"""
+        """Clean up temporary directory (a shared clone only once its last user is done)"""
+        if self._shared is not None:
+            with _shared_clones_lock:
+                self._shared.users -= 1
+                if self._shared.users > 0:
+                    self.temp_dir = None  # still in use by another job
+                elif _shared_clones.get(self._shared_url) is self._shared:
+                    del _shared_clones[self._shared_url]
+            self._shared = self._shared_url = None
         if self.temp_dir and os.path.exists(self.temp_dir):
             try:
                 logger.info(f"Cleaning up temporary directory: {self.temp_dir}")
@@ -0,0 +1,238 @@
+"""Job bookkeeping for the API layer: in-memory workflows and their persisted state"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, NamedTuple, Optional, Set, Tuple
+
+import orjson
+
+from backend.config import settings
+from backend.logger import logger
+from backend.workflow import DocumentationWorkflow, WorkflowStatus
+
+# Jobs in these states are done and may be evicted; running jobs never are
+_FINISHED_STATUSES = frozenset({WorkflowStatus.COMPLETED, WorkflowStatus.FAILED})
+
+
+class JobStore:
+    """
+    Workflows by job_id, least recently used first.
+
+    Finished jobs expire once they have not been accessed for ttl_seconds
+    (see sweep()), and the least recently used finished jobs are evicted
+    as soon as more than max_jobs are held. on_evict(job_id) is called for
+    every evicted job so the caller can release its files and connections.
+    """
+
+    def __init__(
+        self,
+        max_jobs: int,
+        ttl_seconds: int,
+        on_evict: Optional[Callable[[str], None]] = None,
+    ):
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        # job_id -> (workflow, monotonic time of last access)
+        self._jobs: 'OrderedDict[str, Tuple[DocumentationWorkflow, float]]' = OrderedDict()
+
+    def __contains__(self, job_id: str) -> bool:
+        return job_id in self._jobs
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def __getitem__(self, job_id: str) -> DocumentationWorkflow:
+        workflow, _ = self._jobs[job_id]
+        self._touch(job_id, workflow)
+        return workflow
+
+    def __setitem__(self, job_id: str, workflow: DocumentationWorkflow):
+        self._touch(job_id, workflow)
+        self._evict_over_capacity()
+
+    def __delitem__(self, job_id: str):
+        del self._jobs[job_id]
+
+    def sweep(self) -> int:
+        """Evict finished jobs not accessed for ttl_seconds; returns how many."""
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [
+            job_id for job_id, (workflow, accessed) in self._jobs.items()
+            if accessed < cutoff and workflow.status in _FINISHED_STATUSES
+        ]
+        for job_id in expired:
+            self._evict(job_id)
+        return len(expired)
+
+    def _touch(self, job_id: str, workflow: DocumentationWorkflow):
+        self._jobs[job_id] = (workflow, time.monotonic())
+        self._jobs.move_to_end(job_id)
+
+    def _evict_over_capacity(self):
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        finished = [
+            job_id for job_id, (workflow, _) in self._jobs.items()
+            if workflow.status in _FINISHED_STATUSES
+        ]
+        for job_id in finished[:excess]:
+            self._evict(job_id)
+        if len(self._jobs) > self.max_jobs:
+            logger.warning(
+                f"Holding {len(self._jobs)} jobs (limit {self.max_jobs}) — "
+                f"the rest are still running"
+            )
+
+    def _evict(self, job_id: str):
+        del self._jobs[job_id]
+        logger.info(f"Evicted job {job_id} from memory")
+        if self.on_evict is not None:
+            try:
+                self.on_evict(job_id)
+            except Exception as e:
+                logger.warning(f"Cleanup after evicting job {job_id} failed: {e}")
+
+
+class JobSnapshot(NamedTuple):
+    """Persisted view of a job — the workflow fields the API endpoints read."""
+    status: str
+    progress: int
+    error: Optional[str]
+    result: Optional[Dict[str, Any]]
+    result_etag: Optional[str]
+
+
+class JobStateDB:
+    """
+    SQLite table of job snapshots, shared by every worker process and kept
+    across restarts, so status and result requests can be answered by a
+    process that does not run the job. Rows expire ttl_seconds after their
+    last update.
+
+    Like the LLM cache, the connection is opened lazily and a database that
+    cannot be opened disables the table (saves are dropped, loads miss).
+    """
+
+    def __init__(self, path: str, ttl_seconds: int, enabled: bool = True):
+        self.path = os.path.expanduser(path)
+        self.ttl_seconds = ttl_seconds
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._disabled = not enabled
+        # Background saves: one writer thread keeps them in order
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='job-state')
+        self._pending: Set[str] = set()
+        self._pending_lock = threading.Lock()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._conn is None and not self._disabled:
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                # WAL: readers in other workers never block the writer, and
+                # commits skip the per-transaction fsync
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS jobs '
+                    '(job_id TEXT PRIMARY KEY, status TEXT NOT NULL, progress INTEGER NOT NULL, '
+                    'error TEXT, result BLOB, result_etag TEXT, expires_at REAL NOT NULL)'
+                )
+                conn.commit()
+                self._conn = conn
+            except Exception as e:
+                logger.warning(f"Job state store unavailable at {self.path}: {e}")
+                self._disabled = True
+        return self._conn
+
+    def save(self, job_id: str, workflow: DocumentationWorkflow):
+        """Record the workflow's current status (and its result once complete)."""
+        result = orjson.dumps(workflow.result) if workflow.result else None
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        job_id, workflow.status, workflow.progress, workflow.error,
+                        result, workflow.result_etag, time.time() + self.ttl_seconds,
+                    ),
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Job state write failed for {job_id}: {e}")
+
+    def save_in_background(self, job_id: str, workflow: DocumentationWorkflow):
+        """
+        Queue save() on the writer thread and return at once, so status updates
+        never wait on SQLite. A job already waiting to be saved is not queued
+        again — the pending save reads the workflow's latest state when it runs.
+        """
+        if self._disabled:
+            return
+        with self._pending_lock:
+            if job_id in self._pending:
+                return
+            self._pending.add(job_id)
+        self._writer.submit(self._save_pending, job_id, workflow)
+
+    def _save_pending(self, job_id: str, workflow: DocumentationWorkflow):
+        with self._pending_lock:
+            self._pending.discard(job_id)
+        self.save(job_id, workflow)
+
+    def load(self, job_id: str) -> Optional[JobSnapshot]:
+        """The last saved snapshot of a job, or None if unknown or expired."""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute(
+                    'SELECT status, progress, error, result, result_etag FROM jobs '
+                    'WHERE job_id = ? AND expires_at >= ?',
+                    (job_id, time.time()),
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Job state read failed for {job_id}: {e}")
+                return None
+        if row is None:
+            return None
+        status, progress, error, result, result_etag = row
+        return JobSnapshot(
+            status, progress, error, orjson.loads(result) if result else None, result_etag,
+        )
+
+    def delete(self, job_id: str):
+        """Forget a job."""
+        self._execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
+
+    def purge_expired(self) -> int:
+        """Delete expired rows; returns how many."""
+        return self._execute('DELETE FROM jobs WHERE expires_at < ?', (time.time(),))
+
+    def _execute(self, sql: str, params: tuple) -> int:
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return 0
+            try:
+                count = conn.execute(sql, params).rowcount
+                conn.commit()
+                return count
+            except sqlite3.Error as e:
+                logger.warning(f"Job state update failed: {e}")
+                return 0
+
+
+# Global job state store
+job_states = JobStateDB(
+    settings.job_state_path, settings.job_ttl_seconds, enabled=settings.persist_job_state,
+)
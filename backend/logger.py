@@ -1,8 +1,11 @@
 """Comprehensive color-coded logging system for Dr. Document"""
+import atexit
 import io
 import logging
+import queue
 import sys
-from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+import time
 from typing import Any, Dict
 from colorama import Fore, Back, Style, init
 
@@ -10,6 +13,24 @@ from colorama import Fore, Back, Style, init
 init(autoreset=True)
 
 
+# Console stream with UTF-8 so emoji don't cause UnicodeEncodeError on Windows
+# consoles whose default codec (e.g. cp1252) cannot encode multi-byte
+# characters. Built once and shared by every logger instance so that stdout
+# is never wrapped by several independent buffers.
+# line_buffering=True ensures each log line is flushed immediately.
+# We intentionally do NOT close the wrapper on exit so that sys.stdout.buffer
+# is not closed underneath the interpreter.
+try:
+    _UTF8_STDOUT = io.TextIOWrapper(
+        sys.stdout.buffer, encoding='utf-8', errors='replace',
+        line_buffering=True
+    )
+except AttributeError:
+    # Fallback for environments where sys.stdout has no .buffer attribute
+    # (e.g. StringIO-based stdout in tests or some IDEs).
+    _UTF8_STDOUT = sys.stdout
+
+
 class ColoredFormatter(logging.Formatter):
     """Custom formatter with color support"""
     
@@ -46,15 +67,21 @@ class ColoredFormatter(logging.Formatter):
         'READ': '👀',
     }
     
+    # Color code + opening bracket per level, built once
+    PREFIXES = {level: f"{color}[" for level, color in COLORS.items()}
+    
     def format(self, record):
-        # Get the color for this log level
-        color = self.COLORS.get(record.levelname, Fore.WHITE)
+        # Get the color prefix for this log level
+        prefix = self.PREFIXES.get(record.levelname, f"{Fore.WHITE}[")
         
-        # Format timestamp
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        # Format timestamp from the record's creation time
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created))
         
         # Format the log message
-        log_msg = f"{color}[{timestamp}] [{record.levelname}] {record.getMessage()}{Style.RESET_ALL}"
+        log_msg = (
+            f"{prefix}{timestamp}.{int(record.msecs):03d}] [{record.levelname}] "
+            f"{record.getMessage()}{Style.RESET_ALL}"
+        )
         
         if record.exc_info:
             log_msg += f"\n{self.formatException(record.exc_info)}"
@@ -69,28 +96,19 @@ class DrDocumentLogger:
         self.logger = logging.getLogger(name)
         self.logger.setLevel(logging.DEBUG)
         
-        # Remove existing handlers
-        self.logger.handlers = []
+        # Handlers are attached once per logger name; re-instantiating must not
+        # stack duplicates (every record would print twice)
+        if self.logger.handlers:
+            return
         
-        # Console handler with color – use UTF-8 so emoji don't cause
-        # UnicodeEncodeError on Windows consoles whose default codec (e.g.
-        # cp1252) cannot encode multi-byte characters.
-        # line_buffering=True ensures each log line is flushed immediately.
-        # We intentionally do NOT close the wrapper on exit so that
-        # sys.stdout.buffer is not closed underneath the interpreter.
-        try:
-            _stream = io.TextIOWrapper(
-                sys.stdout.buffer, encoding='utf-8', errors='replace',
-                line_buffering=True
-            )
-        except AttributeError:
-            # Fallback for environments where sys.stdout has no .buffer
-            # attribute (e.g. StringIO-based stdout in tests or some IDEs).
-            _stream = sys.stdout
-        console_handler = logging.StreamHandler(_stream)
-        console_handler.setLevel(logging.DEBUG)
+        handlers = []
+        
+        # Console shows INFO and above; per-file/per-chunk DEBUG records only
+        # go to the log file
+        console_handler = logging.StreamHandler(_UTF8_STDOUT)
+        console_handler.setLevel(logging.INFO)
         console_handler.setFormatter(ColoredFormatter())
-        self.logger.addHandler(console_handler)
+        handlers.append(console_handler)
         
         # File handler without color
         try:
@@ -99,9 +117,18 @@ class DrDocumentLogger:
             file_handler.setFormatter(
                 logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s')
             )
-            self.logger.addHandler(file_handler)
+            handlers.append(file_handler)
         except Exception:
             pass  # If file creation fails, continue with console only
+        
+        # Callers (often the event loop) only enqueue records; formatting and the
+        # console/file writes happen on the listener's thread. Stopped at exit
+        # so every queued record is flushed.
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.logger.addHandler(QueueHandler(log_queue))
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
     
     def _get_emoji(self, emoji_type: str) -> str:
         """Get emoji for log message"""
@@ -144,6 +171,10 @@ class DrDocumentLogger:
         self.logger.info(f"{emoji_char} [LLM OUTPUT] Model: {model}")
         self.logger.info(f"  Output: {str(output_data)[:500]}...")  # Truncate long outputs
     
+    def llm_output_chunk(self, model: str, chunk: str):
+        """Log a streamed LLM output chunk (debug level — very chatty)"""
+        self.logger.debug(f"  [LLM STREAM] Model: {model}: {chunk!r}")
+    
     def agent_start(self, agent_name: str, task: str):
         """Log agent starting"""
         emoji_char = self._get_emoji('AGENT')
@@ -160,9 +191,10 @@ class DrDocumentLogger:
         self.logger.error(f"{emoji_char} [AGENT FAILED] {agent_name}: {error}")
     
     def file_process(self, filename: str, action: str):
-        """Log file processing"""
-        emoji_char = self._get_emoji('FILE')
-        self.logger.info(f"{emoji_char} [FILE] {action}: {filename}")
+        """Log file processing (debug level — one record per file)"""
+        if self.logger.isEnabledFor(logging.DEBUG):
+            emoji_char = self._get_emoji('FILE')
+            self.logger.debug(f"{emoji_char} [FILE] {action}: {filename}")
     
     def workflow_step(self, step: str, details: str = ""):
         """Log workflow step"""
@@ -1,44 +1,149 @@
 """FastAPI backend for Dr. Document"""
 import asyncio
+import shutil
 import uuid
-from typing import Dict, Optional
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from contextlib import asynccontextmanager
+import orjson
+from typing import Dict, List, Optional
+from fastapi import FastAPI, WebSocket, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, HttpUrl
 from backend.workflow import DocumentationWorkflow, WorkflowStatus
+from backend.job_store import JobStore, job_states
+from backend.agents.llm_client import aclose_async_client, get_async_client
 from backend.logger import logger
 from backend.config import settings
 import os
 
-# Create storage directory
-os.makedirs(settings.storage_path, exist_ok=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """One-shot startup (storage, shared LLM client, job sweeper) and shutdown"""
+    # Create storage directory
+    os.makedirs(settings.storage_path, exist_ok=True)
+    
+    # Open the server loop's shared LLM connection pool before the first job
+    get_async_client()
+    job_sweeper = asyncio.create_task(_sweep_jobs())
+    job_workers = [
+        asyncio.create_task(_run_queued_workflows())
+        for _ in range(settings.max_concurrent_workflows)
+    ]
+    
+    logger.success("🚀 Dr. Document API started successfully!")
+    logger.info(f"Storage path: {settings.storage_path}")
+    logger.info(f"LongCat API configured: {bool(settings.longcat_api_key)}")
+    
+    yield
+    
+    job_sweeper.cancel()
+    for worker in job_workers:
+        worker.cancel()
+    await aclose_async_client()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Dr. Document API",
     description="AI-Powered GitHub Documentation Generator",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 # Configure CORS
+# Explicit origins, methods and headers; max_age lets browsers cache preflights
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # In production, specify actual origins
+    allow_origins=settings.cors_origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "DELETE"],
+    allow_headers=["content-type", "if-none-match"],
+    max_age=86400,
 )
 
-# In-memory storage for workflow instances
-workflows: Dict[str, DocumentationWorkflow] = {}
+# Compress larger responses (README results); small status bodies are sent as is
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# Jobs waiting to run, drained by settings.max_concurrent_workflows worker
+# tasks; queued jobs stay pending until a worker picks them up
+job_queue: asyncio.Queue = asyncio.Queue()
 
 # WebSocket connections
 connections: Dict[str, WebSocket] = {}
 
+# Outgoing status updates per connection, drained by one writer task each
+outboxes: Dict[str, asyncio.Queue] = {}
+
+# Updates buffered per connection before the oldest are dropped
+_OUTBOX_SIZE = 64
+
+
+def _enqueue_update(queue: asyncio.Queue, status_data: dict):
+    """Queue a status update, dropping the oldest one if the client is behind."""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(status_data)
+
+
+def _coalesce_updates(updates: List[dict]) -> List[dict]:
+    """
+    Drop progress-only updates superseded later in the same burst. Updates
+    carrying an agent_update are always kept (each changes an agent's state).
+    """
+    last_plain = max(
+        (i for i, update in enumerate(updates) if 'agent_update' not in update),
+        default=-1,
+    )
+    return [
+        update for i, update in enumerate(updates)
+        if 'agent_update' in update or i == last_plain
+    ]
+
+
+async def _send_updates(websocket: WebSocket, queue: asyncio.Queue, job_id: str):
+    """Send queued updates, one frame per burst ({'batch': [...]} for several)."""
+    try:
+        while True:
+            updates = [await queue.get()]
+            while not queue.empty():
+                updates.append(queue.get_nowait())
+            updates = _coalesce_updates(updates)
+            payload = updates[0] if len(updates) == 1 else {'batch': updates}
+            # Text frames: the browser client JSON.parses event.data as a string
+            await websocket.send_text(orjson.dumps(payload).decode())
+    except Exception as e:
+        logger.error(f"Failed to send WebSocket update for job {job_id}: {e}")
+
+
+def _remove_job_storage(job_id: str):
+    """Remove a job's storage directory, if any (blocking — run it in a thread)."""
+    storage_dir = os.path.join(settings.storage_path, job_id)
+    if os.path.exists(storage_dir):
+        shutil.rmtree(storage_dir, ignore_errors=True)
+
+
+def _on_job_evicted(job_id: str):
+    """Release everything an evicted job still holds."""
+    connections.pop(job_id, None)
+    outboxes.pop(job_id, None)
+    # Evictions normally happen on the event loop (requests, sweeper); delete off it
+    try:
+        asyncio.get_running_loop().run_in_executor(None, _remove_job_storage, job_id)
+    except RuntimeError:
+        _remove_job_storage(job_id)
+
+
+# In-memory storage for workflow instances (bounded; finished jobs expire)
+workflows = JobStore(settings.max_jobs, settings.job_ttl_seconds, on_evict=_on_job_evicted)
+
 
 class ProcessRepoRequest(BaseModel):
     """Request model for repository processing"""
     repo_url: HttpUrl
+    force: bool = False  # regenerate even if this commit was documented before
 
 
 class ProcessRepoResponse(BaseModel):
@@ -56,33 +161,58 @@ class StatusResponse(BaseModel):
     message: str
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Startup event handler"""
-    logger.success("🚀 Dr. Document API started successfully!")
-    logger.info(f"Storage path: {settings.storage_path}")
-    logger.info(f"LongCat API configured: {bool(settings.longcat_api_key)}")
+async def _run_queued_workflows():
+    """Worker task: execute queued workflows one at a time."""
+    while True:
+        workflow, repo_url, force = await job_queue.get()
+        try:
+            await workflow.execute(repo_url, force=force)
+        except Exception:
+            pass  # execute() has already logged the error and marked the job failed
+        finally:
+            # Final status, now with the result (set after the last update)
+            job_states.save_in_background(workflow.job_id, workflow)
+            job_queue.task_done()
+
+
+async def _sweep_jobs():
+    """Periodically expire finished jobs that have not been accessed recently."""
+    while True:
+        await asyncio.sleep(settings.job_sweep_interval_seconds)
+        try:
+            expired = workflows.sweep()
+            if expired:
+                logger.info(f"Expired {expired} finished job(s)")
+            job_states.purge_expired()
+        except Exception as e:
+            logger.error(f"Job sweep failed: {e}")
+
+
+# Liveness-probe bodies, encoded once: the root response is constant and the
+# health response only varies in active_jobs
+_ROOT_BODY = orjson.dumps({
+    "name": "Dr. Document API",
+    "version": "1.0.0",
+    "status": "operational",
+    "description": "AI-Powered GitHub Documentation Generator"
+})
+_HEALTH_BODY_PREFIX = b'{"status":"healthy","active_jobs":'
+_HEALTH_BODY_SUFFIX = b',"storage_path":' + orjson.dumps(settings.storage_path) + b'}'
 
 
 @app.get("/")
 async def root():
     """Root endpoint"""
-    return {
-        "name": "Dr. Document API",
-        "version": "1.0.0",
-        "status": "operational",
-        "description": "AI-Powered GitHub Documentation Generator"
-    }
+    return Response(_ROOT_BODY, media_type="application/json")
 
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "active_jobs": len(workflows),
-        "storage_path": settings.storage_path
-    }
+    return Response(
+        b'%s%d%s' % (_HEALTH_BODY_PREFIX, len(workflows), _HEALTH_BODY_SUFFIX),
+        media_type="application/json",
+    )
 
 
 @app.post("/api/process-repo", response_model=ProcessRepoResponse)
@@ -99,26 +229,29 @@ async def process_repository(request: ProcessRepoRequest):
     try:
         # Generate job ID
         job_id = str(uuid.uuid4())
+        repo_url = str(request.repo_url)
         
-        logger.info(f"📥 New repository request: {request.repo_url}")
+        logger.info(f"📥 New repository request: {repo_url}")
         logger.info(f"Assigned job ID: {job_id}")
         
         # Create workflow instance
         workflow = DocumentationWorkflow(job_id)
         workflows[job_id] = workflow
+        job_states.save(job_id, workflow)
+        
+        # Every status change goes to the shared job state; broadcasts (which
+        # the workflow throttles) go to the WebSocket outbox
+        workflow.set_state_callback(lambda: job_states.save_in_background(job_id, workflow))
         
-        # Set status callback for WebSocket updates
         async def status_callback(status_data):
-            if job_id in connections:
-                try:
-                    await connections[job_id].send_json(status_data)
-                except Exception as e:
-                    logger.error(f"Failed to send WebSocket update: {e}")
+            queue = outboxes.get(job_id)
+            if queue is not None:
+                _enqueue_update(queue, status_data)
         
         workflow.set_status_callback(status_callback)
         
-        # Start workflow in background
-        asyncio.create_task(workflow.execute(str(request.repo_url)))
+        # Run the workflow in the background, once a worker is free
+        job_queue.put_nowait((workflow, repo_url, request.force))
         
         return ProcessRepoResponse(
             job_id=job_id,
@@ -131,6 +264,19 @@ async def process_repository(request: ProcessRepoRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _find_job(job_id: str):
+    """
+    The job's workflow if this process runs it, else its persisted snapshot
+    (another worker's job, or one from before a restart). 404 if unknown.
+    """
+    if job_id in workflows:
+        return workflows[job_id]
+    snapshot = job_states.load(job_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return snapshot
+
+
 @app.get("/api/status/{job_id}", response_model=StatusResponse)
 async def get_status(job_id: str):
     """
@@ -142,34 +288,42 @@ async def get_status(job_id: str):
     Returns:
         Current status and progress
     """
-    if job_id not in workflows:
-        raise HTTPException(status_code=404, detail="Job not found")
-    
-    workflow = workflows[job_id]
+    workflow = _find_job(job_id)
     
     return StatusResponse(
         job_id=job_id,
         status=workflow.status,
         progress=workflow.progress,
-        message=workflow.error or "Processing"
+        message=workflow.error or (
+            "Queued" if workflow.status == WorkflowStatus.PENDING else "Processing"
+        )
     )
 
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header value covers etag (weak comparison)."""
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    return '*' in tags or etag in tags
+
+
 @app.get("/api/result/{job_id}")
-async def get_result(job_id: str):
+async def get_result(job_id: str, request: Request):
     """
     Get result of a completed job
     
+    The result never changes once complete, so it carries an ETag and a
+    matching If-None-Match is answered with 304 Not Modified.
+    
     Args:
         job_id: Job identifier
+        request: Incoming request (for If-None-Match)
     
     Returns:
         Complete result including README
     """
-    if job_id not in workflows:
-        raise HTTPException(status_code=404, detail="Job not found")
-    
-    workflow = workflows[job_id]
+    workflow = _find_job(job_id)
     
     if workflow.status == WorkflowStatus.FAILED:
         raise HTTPException(status_code=500, detail=workflow.error)
@@ -180,7 +334,11 @@ async def get_result(job_id: str):
     if not workflow.result:
         raise HTTPException(status_code=500, detail="Result not available")
     
-    return workflow.result
+    headers = {"ETag": workflow.result_etag, "Cache-Control": "private, max-age=300"}
+    if _etag_matches(request.headers.get("if-none-match"), workflow.result_etag):
+        return Response(status_code=304, headers=headers)
+    
+    return ORJSONResponse(workflow.result, headers=headers)
 
 
 @app.websocket("/ws/{job_id}")
@@ -193,38 +351,43 @@ async def websocket_endpoint(websocket: WebSocket, job_id: str):
         job_id: Job identifier
     """
     await websocket.accept()
+    if len(connections) >= settings.max_ws_connections:
+        logger.warning(f"Refusing WebSocket for job {job_id}: connection limit reached")
+        await websocket.close(code=1013)
+        return
     connections[job_id] = websocket
+    queue: asyncio.Queue = asyncio.Queue(maxsize=_OUTBOX_SIZE)
+    outboxes[job_id] = queue
+    writer = asyncio.create_task(_send_updates(websocket, queue, job_id))
     
     logger.info(f"WebSocket connected for job {job_id}")
     
     try:
         # Send initial status if workflow exists
-        if job_id in workflows:
-            workflow = workflows[job_id]
-            await websocket.send_json({
+        workflow = workflows[job_id] if job_id in workflows else job_states.load(job_id)
+        if workflow is not None:
+            _enqueue_update(queue, {
                 'job_id': job_id,
                 'status': workflow.status,
                 'progress': workflow.progress,
                 'message': 'Connected'
             })
         
-        # Keep connection alive
-        while True:
-            # Wait for messages (ping/pong)
-            data = await websocket.receive_text()
-            
-            # Echo back for keep-alive
+        # Keep connection alive: answer pings until the client disconnects
+        # (iter_text ends quietly on disconnect)
+        async for data in websocket.iter_text():
             if data == "ping":
                 await websocket.send_text("pong")
-            
-    except WebSocketDisconnect:
+        
         logger.info(f"WebSocket disconnected for job {job_id}")
-        if job_id in connections:
-            del connections[job_id]
     except Exception as e:
         logger.error(f"WebSocket error for job {job_id}: {str(e)}")
-        if job_id in connections:
+    finally:
+        writer.cancel()
+        if connections.get(job_id) is websocket:
             del connections[job_id]
+        if outboxes.get(job_id) is queue:
+            del outboxes[job_id]
 
 
 @app.delete("/api/job/{job_id}")
@@ -238,18 +401,17 @@ async def delete_job(job_id: str):
     Returns:
         Deletion confirmation
     """
-    if job_id not in workflows:
+    if job_id not in workflows and job_states.load(job_id) is None:
         raise HTTPException(status_code=404, detail="Job not found")
     
     try:
-        # Remove from memory
-        del workflows[job_id]
+        # Remove from memory and the shared job state
+        if job_id in workflows:
+            del workflows[job_id]
+        job_states.delete(job_id)
         
-        # Remove storage directory
-        storage_dir = os.path.join(settings.storage_path, job_id)
-        if os.path.exists(storage_dir):
-            import shutil
-            shutil.rmtree(storage_dir)
+        # Remove storage directory (off the event loop — it can be large)
+        await asyncio.to_thread(_remove_job_storage, job_id)
         
         logger.info(f"Deleted job {job_id}")
         
@@ -260,15 +422,34 @@ async def delete_job(job_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Clients only ever send "ping", so cap inbound WebSocket frames well below
+# uvicorn's 16 MiB default. permessage-deflate is on by default and compresses
+# the outgoing JSON status frames.
+_WS_MAX_SIZE = 64 * 1024
+
+
 if __name__ == "__main__":
     import uvicorn
     
     logger.info("Starting Dr. Document API server...")
     
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8004   ,
-        reload=True,
-        log_level="info"
-    )
+    if settings.server_workers > 1:
+        # Production: one event loop per core (reload cannot run with workers)
+        logger.info(f"Running {settings.server_workers} worker processes")
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8004,
+            workers=settings.server_workers,
+            ws_max_size=_WS_MAX_SIZE,
+            log_level="info"
+        )
+    else:
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8004   ,
+            reload=True,
+            ws_max_size=_WS_MAX_SIZE,
+            log_level="info"
+        )
@@ -1,5 +1,6 @@
 """
-Quick test to verify backend components can be imported and initialized
+Quick tests to verify backend components can be imported and initialized,
+plus unit tests for the caches, review parsing, batching and job store
 """
 import sys
 import os
@@ -11,119 +12,476 @@ def test_imports():
     """Test that all major components can be imported"""
     print("Testing imports...")
     
-    try:
-        from backend.config import settings
-        print("✓ Config imported")
-        
-        from backend.logger import logger
-        print("✓ Logger imported")
-        
-        from backend.github_client import GitHubClient
-        print("✓ GitHub client imported")
-        
-        from backend.agents.base_agent import BaseAgent
-        print("✓ Base agent imported")
-        
-        from backend.agents.codebase_summarizer import CodebaseSummarizerAgent
-        print("✓ Codebase Summarizer agent imported")
-        
-        from backend.agents.headings_selector import HeadingsSelectorAgent
-        print("✓ Headings Selector agent imported")
-        
-        from backend.agents.section_writer import SectionWriterAgent
-        print("✓ Section Writer agent imported")
-        
-        from backend.agents.manager import ManagerAgent
-        print("✓ Manager agent imported")
-        
-        from backend.agents.final_reviewer import FinalReviewerAgent
-        print("✓ Final Reviewer agent imported")
-        
-        from backend.workflow import DocumentationWorkflow
-        print("✓ Workflow imported")
-        
-        from backend.main import app
-        print("✓ FastAPI app imported")
-        
-        return True
-    except Exception as e:
-        print(f"✗ Import failed: {e}")
-        return False
+    from backend.config import settings
+    print("✓ Config imported")
+    
+    from backend.logger import logger
+    print("✓ Logger imported")
+    
+    from backend.github_client import GitHubClient
+    print("✓ GitHub client imported")
+    
+    from backend.agents.base_agent import BaseAgent
+    print("✓ Base agent imported")
+    
+    from backend.agents.codebase_summarizer import CodebaseSummarizerAgent
+    print("✓ Codebase Summarizer agent imported")
+    
+    from backend.agents.headings_selector import HeadingsSelectorAgent
+    print("✓ Headings Selector agent imported")
+    
+    from backend.agents.section_writer import SectionWriterAgent
+    print("✓ Section Writer agent imported")
+    
+    from backend.agents.manager import ManagerAgent
+    print("✓ Manager agent imported")
+    
+    from backend.agents.final_reviewer import FinalReviewerAgent
+    print("✓ Final Reviewer agent imported")
+    
+    from backend.workflow import DocumentationWorkflow
+    print("✓ Workflow imported")
+    
+    from backend.main import app
+    print("✓ FastAPI app imported")
 
 
 def test_logger():
     """Test that logger works correctly"""
     print("\nTesting logger...")
     
-    try:
-        from backend.logger import logger
-        
-        logger.info("Test info message", emoji='START')
-        logger.success("Test success message")
-        logger.warning("Test warning message")
-        
-        print("✓ Logger working correctly")
-        return True
-    except Exception as e:
-        print(f"✗ Logger test failed: {e}")
-        return False
+    from backend.logger import logger
+    
+    logger.info("Test info message", emoji='START')
+    logger.success("Test success message")
+    logger.warning("Test warning message")
+    
+    print("✓ Logger working correctly")
 
 
 def test_config():
     """Test that configuration is loaded"""
     print("\nTesting configuration...")
     
-    try:
-        from backend.config import settings
-        
-        assert settings.model_flash_lite == "LongCat-Flash-Lite"
-        assert settings.model_flash_thinking == "LongCat-Flash-Thinking"
-        assert settings.max_files_to_analyze == 90
-        
-        print(f"✓ Config loaded:")
-        print(f"  - Flash Lite model: {settings.model_flash_lite}")
-        print(f"  - Flash Thinking model: {settings.model_flash_thinking}")
-        print(f"  - Max files to analyze: {settings.max_files_to_analyze}")
-        
-        return True
-    except Exception as e:
-        print(f"✗ Config test failed: {e}")
-        return False
+    from backend.config import settings
+    
+    assert settings.model_flash_lite == "LongCat-Flash-Lite"
+    assert settings.model_flash_thinking == "LongCat-Flash-Thinking"
+    assert settings.max_files_to_analyze == 90
+    
+    print(f"✓ Config loaded:")
+    print(f"  - Flash Lite model: {settings.model_flash_lite}")
+    print(f"  - Flash Thinking model: {settings.model_flash_thinking}")
+    print(f"  - Max files to analyze: {settings.max_files_to_analyze}")
 
 
 def test_agent_init():
     """Test that agents can be instantiated (without API calls)"""
     print("\nTesting agent instantiation (mock API key)...")
     
+    # Temporarily set a dummy API key so OpenAI client doesn't raise
+    os.environ.setdefault("LONGCAT_API_KEY", "test-key")
+    
+    from backend.agents.codebase_summarizer import CodebaseSummarizerAgent
+    a1 = CodebaseSummarizerAgent()
+    print(f"✓ CodebaseSummarizerAgent: {a1.agent_name}, model={a1.model}")
+    
+    from backend.agents.headings_selector import HeadingsSelectorAgent
+    a2 = HeadingsSelectorAgent()
+    print(f"✓ HeadingsSelectorAgent: {a2.agent_name}, model={a2.model}")
+    
+    from backend.agents.section_writer import SectionWriterAgent
+    a3 = SectionWriterAgent("Features")
+    print(f"✓ SectionWriterAgent: {a3.agent_name}, model={a3.model}")
+    
+    from backend.agents.manager import ManagerAgent
+    a4 = ManagerAgent()
+    print(f"✓ ManagerAgent: {a4.agent_name}, model={a4.model}")
+    
+    from backend.agents.final_reviewer import FinalReviewerAgent
+    a5 = FinalReviewerAgent()
+    print(f"✓ FinalReviewerAgent: {a5.agent_name}, model={a5.model}")
+
+
+def test_local_summary_license_files():
+    """Test that only real license files get the fixed license summary"""
+    print("\nTesting local summaries for license files...")
+
+    from backend.agents.codebase_summarizer import CodebaseSummarizerAgent
+
+    content = "def write_license(path):\n    return open(path, 'w').write(HEADER)\n"
+    for path in ('src/license_writer.py', 'licenses.py', 'license_check.ts'):
+        assert CodebaseSummarizerAgent._local_summary(path, content) is None
+
+    license_text = "MIT License\n\nPermission is hereby granted, free of charge, to any person"
+    for path in ('LICENSE', 'LICENSE.md', 'docs/licence.txt', 'COPYING'):
+        assert CodebaseSummarizerAgent._local_summary(path, license_text) == 'License text for the project.'
+
+    print("✓ License files matched by name only")
+
+
+def test_normalize_source():
+    """Test that only comments of the file's own language are stripped"""
+    print("\nTesting source normalization...")
+
+    from backend.agents.llm_cache import normalize_source
+
+    # Formatting-only edits normalize to the same text
+    code = "def add(a, b):\n    return a + b\n\nprint(add(1, 2))\n"
+    edited = "# helpers\ndef add(a,  b):\n\n        return a + b\nprint(add(1, 2))  \n"
+    assert normalize_source(code, 'calc.py') == normalize_source(edited, 'calc.py')
+    assert normalize_source(code, 'calc.py') != normalize_source(code.replace('+', '-'), 'calc.py')
+
+    # Preprocessor lines are C code, not comments
+    header = "#include <stdio.h>\n#define MAX_USERS 64\n#define MAX_GROUPS 8\n"
+    other_header = "#include <stdlib.h>\n#define BUFFER_SIZE 4096\n#define TIMEOUT_MS 250\n"
+    assert normalize_source(header, 'limits.h') == header.strip()
+    assert normalize_source(header, 'limits.h') != normalize_source(other_header, 'config.h')
+
+    # Block and line comments are stripped in C-style languages
+    js = "/*\n * Entry point\n */\nconst x = 1;  // one\n// two\n*p = x;\n"
+    assert normalize_source(js, 'main.js') == "const x = 1; // one\n*p = x;"
+
+    # Unknown languages, and text that is mostly comments, are not normalized
+    markdown = "# Title\n\n* first point\n* second point\n"
+    assert normalize_source(markdown, 'README.md') is None
+    assert normalize_source("# config for the build\n# set by CI\nx = 1\n", 'settings.py') is None
+    assert normalize_source("# only a comment\n", 'empty.py') is None
+
+    print("✓ normalize_source working correctly")
+
+
+def test_summary_plan_dedupe(monkeypatch):
+    """Test that only equivalent files share one summary within a run"""
+    print("\nTesting summary deduplication...")
+
+    os.environ.setdefault("LONGCAT_API_KEY", "test-key")
+
+    from backend.config import settings
+    from backend.agents.codebase_summarizer import CodebaseSummarizerAgent
+
+    monkeypatch.setattr(settings, 'llm_cache_enabled', False)
+    monkeypatch.setattr(settings, 'enable_semantic_cache', True)
+
+    code = "def add(a, b):\n    return a + b\n\nprint(add(1, 2))\n"
+    doc = "# Usage\n\n* run the server with make serve\n* open the browser\n"
+    files = [
+        {'file_path': 'a.py', 'file_content': code},
+        {'file_path': 'b.py', 'file_content': "# copy\n" + code.replace('    ', '  ')},
+        {'file_path': 'limits.h', 'file_content': "#include <stdio.h>\n#define MAX_USERS 64\n#define MAX_GROUPS 8\n"},
+        {'file_path': 'config.h', 'file_content': "#include <stdlib.h>\n#define TIMEOUT_MS 250\n#define RETRIES 3\n"},
+        {'file_path': 'docs/usage.md', 'file_content': doc},
+        {'file_path': 'docs/setup.md', 'file_content': doc.replace('make serve', 'npm start')},
+        {'file_path': 'docs/copy.md', 'file_content': doc},
+    ]
+    ready, pending, copies = CodebaseSummarizerAgent()._plan(files)
+
+    assert ready == {}
+    assert [f['file_path'] for f in pending] == ['a.py', 'limits.h', 'config.h', 'docs/usage.md', 'docs/setup.md']
+    assert copies['a.py'] == ['b.py']
+    assert copies['docs/usage.md'] == ['docs/copy.md']
+    assert copies['limits.h'] == [] and copies['docs/setup.md'] == []
+
+    print("✓ Only equivalent files deduplicated")
+
+
+def test_result_cache_key(monkeypatch):
+    """Test that cached workflow results are keyed on the code version"""
+    print("\nTesting result cache keys...")
+
+    from backend.config import settings
+    from backend import workflow
+
+    monkeypatch.setattr(settings, 'llm_cache_enabled', True)
+    monkeypatch.setattr(settings, 'enable_result_cache', True)
+
+    key = workflow._result_cache_key('owner/repo', 'abc123')
+    assert key is not None
+    assert workflow._result_cache_key('owner/repo', None) is None
+    assert workflow._result_cache_key('owner/repo', 'def456') != key
+
+    monkeypatch.setattr(workflow, '_RESULT_CACHE_VERSION', workflow._RESULT_CACHE_VERSION + 1)
+    assert workflow._result_cache_key('owner/repo', 'abc123') != key
+
+    print("✓ Result cache keys working correctly")
+
+
+def test_final_review_scores():
+    """Test score parsing for numbered and bulleted prose reviews"""
+    print("\nTesting final review score parsing...")
+
+    os.environ.setdefault("LONGCAT_API_KEY", "test-key")
+
+    from backend.agents.final_reviewer import FinalReviewerAgent, _ParsedReview
+
+    reviewer = FinalReviewerAgent()
+    numbered = (
+        "1. COMPLETENESS CHECK: 85/100\n   - Setup is covered\n\n"
+        "2. ACCURACY CHECK\n   Score: 90\n\n"
+        "3. ISSUES FOUND:\n   - Missing API examples\n\n"
+        "5. FINAL VERDICT:\n   APPROVE"
+    )
+    bulleted = (
+        "Overall the README is solid.\n"
+        "- Completeness: 85/100\n"
+        "- Accuracy: 90/100\n"
+        "Verdict: APPROVE"
+    )
+    for review in (numbered, bulleted):
+        parsed = _ParsedReview(review)
+        assert reviewer._extract_score(parsed, 'COMPLETENESS') == 85
+        assert reviewer._extract_score(parsed, 'ACCURACY') == 90
+    assert reviewer._extract_list(_ParsedReview(numbered), 'ISSUES') == ['Missing API examples']
+
+    print("✓ Review scores parsed for both layouts")
+
+
+def test_final_review_sections():
+    """Test that keywords mentioned in a section's body do not split it"""
+    print("\nTesting final review sections...")
+
+    os.environ.setdefault("LONGCAT_API_KEY", "test-key")
+
+    from backend.agents.final_reviewer import FinalReviewerAgent, _ParsedReview
+
+    reviewer = FinalReviewerAgent()
+    review = _ParsedReview(
+        "1. COMPLETENESS CHECK: 70/100\n\n"
+        "2. ACCURACY CHECK: 65/100\n\n"
+        "3. ISSUES FOUND:\n"
+        "Several accuracy problems remain:\n"
+        "- Install command is wrong\n"
+        "- API section lists removed endpoints\n\n"
+        "4. IMPROVEMENT DETAILS:\n"
+        "Improve completeness by documenting the CLI.\n"
+        "- Fix the install command\n\n"
+        "5. FINAL VERDICT:\n"
+        "REJECT"
+    )
+    assert reviewer._extract_list(review, 'ISSUES') == [
+        'Install command is wrong', 'API section lists removed endpoints',
+    ]
+    assert reviewer._extract_improvement_details(review) == (
+        "Improve completeness by documenting the CLI.\n- Fix the install command"
+    )
+    assert reviewer._extract_score(review, 'COMPLETENESS') == 70
+    assert reviewer._extract_score(review, 'ACCURACY') == 65
+
+    print("✓ Review sections indexed by their headings")
+
+
+def test_llm_cache(tmp_path):
+    """Test LLM cache hits, misses and expiry"""
+    print("\nTesting LLM cache...")
+
+    from backend.agents.llm_cache import LLMCache
+
+    cache = LLMCache(str(tmp_path / 'cache.sqlite3'), ttl_seconds=60)
+    key = LLMCache.make_key('model', [{'role': 'user', 'content': 'hi'}], 100, 0)
+    assert key != LLMCache.make_key('model', [{'role': 'user', 'content': 'hi'}], 100, 0.3)
+    assert cache.get(key) is None
+    cache.set(key, 'hello')
+    assert cache.get(key) == 'hello'
+
+    expired = LLMCache(str(tmp_path / 'expired.sqlite3'), ttl_seconds=-1)
+    expired.set(key, 'hello')
+    assert expired.get(key) is None
+
+    # A locked database while dropping an expired row is still just a miss
+    import sqlite3
+    expired.set(key, 'hello')
+    locker = sqlite3.connect(str(tmp_path / 'expired.sqlite3'), timeout=0)
+    locker.execute('BEGIN IMMEDIATE')  # readers may proceed, writers are locked out
+    expired._conn.execute('PRAGMA busy_timeout = 0')
     try:
-        # Temporarily set a dummy API key so OpenAI client doesn't raise
-        import os
-        os.environ.setdefault("LONGCAT_API_KEY", "test-key")
-        
-        from backend.agents.codebase_summarizer import CodebaseSummarizerAgent
-        a1 = CodebaseSummarizerAgent()
-        print(f"✓ CodebaseSummarizerAgent: {a1.agent_name}, model={a1.model}")
-        
-        from backend.agents.headings_selector import HeadingsSelectorAgent
-        a2 = HeadingsSelectorAgent()
-        print(f"✓ HeadingsSelectorAgent: {a2.agent_name}, model={a2.model}")
-        
-        from backend.agents.section_writer import SectionWriterAgent
-        a3 = SectionWriterAgent("Features")
-        print(f"✓ SectionWriterAgent: {a3.agent_name}, model={a3.model}")
-        
-        from backend.agents.manager import ManagerAgent
-        a4 = ManagerAgent()
-        print(f"✓ ManagerAgent: {a4.agent_name}, model={a4.model}")
-        
-        from backend.agents.final_reviewer import FinalReviewerAgent
-        a5 = FinalReviewerAgent()
-        print(f"✓ FinalReviewerAgent: {a5.agent_name}, model={a5.model}")
-        
-        return True
-    except Exception as e:
-        print(f"✗ Agent instantiation failed: {e}")
-        return False
+        assert expired.get(key) is None
+    finally:
+        locker.rollback()
+        locker.close()
+
+    print("✓ LLM cache working correctly")
+
+
+def test_job_store_eviction():
+    """Test that only finished jobs are evicted, least recently used first"""
+    print("\nTesting job store eviction...")
+
+    from types import SimpleNamespace
+    from backend.job_store import JobStore
+    from backend.workflow import WorkflowStatus
+
+    evicted = []
+    store = JobStore(max_jobs=2, ttl_seconds=3600, on_evict=evicted.append)
+    store['running'] = SimpleNamespace(status=WorkflowStatus.WRITING_SECTIONS)
+    store['old'] = SimpleNamespace(status=WorkflowStatus.COMPLETED)
+    store['new'] = SimpleNamespace(status=WorkflowStatus.FAILED)
+    assert evicted == ['old']
+    assert 'running' in store and 'new' in store
+
+    store.ttl_seconds = -1
+    assert store.sweep() == 1
+    assert evicted == ['old', 'new'] and len(store) == 1
+
+    print("✓ Job store eviction working correctly")
+
+
+def test_job_state_db(tmp_path):
+    """Test persisted job snapshots, including background saves"""
+    print("\nTesting job state store...")
+
+    from types import SimpleNamespace
+    from backend.job_store import JobStateDB
+
+    db = JobStateDB(str(tmp_path / 'jobs.sqlite3'), ttl_seconds=60)
+    workflow = SimpleNamespace(status='writing_sections', progress=50, error=None, result=None, result_etag=None)
+    db.save('job', workflow)
+    assert db.load('job') == ('writing_sections', 50, None, None, None)
+
+    workflow.status, workflow.progress = 'completed', 100
+    workflow.result, workflow.result_etag = {'readme': '# Repo'}, '"etag"'
+    db.save_in_background('job', workflow)
+    db._writer.submit(lambda: None).result()  # wait for the queued save
+    assert db.load('job') == ('completed', 100, None, {'readme': '# Repo'}, '"etag"')
+
+    db.delete('job')
+    assert db.load('job') is None
+
+    print("✓ Job state store working correctly")
+
+
+def test_summary_batch_packing(monkeypatch):
+    """Test that summary batches respect the file and token limits"""
+    print("\nTesting summary batch packing...")
+
+    os.environ.setdefault("LONGCAT_API_KEY", "test-key")
+
+    from backend.config import settings
+    from backend.agents.codebase_summarizer import CodebaseSummarizerAgent
+
+    agent = CodebaseSummarizerAgent()
+    files = [{'file_path': f'f{i}.py', 'file_content': '', 'token_count': 100} for i in range(5)]
+
+    monkeypatch.setattr(settings, 'summary_batch_max_files', 2)
+    monkeypatch.setattr(settings, 'summary_batch_max_tokens', 100_000)
+    assert [len(batch) for batch in agent._pack_batch(files)] == [2, 2, 1]
+
+    monkeypatch.setattr(settings, 'summary_batch_max_files', 10)
+    monkeypatch.setattr(settings, 'summary_batch_max_tokens', 350)
+    assert all(len(batch) <= 3 for batch in agent._pack_batch(files))
+    assert sum(len(batch) for batch in agent._pack_batch(files)) == 5
+
+    print("✓ Summary batches packed correctly")
+
+
+def test_status_throttle_flushes_last_update():
+    """Test that throttled progress updates are persisted and flushed later"""
+    print("\nTesting status update throttling...")
+
+    import asyncio
+    from backend.workflow import DocumentationWorkflow, WorkflowStatus
+
+    async def run():
+        workflow = DocumentationWorkflow('throttle-test')
+        sent, saved = [], []
+
+        async def status_callback(payload):
+            sent.append(payload['progress'])
+
+        workflow.set_status_callback(status_callback)
+        workflow.set_state_callback(lambda: saved.append(workflow.progress))
+
+        for progress in (10, 11, 12, 13):
+            await workflow._update_status(WorkflowStatus.SUMMARIZING, progress, f"{progress}%")
+        assert sent == [10]
+        await asyncio.sleep(0.4)
+        assert sent == [10, 13]
+        assert saved == [10, 11, 12, 13]
+
+        # A held update is dropped once a newer one goes out
+        await workflow._update_status(WorkflowStatus.SUMMARIZING, 14, "14%")
+        await workflow._update_status(WorkflowStatus.COMPLETED, 100, "done")
+        await asyncio.sleep(0.4)
+        assert sent == [10, 13, 100]
+        assert saved[-2:] == [14, 100]
+
+    asyncio.run(run())
+
+    print("✓ Throttled status updates flushed")
+
+
+def test_request_slots_shared_budget():
+    """Test that threads and tasks on several event loops share one slot budget"""
+    print("\nTesting LLM request slots...")
+
+    import asyncio
+    import threading
+    import time
+    from backend.agents.llm_client import RequestSlots
+
+    slots = RequestSlots(3)
+    lock = threading.Lock()
+    in_flight = [0, 0]  # current, peak
+
+    def enter():
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+
+    def leave():
+        with lock:
+            in_flight[0] -= 1
+
+    def sync_requests():
+        for _ in range(5):
+            with slots:
+                enter()
+                time.sleep(0.005)
+                leave()
+
+    async def async_requests():
+        for _ in range(5):
+            async with slots:
+                enter()
+                await asyncio.sleep(0.005)
+                leave()
+
+    async def run_loop():
+        tasks = [asyncio.create_task(async_requests()) for _ in range(4)]
+        await asyncio.sleep(0.002)
+        tasks[-1].cancel()  # a cancelled waiter must not leak its slot
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    threads = [threading.Thread(target=sync_requests) for _ in range(3)]
+    threads += [threading.Thread(target=asyncio.run, args=(run_loop(),)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert in_flight == [0, 3]
+    assert slots._free == 3 and not slots._waiters
+
+    print("✓ Request slots shared across threads and event loops")
+
+
+def test_token_budget():
+    """Test the tokens-per-minute budget"""
+    print("\nTesting token budget...")
+
+    import asyncio
+    import time
+    from backend.agents.llm_client import TokenBudget
+
+    unlimited = TokenBudget(0)
+    unlimited.consume(10 ** 9)
+
+    budget = TokenBudget(6000)  # refills 100 tokens per second
+    budget.consume(5900)
+    started = time.monotonic()
+    asyncio.run(budget.aconsume(120))  # 100 left: waits ~0.2s for the rest
+    assert 0.1 < time.monotonic() - started < 1
+
+    print("✓ Token budget working correctly")
 
 
 if __name__ == "__main__":
@@ -131,28 +489,6 @@ if __name__ == "__main__":
     print("Dr. Document - Backend Component Test")
     print("=" * 60)
     
-    results = []
-    
-    results.append(("Imports", test_imports()))
-    results.append(("Logger", test_logger()))
-    results.append(("Config", test_config()))
-    results.append(("Agent Init", test_agent_init()))
-    
-    print("\n" + "=" * 60)
-    print("Test Results:")
-    print("=" * 60)
-    
-    for name, passed in results:
-        status = "✓ PASSED" if passed else "✗ FAILED"
-        print(f"{name}: {status}")
-    
-    all_passed = all(result[1] for result in results)
-    
-    print("\n" + "=" * 60)
-    if all_passed:
-        print("✓ All tests passed!")
-        sys.exit(0)
-    else:
-        print("✗ Some tests failed!")
-        sys.exit(1)
-
+    # Run through pytest so script and test-runner results always agree
+    import pytest
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
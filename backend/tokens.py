@@ -0,0 +1,60 @@
+"""Token counting and token-budget truncation for LLM prompts"""
+from functools import lru_cache
+from typing import Optional, Tuple
+import tiktoken
+from backend.logger import logger
+
+# Rough characters-per-token ratio, used when the tokenizer is unavailable
+_CHARS_PER_TOKEN = 4
+# Only this many characters per budgeted token are encoded when truncating,
+# so huge files are not tokenized in full just to keep their first few KB
+_MAX_CHARS_PER_TOKEN = 16
+
+
+@lru_cache(maxsize=1)
+def _encoder() -> Optional[tiktoken.Encoding]:
+    """Load the cl100k_base encoding once per process (None if unavailable)."""
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads its BPE ranks on first use; fall back to a
+        # character estimate rather than failing the whole workflow offline
+        logger.warning(f"tiktoken encoding unavailable, estimating tokens by length: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in ``text``."""
+    enc = _encoder()
+    if enc is None:
+        return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+    return len(enc.encode(text, disallowed_special=()))
+
+
+@lru_cache(maxsize=64)
+def count_prompt_tokens(text: str) -> int:
+    """count_tokens() memoized for static prompt text that is budgeted on every call."""
+    return count_tokens(text)
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """Return the longest prefix of ``text`` that fits in ``max_tokens`` tokens."""
+    return truncate_counted(text, max_tokens)[0]
+
+
+def truncate_counted(text: str, max_tokens: int) -> Tuple[str, int]:
+    """truncate() that also returns the token count of the kept prefix, from the same encoding pass."""
+    enc = _encoder()
+    if enc is None:
+        kept = text[:max_tokens * _CHARS_PER_TOKEN]
+        return kept, (len(kept) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+
+    window = text[:max_tokens * _MAX_CHARS_PER_TOKEN]
+    ids = enc.encode(window, disallowed_special=())
+    if len(ids) > max_tokens:
+        return enc.decode(ids[:max_tokens]), max_tokens
+    if len(window) == len(text):
+        return text, len(ids)
+    # The window held unusually long tokens — fall back to encoding everything
+    ids = enc.encode(text, disallowed_special=())
+    return enc.decode(ids[:max_tokens]), min(len(ids), max_tokens)
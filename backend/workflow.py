@@ -1,14 +1,23 @@
 """Incremental multi-agent documentation generation workflow"""
 import asyncio
-import json
+import contextlib
+import hashlib
+import heapq
 import os
 import re
+import time
 from typing import Dict, Any, Optional, List, Callable
 from datetime import datetime
+from functools import lru_cache
+from operator import itemgetter
+
+import orjson
 
 from backend.agents.codebase_summarizer import CodebaseSummarizerAgent
+from backend.agents.llm_cache import LLMCache, llm_cache
+from backend.agents.llm_batch import run_batch
 from backend.agents.headings_selector import HeadingsSelectorAgent
-from backend.agents.section_writer import SectionWriterAgent
+from backend.agents.section_writer import get_section_writer, write_sections
 from backend.agents.manager import ManagerAgent
 from backend.agents.final_reviewer import FinalReviewerAgent
 from backend.agents.license_writer import LicenseWriterAgent
@@ -24,6 +33,33 @@ from backend.config import settings
 from backend.logger import logger
 
 
+# heading.lower() -> [reviews, rejections], across every workflow run by this process
+_REVIEW_STATS: Dict[str, List[int]] = {}
+_SPECULATIVE_MIN_REVIEWS = 3
+
+# Generic notes for speculative rewrites, written before the Manager's notes exist
+_SPECULATIVE_NOTES = (
+    'Be more concrete: ground every statement in specific files, commands and '
+    'names from the CODEBASE CONTEXT.'
+)
+
+
+def _record_review(heading: str, approved: bool):
+    """Update the per-heading review statistics."""
+    stats = _REVIEW_STATS.setdefault(heading.lower(), [0, 0])
+    stats[0] += 1
+    stats[1] += not approved
+
+
+def _often_rejected(heading: str) -> bool:
+    """Whether past reviews reject this heading at least speculative_retry_min_reject_rate of the time."""
+    reviews, rejections = _REVIEW_STATS.get(heading.lower(), (0, 0))
+    return (
+        reviews >= _SPECULATIVE_MIN_REVIEWS
+        and rejections / reviews >= settings.speculative_retry_min_reject_rate
+    )
+
+
 class WorkflowStatus:
     """Workflow status constants"""
     PENDING = "pending"
@@ -38,9 +74,142 @@ class WorkflowStatus:
     FAILED = "failed"
 
 
+# Progress-only status updates (same status, same working agent) closer together
+# than this many seconds are not broadcast; polling still sees every change
+_STATUS_MIN_INTERVAL = 0.25
+_TERMINAL_STATUSES = frozenset({WorkflowStatus.COMPLETED, WorkflowStatus.FAILED})
+
+# File ranking when a repository has more files than max_files_to_analyze:
+# entry points, manifests and source code first, shallow before deep, and
+# tests, lockfiles and minified bundles last
+_ENTRY_POINT_STEMS = frozenset({'main', 'app', 'server', 'index', 'cli', 'manage', 'setup', '__main__'})
+_MANIFEST_NAMES = frozenset({
+    'package.json', 'requirements.txt', 'composer.json', 'tsconfig.json',
+    'docker-compose.yml', 'docker-compose.yaml',
+})
+_SOURCE_EXTENSIONS = frozenset({
+    '.py', '.js', '.ts', '.tsx', '.jsx', '.java', '.cpp', '.c', '.h', '.cs',
+    '.go', '.rs', '.rb', '.php', '.swift', '.kt', '.scala',
+})
+_LOW_VALUE_NAMES = frozenset({'package-lock.json', 'yarn.lock', 'pnpm-lock.yaml', 'composer.lock'})
+_TEST_PATH_RE = re.compile(
+    r'(?:^|[\\/])(?:tests?|__tests__|spec|fixtures?|mocks?)[\\/]|(?:^|[\\/])test_|_test\.|\.(?:test|spec)\.',
+    re.IGNORECASE,
+)
+_LARGE_FILE_BYTES = 200_000
+
+# Repositories with at most this many files take the fast path: first drafts
+# are self-reviewed by their writer, so approved sections skip the Manager
+_SMALL_REPO_FILES = 5
+
+
+def _file_priority(file_info: Dict[str, Any]) -> int:
+    """How informative a discovered file is likely to be for documentation (higher first)."""
+    name = file_info['name'].lower()
+    relative_path = file_info['relative_path']
+    score = -relative_path.count(os.sep)
+    if os.path.splitext(name)[0] in _ENTRY_POINT_STEMS:
+        score += 10
+    if name in _MANIFEST_NAMES:
+        score += 8
+    if file_info['extension'] in _SOURCE_EXTENSIONS:
+        score += 5
+    if _TEST_PATH_RE.search(relative_path):
+        score -= 5
+    if name in _LOW_VALUE_NAMES or '.min.' in name:
+        score -= 10
+    if file_info['size'] > _LARGE_FILE_BYTES:
+        score -= 2
+    return score
+
+
+# Characters not allowed in storage folder / agent id names
+_UNSAFE_NAME_RE = re.compile(r'[^\w\-]')
+
+
+@lru_cache(maxsize=512)
 def _safe_dir_name(name: str) -> str:
-    """Convert a string to a safe directory name."""
-    return re.sub(r'[^\w\-]', '_', name)[:60]
+    """Convert a string to a safe directory name (called per heading, attempt and cycle)."""
+    return _UNSAFE_NAME_RE.sub('_', name)[:60]
+
+
+@lru_cache(maxsize=None)
+def _shared_agent(agent_class: type):
+    """
+    One instance per agent class, reused across cycles, attempts and jobs.
+    Agents keep no per-call state and share the process-wide LLM clients.
+    """
+    return agent_class()
+
+
+# Bump to drop every cached workflow result, e.g. after a change the source
+# digest below cannot see (a model served under the same name behaving differently)
+_RESULT_CACHE_VERSION = 1
+
+
+@lru_cache(maxsize=None)
+def _code_version() -> str:
+    """
+    Digest of the workflow, configuration and agent sources (prompts included),
+    so results cached by an earlier deploy are never returned after them.
+    """
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    agents_dir = os.path.join(backend_dir, 'agents')
+    paths = [os.path.join(backend_dir, name) for name in ('workflow.py', 'config.py')]
+    paths += sorted(
+        os.path.join(agents_dir, name) for name in os.listdir(agents_dir) if name.endswith('.py')
+    )
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _result_cache_key(repo_name: str, head_sha: Optional[str]) -> Optional[str]:
+    """
+    Cache key for a whole workflow result: the repository commit, the prompt
+    and workflow code version, and every setting that changes which files are
+    read or which models write. None when the commit is unknown or result
+    caching is disabled.
+    """
+    if not (head_sha and settings.llm_cache_enabled and settings.enable_result_cache):
+        return None
+    return LLMCache.make_key(
+        settings.model_flash_lite,
+        [
+            'result', _RESULT_CACHE_VERSION, _code_version(), repo_name, head_sha,
+            settings.model_flash_chat, settings.model_flash_thinking,
+            settings.max_files_to_analyze, settings.max_file_read_chars,
+            sorted(settings.allowed_file_extensions),
+        ],
+        0,
+        0,
+    )
+
+
+@lru_cache(maxsize=1024)
+def _ensure_dir(path: str):
+    """Create a storage folder once; later writes to it skip the makedirs syscalls."""
+    os.makedirs(path, exist_ok=True)
+
+
+def _write_file(filepath: str, data: bytes, action: str):
+    """Write one storage artifact, creating its folder (runs in a worker thread)."""
+    try:
+        folder = os.path.dirname(filepath)
+        _ensure_dir(folder)
+        try:
+            f = open(filepath, 'wb')
+        except FileNotFoundError:
+            # Folder removed since it was first created (e.g. job storage cleanup)
+            os.makedirs(folder, exist_ok=True)
+            f = open(filepath, 'wb')
+        with f:
+            f.write(data)
+        logger.file_process(filepath, action)
+    except Exception as exc:
+        logger.error(f"Failed to save {os.path.basename(filepath)}: {exc}")
 
 
 class DocumentationWorkflow:
@@ -51,8 +220,14 @@ class DocumentationWorkflow:
         self.status = WorkflowStatus.PENDING
         self.progress = 0
         self.result = None
+        self.result_etag: Optional[str] = None  # strong ETag of the final result
         self.error = None
         self.status_callback: Optional[Callable] = None
+        self.state_callback: Optional[Callable[[], None]] = None
+        self._last_broadcast = 0.0  # monotonic time of the last status broadcast
+        self._last_agent_state: Optional[tuple] = None  # (agent_id, agent_status) last broadcast
+        self._held_payload: Optional[Dict[str, Any]] = None  # latest throttled update, sent later
+        self._flush_task: Optional[asyncio.Task] = None
 
         # GitHub client
         self.github_client = GitHubClient()
@@ -67,6 +242,13 @@ class DocumentationWorkflow:
         """Set callback for status updates (called by the API layer)."""
         self.status_callback = callback
 
+    def set_state_callback(self, callback: Callable[[], None]):
+        """
+        Set a synchronous callback run on every status or progress change,
+        including updates whose broadcast is throttled (e.g. to persist them).
+        """
+        self.state_callback = callback
+
     # ------------------------------------------------------------------
     # Status / progress helpers
     # ------------------------------------------------------------------
@@ -78,13 +260,34 @@ class DocumentationWorkflow:
         message: str = '',
         agent_update: Optional[Dict] = None,
     ):
-        """Broadcast a status update via the callback."""
+        """
+        Broadcast a status update via the callback. Bursts of progress-only
+        updates are thinned to one per _STATUS_MIN_INTERVAL: a throttled update
+        is held back and sent at the end of the interval unless a newer one
+        goes out first. Status changes, agent state changes and terminal
+        states are always sent at once. The state callback sees every update.
+        """
+        previous_status = self.status
         self.status = status
         self.progress = progress
 
         logger.workflow_step("Status Update", f"{status} — {progress}% — {message}")
 
+        if self.state_callback:
+            self.state_callback()
+
         if self.status_callback:
+            now = time.monotonic()
+            agent_state = (
+                (agent_update.get('agent_id'), agent_update.get('agent_status'))
+                if agent_update else self._last_agent_state
+            )
+            progress_only = (
+                status == previous_status
+                and status not in _TERMINAL_STATUSES
+                and agent_state == self._last_agent_state
+            )
+
             payload: Dict[str, Any] = {
                 'job_id': self.job_id,
                 'status': status,
@@ -94,7 +297,29 @@ class DocumentationWorkflow:
             }
             if agent_update:
                 payload['agent_update'] = agent_update
+
+            wait = _STATUS_MIN_INTERVAL - (now - self._last_broadcast)
+            if progress_only and wait > 0:
+                self._held_payload = payload
+                if self._flush_task is None or self._flush_task.done():
+                    self._flush_task = asyncio.create_task(self._flush_held_status(wait))
+                return
+            self._held_payload = None
+            self._last_broadcast = now
+            self._last_agent_state = agent_state
+            await self.status_callback(payload)
+
+    async def _flush_held_status(self, delay: float):
+        """Send the latest throttled update once its interval has passed."""
+        await asyncio.sleep(delay)
+        payload, self._held_payload = self._held_payload, None
+        if payload is None or not self.status_callback:
+            return
+        self._last_broadcast = time.monotonic()
+        try:
             await self.status_callback(payload)
+        except Exception as exc:
+            logger.warning(f"Status update for job {self.job_id} failed: {exc}")
 
     # ------------------------------------------------------------------
     # Storage helpers
@@ -103,45 +328,57 @@ class DocumentationWorkflow:
     def _agent_dir(self, agent_folder: str) -> str:
         """Return (and create) the storage dir for a specific agent."""
         path = os.path.join(self.storage_dir, agent_folder)
-        os.makedirs(path, exist_ok=True)
+        _ensure_dir(path)
         return path
 
     def _save_text(self, agent_folder: str, filename: str, content: str):
-        """Save plain-text content to an agent's storage folder."""
-        try:
-            filepath = os.path.join(self._agent_dir(agent_folder), filename)
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(content)
-            logger.file_process(filepath, 'Saved')
-        except Exception as exc:
-            logger.error(f"Failed to save {filename}: {exc}")
+        """Save plain-text content to an agent's storage folder (written in the background)."""
+        self._save_bytes(agent_folder, filename, content.encode('utf-8'), 'Saved')
 
     def _save_json(self, agent_folder: str, filename: str, data: Any):
-        """Save JSON data to an agent's storage folder."""
+        """Save JSON data to an agent's storage folder (written in the background)."""
         try:
-            filepath = os.path.join(self._agent_dir(agent_folder), filename)
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2)
-            logger.file_process(filepath, 'Saved JSON')
+            encoded = orjson.dumps(data, option=orjson.OPT_INDENT_2)
         except Exception as exc:
             logger.error(f"Failed to save {filename}: {exc}")
+            return
+        self._save_bytes(agent_folder, filename, encoded, 'Saved JSON')
+
+    def _save_bytes(self, agent_folder: str, filename: str, data: bytes, action: str):
+        """
+        Hand the write to the default executor so the event loop never blocks
+        on disk I/O. Saved artifacts are only read by people inspecting a run,
+        so nothing waits for the write to finish.
+        """
+        filepath = os.path.join(self.storage_dir, agent_folder, filename)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            _write_file(filepath, data, action)
+            return
+        loop.run_in_executor(None, _write_file, filepath, data, action)
 
     # ------------------------------------------------------------------
     # Main entry point
     # ------------------------------------------------------------------
 
-    async def execute(self, repo_url: str) -> Dict[str, Any]:
+    async def execute(self, repo_url: str, force: bool = False) -> Dict[str, Any]:
         """
         Execute the complete incremental documentation workflow.
 
+        A commit documented before returns the cached result unless force is
+        set; a forced run replaces that result.
+
         Workflow:
           1. Clone repo
-          2. Agent 1 (Codebase Summarizer): one LLM call per file → codebase.txt
+          2. Agent 1 (Codebase Summarizer): one-line summary per file → codebase.txt
           3. Agent 2 (Headings Selector): select N headings → headings.txt
           4. Agents 3…N (Section Writers): one agent per heading → section files
           5. Manager: review each section individually (up to 3 retries per section)
           6. Agent N+1 (Final Reviewer): review full README (up to 3 full cycles)
+          7. Community files — written alongside steps 3–6, once the summary exists
         """
+        community_task: Optional[asyncio.Task] = None
         try:
             logger.info(f"🚀 Starting workflow for {repo_url}")
             loop = asyncio.get_running_loop()
@@ -158,7 +395,29 @@ class DocumentationWorkflow:
             # Set up per-repo storage directory
             safe_repo = _safe_dir_name(repo_name)
             self.storage_dir = os.path.join(self._base_storage, safe_repo)
-            os.makedirs(self.storage_dir, exist_ok=True)
+            await loop.run_in_executor(None, _ensure_dir, self.storage_dir)
+
+            # Same commit documented before: return that result as is
+            head_sha = await loop.run_in_executor(
+                None, self.github_client.get_head_sha, repo_path
+            )
+            result_key = _result_cache_key(repo_name, head_sha)
+            if result_key is not None and not force:
+                cached = await loop.run_in_executor(None, llm_cache.get, result_key)
+                if cached is not None:
+                    logger.info(f"Reusing the documentation of {repo_name} at {head_sha[:12]}", emoji='LLM')
+                    await self._update_status(
+                        WorkflowStatus.COMPLETED, 100,
+                        "Documentation complete (this commit was documented before)",
+                    )
+                    result = {
+                        **orjson.loads(cached),
+                        'job_id': self.job_id,
+                        'repo_url': repo_url,
+                        'timestamp': datetime.now().isoformat(),
+                    }
+                    self._set_result(result)
+                    return result
 
             # ----------------------------------------------------------------
             # Step 2: Discover files
@@ -173,15 +432,26 @@ class DocumentationWorkflow:
             # Respect max_files_to_analyze setting
             max_files = settings.max_files_to_analyze
             if len(files) > max_files:
-                logger.info(f"Limiting to {max_files} files out of {len(files)}")
-                files = files[:max_files]
+                logger.info(f"Limiting to the {max_files} most informative files out of {len(files)}")
+                # Keep the smallest-first processing order among the chosen files
+                files = sorted(heapq.nlargest(max_files, files, key=_file_priority), key=itemgetter('size'))
 
             # ----------------------------------------------------------------
-            # Step 3: Codebase Summarizer (Agent 1) — one LLM call per file
+            # Step 3: Codebase Summarizer (Agent 1) — batched per-file summaries
             # ----------------------------------------------------------------
-            codebase_summary = await self._run_codebase_summarizer(files, loop)
+            codebase_summary = await self._run_codebase_summarizer(files, loop, head_sha)
             self._save_text('codebase_summarizer', 'codebase.txt', codebase_summary)
 
+            # Community files only need the codebase summary, so they are written
+            # while the README headings, sections and final review are produced
+            repo_owner = repo_name.split('/')[0] if '/' in repo_name else repo_name
+            community_task = asyncio.create_task(self._generate_community_files(
+                repo_name=repo_name,
+                repo_owner=repo_owner,
+                codebase_summary=codebase_summary,
+                loop=loop,
+            ))
+
             # ----------------------------------------------------------------
             # Step 4: Headings Selector (Agent 2)
             # ----------------------------------------------------------------
@@ -194,9 +464,8 @@ class DocumentationWorkflow:
                     'agent_status': 'working',
                 },
             )
-            headings_selector = HeadingsSelectorAgent()
-            headings_result = await loop.run_in_executor(
-                None, headings_selector.run,
+            headings_selector = _shared_agent(HeadingsSelectorAgent)
+            headings_result = await headings_selector.arun(
                 {'codebase_summary': codebase_summary, 'repo_name': repo_name},
             )
             headings: List[str] = headings_result['headings']
@@ -232,6 +501,7 @@ class DocumentationWorkflow:
                     cycle=cycle,
                     global_improvement=improvement_details,
                     loop=loop,
+                    self_check=settings.section_self_check or len(files) <= _SMALL_REPO_FILES,
                 )
 
                 # Combine sections into a full README
@@ -251,7 +521,7 @@ class DocumentationWorkflow:
                     },
                 )
 
-                final_reviewer = FinalReviewerAgent()
+                final_reviewer = _shared_agent(FinalReviewerAgent)
                 final_review_result = await loop.run_in_executor(
                     None, final_reviewer.run,
                     {
@@ -305,18 +575,12 @@ class DocumentationWorkflow:
             # ----------------------------------------------------------------
             self._save_text('final_reviewer', 'README.md', final_readme)
 
-            await self._update_status(WorkflowStatus.COMMUNITY_FILES, 95, "README complete — generating community files…")
+            await self._update_status(WorkflowStatus.COMMUNITY_FILES, 95, "README complete — finishing community files…")
 
             # ----------------------------------------------------------------
             # Community file generation (LICENSE, CONTRIBUTING, etc.)
             # ----------------------------------------------------------------
-            repo_owner = repo_name.split('/')[0] if '/' in repo_name else repo_name
-            community_files = await self._generate_community_files(
-                repo_name=repo_name,
-                repo_owner=repo_owner,
-                codebase_summary=codebase_summary,
-                loop=loop,
-            )
+            community_files = await community_task
 
             await self._update_status(WorkflowStatus.COMPLETED, 100, "Documentation complete!")
 
@@ -336,7 +600,10 @@ class DocumentationWorkflow:
                 'storage_path': self.storage_dir,
                 'timestamp': datetime.now().isoformat(),
             }
-            self.result = result
+            self._set_result(result)
+            # Only approved documentation is worth handing out again
+            if result_key is not None and result['final_review']['approved']:
+                await loop.run_in_executor(None, llm_cache.set, result_key, orjson.dumps(result).decode())
             logger.success(f"✅ Workflow completed for {repo_name}")
             return result
 
@@ -348,51 +615,101 @@ class DocumentationWorkflow:
             raise
 
         finally:
-            self.github_client.cleanup()
+            if community_task is not None:
+                # Cancel a still-running task and retrieve its outcome either way,
+                # so a failure is never left unretrieved
+                community_task.cancel()
+                with contextlib.suppress(asyncio.CancelledError, Exception):
+                    await community_task
+            # Removing the clone walks the whole tree; keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, self.github_client.cleanup)
+
+    def _set_result(self, result: Dict[str, Any]):
+        """Publish the final result together with its strong ETag."""
+        self.result_etag = '"{}"'.format(
+            hashlib.blake2b(orjson.dumps(result), digest_size=16).hexdigest()
+        )
+        self.result = result
 
     # ------------------------------------------------------------------
     # Codebase Summarizer helper
     # ------------------------------------------------------------------
 
     async def _run_codebase_summarizer(
-        self, files: List[Dict], loop: asyncio.AbstractEventLoop
+        self, files: List[Dict], loop: asyncio.AbstractEventLoop, head_sha: Optional[str] = None
     ) -> str:
-        """Run Agent 1: one LLM call per file, build codebase.txt."""
-        summarizer = CodebaseSummarizerAgent()
-        total = len(files)
-        lines: List[str] = []
+        """
+        Run Agent 1: batched, concurrent LLM summaries of every file → codebase.txt.
+        A summary of the same commit (head_sha) and file selection from an
+        earlier run is reused without reading or summarizing any file.
+        """
+        summarizer = _shared_agent(CodebaseSummarizerAgent)
+
+        cache_key = summarizer.codebase_cache_key(head_sha, [f['relative_path'] for f in files])
+        if cache_key is not None:
+            cached = await loop.run_in_executor(None, llm_cache.get, cache_key)
+            if cached is not None:
+                logger.info(f"Reusing codebase summary of commit {head_sha[:12]}", emoji='LLM')
+                await self._complete_summarizer(cached)
+                return cached
+
+        contents = await asyncio.gather(*(
+            loop.run_in_executor(None, self.github_client.read_file_content, f['path'])
+            for f in files
+        ))
+        files_data = [
+            {'file_path': f['relative_path'], 'file_content': content}
+            for f, content in zip(files, contents)
+            if content
+        ]
+        total = len(files_data)
+        logger.info(f"Read {total}/{len(files)} files for summarizing", emoji='FOLDER')
 
-        for idx, file_info in enumerate(files):
-            progress = 8 + int((idx / total) * 30)  # 8 → 38%
+        async def on_progress(done: int, total: int):
             await self._update_status(
                 WorkflowStatus.SUMMARIZING,
-                progress,
-                f"Summarizing {file_info['relative_path']} ({idx + 1}/{total})…",
+                8 + int((done / total) * 30),  # 8 → 38%
+                f"Summarized {done}/{total} files…",
                 agent_update={
                     'agent_id': 'codebase_summarizer',
                     'agent_name': '👁️ Codebase Summarizer',
                     'agent_status': 'working',
-                    'agent_progress': int((idx / total) * 100),
+                    'agent_progress': int((done / total) * 100),
                 },
             )
-            try:
-                content = await loop.run_in_executor(
-                    None, self.github_client.read_file_content, file_info['path']
-                )
-                if content:
-                    result = await loop.run_in_executor(
-                        None, summarizer.run,
-                        {'file_path': file_info['relative_path'], 'file_content': content},
-                    )
-                    lines.append(f"{result['file_path']} = {result['summary']}")
-            except Exception as exc:
-                logger.error(f"Failed to summarize {file_info['relative_path']}: {exc}")
-                continue
 
+        await self._update_status(
+            WorkflowStatus.SUMMARIZING,
+            8,
+            f"Summarizing {total} files…",
+            agent_update={
+                'agent_id': 'codebase_summarizer',
+                'agent_name': '👁️ Codebase Summarizer',
+                'agent_status': 'working',
+                'agent_progress': 0,
+            },
+        )
+        # Partial results land in codebase.txt as they arrive; the caller
+        # then saves the complete summary in input order over it
+        codebase_summary = await summarizer.summarize_all_async(
+            files_data,
+            progress_callback=on_progress,
+            out_path=os.path.join(self._agent_dir('codebase_summarizer'), 'codebase.txt'),
+        )
+        # Only complete summaries are reused; files that failed may succeed next run
+        if cache_key is not None and codebase_summary and codebase_summary.count('\n') + 1 == total:
+            await loop.run_in_executor(None, llm_cache.set, cache_key, codebase_summary)
+
+        await self._complete_summarizer(codebase_summary)
+        return codebase_summary
+
+    async def _complete_summarizer(self, codebase_summary: str):
+        """Report the finished codebase summary (38% progress)."""
+        summarized = codebase_summary.count('\n') + 1 if codebase_summary else 0
         await self._update_status(
             WorkflowStatus.SUMMARIZING,
             38,
-            f"Codebase summary complete ({len(lines)} files)",
+            f"Codebase summary complete ({summarized} files)",
             agent_update={
                 'agent_id': 'codebase_summarizer',
                 'agent_name': '👁️ Codebase Summarizer',
@@ -400,7 +717,6 @@ class DocumentationWorkflow:
                 'agent_progress': 100,
             },
         )
-        return '\n'.join(lines)
 
     # ------------------------------------------------------------------
     # Section writing + manager review loop
@@ -414,64 +730,147 @@ class DocumentationWorkflow:
         cycle: int,
         global_improvement: str,
         loop: asyncio.AbstractEventLoop,
+        self_check: bool = False,
     ) -> List[Dict[str, str]]:
         """
-        For every heading:
-          1. SectionWriterAgent writes the section.
-          2. ManagerAgent reviews it (up to 3 retries with improvement notes).
-        Returns a list of {'heading': ..., 'content': ...} dicts.
+        Write and review every heading in rounds (up to 3):
+          1. SectionWriterAgent writes every pending section concurrently
+             (at most settings.llm_max_concurrency in flight). With
+             self_check, first drafts are self-reviewed in the same call and
+             self-approved sections skip the Manager.
+          2. ManagerAgent reviews all of them in batched calls; rejected
+             sections are rewritten with their improvement notes next round.
+             With settings.speculative_section_retry, often-rejected sections are
+             rewritten during the review and that draft is used next round instead.
+        Sections still rejected after the last round are used as written.
+        Returns a list of {'heading': ..., 'content': ...} dicts in heading order.
         """
         total_headings = len(headings)
-        approved_sections: List[Dict[str, str]] = []
-        manager = ManagerAgent()
+        manager = _shared_agent(ManagerAgent)
         max_section_retries = 3
 
-        # Base progress range: 45 → 85% spread across headings
-        progress_per_heading = int(40 / max(total_headings, 1))
-
-        for h_idx, heading in enumerate(headings):
-            base_prog = 45 + h_idx * progress_per_heading
-            agent_id = f"section_writer_{_safe_dir_name(heading)}"
-            agent_folder = f"section_writer_{_safe_dir_name(heading)}"
-
-            improvement_notes = global_improvement  # carry forward global notes on cycle > 1
-            section_content = ''
+        contents: Dict[str, str] = {}
+        notes: Dict[str, str] = {h: global_improvement for h in headings}  # carry forward global notes on cycle > 1
+        pending = list(headings)
+        drafts: Dict[str, str] = {}  # speculative rewrites ready for the next round
+        self_approved: List[str] = []
+        finished = 0
+        sem = asyncio.Semaphore(settings.llm_max_concurrency)
+        progress = 45  # 45 → 85% over the whole stage
+
+        def advance(step: int) -> int:
+            nonlocal progress
+            progress = max(progress, 45 + int(40 * step / max(total_headings, 1)))
+            return progress
+
+        for attempt in range(1, max_section_retries + 1):
+            # --- Write every pending section concurrently ---
+            def writer_input(heading: str) -> Dict[str, str]:
+                return {
+                    'heading': heading,
+                    'codebase_summary': codebase_summary,
+                    'repo_name': repo_name,
+                    'improvement_notes': notes[heading],
+                    # The rejected draft from the previous attempt, edited in place
+                    'prior_content': contents.get(heading, ''),
+                }
+
+            batch_replies: Dict[str, str] = {}
+            if settings.use_batch_api:
+                to_write = [
+                    h for h in pending
+                    if h not in drafts and not get_section_writer(h).is_templated
+                ]
+                if len(to_write) > 1:
+                    batch_replies = await self._run_section_batch([writer_input(h) for h in to_write])
+
+            def store(heading: str, content: str):
+                contents[heading] = content
+                self._save_text(
+                    f"section_writer_{_safe_dir_name(heading)}",
+                    f'section_cycle{cycle}_attempt{attempt}.md',
+                    content,
+                )
 
-            for attempt in range(1, max_section_retries + 1):
-                # --- Write section ---
+            to_call: List[str] = []
+            for heading in pending:
                 await self._update_status(
                     WorkflowStatus.WRITING_SECTIONS,
-                    base_prog,
+                    advance(finished),
                     f"[Cycle {cycle}] Writing '{heading}' (attempt {attempt}/{max_section_retries})…",
                     agent_update={
-                        'agent_id': agent_id,
+                        'agent_id': f"section_writer_{_safe_dir_name(heading)}",
                         'agent_name': f'✍️ Section Writer: {heading}',
                         'agent_status': 'working',
                     },
                 )
+                if heading in drafts:
+                    store(heading, drafts.pop(heading))
+                elif heading in batch_replies:
+                    store(heading, get_section_writer(heading).finish_batch_reply(batch_replies[heading])['content'])
+                else:
+                    to_call.append(heading)
+
+            def on_section(result: Dict[str, Any]):
+                store(result['heading'], result['content'])
+                if result.get('self_approved'):
+                    self_approved.append(result['heading'])
+
+            check_drafts = self_check and attempt == 1
+            await write_sections(
+                [{**writer_input(h), 'self_check': True} if check_drafts else writer_input(h) for h in to_call],
+                on_section=on_section,
+                sem=sem,
+            )
 
-                writer = SectionWriterAgent(heading)
-                writer_result = await loop.run_in_executor(
-                    None, writer.run,
-                    {
-                        'heading': heading,
-                        'codebase_summary': codebase_summary,
-                        'repo_name': repo_name,
-                        'improvement_notes': improvement_notes,
+            # --- Sections approved by their writer's self-check skip the review ---
+            for heading in self_approved:
+                logger.success(f"'{heading}' self-approved by its writer on attempt {attempt}")
+                finished += 1
+                await self._update_status(
+                    WorkflowStatus.WRITING_SECTIONS,
+                    advance(finished),
+                    f"'{heading}' approved ✓",
+                    agent_update={
+                        'agent_id': f"section_writer_{_safe_dir_name(heading)}",
+                        'agent_name': f'✍️ Section Writer: {heading}',
+                        'agent_status': 'completed',
                     },
                 )
-                section_content = writer_result['content']
-                self._save_text(
-                    agent_folder,
-                    f'section_cycle{cycle}_attempt{attempt}.md',
-                    section_content,
-                )
+            if self_approved:
+                pending = [h for h in pending if h not in self_approved]
+                self_approved.clear()
+                if not pending:
+                    break
 
-                # --- Manager review ---
+            # --- Speculative rewrites of often-rejected sections, during review ---
+            async def speculate(heading: str) -> Dict[str, Any]:
+                async with sem:
+                    return await get_section_writer(heading).arun({
+                        **writer_input(heading),
+                        'prior_content': '',  # an alternative draft, not an edit
+                        'improvement_notes': '\n'.join(filter(None, [notes[heading], _SPECULATIVE_NOTES])),
+                        'temperature': 0.7,
+                    })
+
+            speculative: Dict[str, asyncio.Task] = {}
+            if settings.speculative_section_retry and attempt < max_section_retries:
+                speculative = {
+                    heading: asyncio.create_task(speculate(heading))
+                    for heading in pending
+                    if _often_rejected(heading)
+                }
+            speculative_tasks = list(speculative.values())
+
+            # Speculative rewrites still running when the review fails or a
+            # section is approved are cancelled; every task is awaited so a
+            # failed one never goes unretrieved
+            try:
+                # --- Manager review (batched) ---
                 await self._update_status(
                     WorkflowStatus.MANAGER_REVIEW,
-                    base_prog + 1,
-                    f"[Cycle {cycle}] Manager reviewing '{heading}'…",
+                    advance(finished + len(pending) - 1),
+                    f"[Cycle {cycle}] Manager reviewing {len(pending)} section(s)…",
                     agent_update={
                         'agent_id': 'manager',
                         'agent_name': '👔 Manager',
@@ -479,49 +878,64 @@ class DocumentationWorkflow:
                     },
                 )
 
-                review = await loop.run_in_executor(
-                    None, manager.run,
-                    {
-                        'heading': heading,
-                        'section_content': section_content,
-                        'codebase_summary': codebase_summary,
-                        'repo_name': repo_name,
-                    },
-                )
-                self._save_json(
-                    'manager',
-                    f'review_{_safe_dir_name(heading)}_cycle{cycle}_attempt{attempt}.json',
-                    review,
+                reviews = await loop.run_in_executor(
+                    None, manager.process_batch,
+                    [
+                        {
+                            'heading': heading,
+                            'section_content': contents[heading],
+                            'codebase_summary': codebase_summary,
+                            'repo_name': repo_name,
+                        }
+                        for heading in pending
+                    ],
                 )
 
-                if review.get('approved', False):
-                    logger.success(
-                        f"Manager APPROVED '{heading}' on attempt {attempt}"
-                    )
-                    await self._update_status(
-                        WorkflowStatus.MANAGER_REVIEW,
-                        base_prog + 2,
-                        f"'{heading}' approved ✓",
-                        agent_update={
-                            'agent_id': agent_id,
-                            'agent_name': f'✍️ Section Writer: {heading}',
-                            'agent_status': 'completed',
-                        },
+                rejected: List[str] = []
+                for heading, review in zip(pending, reviews):
+                    agent_id = f"section_writer_{_safe_dir_name(heading)}"
+                    self._save_json(
+                        'manager',
+                        f'review_{_safe_dir_name(heading)}_cycle{cycle}_attempt{attempt}.json',
+                        review,
                     )
-                    break
-                else:
-                    improvement_notes = review.get('improvement_notes', '')
+
+                    approved = review.get('approved', False)
+                    _record_review(heading, approved)
+                    task = speculative.pop(heading, None)
+
+                    if approved:
+                        if task is not None:
+                            task.cancel()
+                        logger.success(
+                            f"Manager APPROVED '{heading}' on attempt {attempt}"
+                        )
+                        finished += 1
+                        await self._update_status(
+                            WorkflowStatus.MANAGER_REVIEW,
+                            advance(finished),
+                            f"'{heading}' approved ✓",
+                            agent_update={
+                                'agent_id': agent_id,
+                                'agent_name': f'✍️ Section Writer: {heading}',
+                                'agent_status': 'completed',
+                            },
+                        )
+                        continue
+
+                    notes[heading] = review.get('improvement_notes', '')
                     logger.warning(
                         f"Manager REJECTED '{heading}' on attempt {attempt}. "
-                        f"Notes: {improvement_notes[:150]}"
+                        f"Notes: {notes[heading][:150]}"
                     )
                     if attempt == max_section_retries:
                         logger.warning(
                             f"Max retries reached for '{heading}' — using last attempt"
                         )
+                        finished += 1
                         await self._update_status(
                             WorkflowStatus.MANAGER_REVIEW,
-                            base_prog + 2,
+                            advance(finished),
                             f"'{heading}' used after max retries",
                             agent_update={
                                 'agent_id': agent_id,
@@ -529,10 +943,23 @@ class DocumentationWorkflow:
                                 'agent_status': 'completed',
                             },
                         )
+                    else:
+                        rejected.append(heading)
+                        if task is not None:
+                            try:
+                                drafts[heading] = (await task)['content']
+                            except Exception as exc:
+                                logger.warning(f"Speculative rewrite of '{heading}' failed: {exc}")
+            finally:
+                for task in speculative.values():
+                    task.cancel()
+                await asyncio.gather(*speculative_tasks, return_exceptions=True)
+
+            pending = rejected
+            if not pending:
+                break
 
-            approved_sections.append({'heading': heading, 'content': section_content})
-
-        return approved_sections
+        return [{'heading': heading, 'content': contents[heading]} for heading in headings]
 
     # ------------------------------------------------------------------
     # Community file generation
@@ -549,8 +976,14 @@ class DocumentationWorkflow:
         Generate the 6 community health files with manager review (up to 3 retries
         per file) and a final reviewer (up to 3 full cycles).
 
+        Runs alongside the README stages, so its status updates only report
+        agent progress and leave the overall status and progress to them.
+
         Returns a list of {'filename': ..., 'content': ...} dicts.
         """
+        async def report(message: str, agent_update: Dict[str, Any]):
+            await self._update_status(self.status, self.progress, message, agent_update=agent_update)
+
         # Define the 6 writer agents
         writer_factories = [
             ('LICENSE',             LicenseWriterAgent),
@@ -572,9 +1005,7 @@ class DocumentationWorkflow:
             for filename, WriterClass in writer_factories:
                 agent_id = f"community_{filename.replace('.', '_').lower()}"
 
-                await self._update_status(
-                    WorkflowStatus.COMMUNITY_FILES,
-                    95,
+                await report(
                     f"[Cycle {cycle}] Writing {filename}…",
                     agent_update={
                         'agent_id': agent_id,
@@ -586,10 +1017,10 @@ class DocumentationWorkflow:
                 improvement_notes = community_improvement
                 file_content = ''
                 max_retries = 3
-                manager = CommunityManagerAgent()
+                manager = _shared_agent(CommunityManagerAgent)
 
                 for attempt in range(1, max_retries + 1):
-                    writer = WriterClass()
+                    writer = _shared_agent(WriterClass)
                     writer_result = await loop.run_in_executor(
                         None, writer.run,
                         {
@@ -628,9 +1059,7 @@ class DocumentationWorkflow:
 
                 approved_files.append({'filename': filename, 'content': file_content})
 
-                await self._update_status(
-                    WorkflowStatus.COMMUNITY_FILES,
-                    96,
+                await report(
                     f"{filename} done ✓",
                     agent_update={
                         'agent_id': agent_id,
@@ -640,9 +1069,7 @@ class DocumentationWorkflow:
                 )
 
             # Community Final Reviewer
-            await self._update_status(
-                WorkflowStatus.COMMUNITY_FILES,
-                98,
+            await report(
                 f"Final review of community files — cycle {cycle}…",
                 agent_update={
                     'agent_id': 'community_final_reviewer',
@@ -651,7 +1078,7 @@ class DocumentationWorkflow:
                 },
             )
 
-            final_reviewer = CommunityFinalReviewerAgent()
+            final_reviewer = _shared_agent(CommunityFinalReviewerAgent)
             final_result = await loop.run_in_executor(
                 None, final_reviewer.run,
                 {
@@ -662,9 +1089,7 @@ class DocumentationWorkflow:
             )
             self._save_json('community_files', f'final_review_cycle_{cycle}.json', final_result)
 
-            await self._update_status(
-                WorkflowStatus.COMMUNITY_FILES,
-                99,
+            await report(
                 "Community files approved!" if final_result.get('approved') else f"Retrying community files (cycle {cycle + 1})…",
                 agent_update={
                     'agent_id': 'community_final_reviewer',
@@ -692,24 +1117,32 @@ class DocumentationWorkflow:
     # Combine sections
     # ------------------------------------------------------------------
 
+    async def _run_section_batch(self, inputs: List[Dict[str, str]]) -> Dict[str, str]:
+        """
+        Write sections through the provider Batch API.
+        Returns {heading: raw reply}; headings missing from the result (or all of
+        them, if the batch fails) are written with direct calls instead.
+        """
+        requests = [get_section_writer(i['heading']).build_batch_request(i) for i in inputs]
+        try:
+            return await run_batch(requests)
+        except Exception as exc:
+            logger.warning(f"Batch API section writing failed, using direct calls: {exc}")
+            return {}
+
     def _combine_sections(self, repo_name: str, sections: List[Dict[str, str]]) -> str:
         """Combine all approved sections into a single README string."""
-        parts = [f"# {repo_name}\n"]
-        seen_headings: set = set()
+        # First section per heading (case-insensitive), in order
+        unique: Dict[str, str] = {}
         for section in sections:
-            heading_key = section['heading'].lower()
-            if heading_key in seen_headings:
-                continue
-            seen_headings.add(heading_key)
-            parts.append(section['content'])
-            parts.append('')  # blank line between sections
+            unique.setdefault(section['heading'].lower(), section['content'])
+        body = ''.join(f"{content}\n\n" for content in unique.values())  # blank line between sections
 
         # Footer: "Made with ❤️ by username" only — no tech-stack badges at the bottom
         username = repo_name.split('/')[0] if '/' in repo_name else repo_name
-        parts.append('---')
-        parts.append('')
-        parts.append(
+        footer = (
+            f'---\n\n'
             f'<p align="center">Made with ❤️ by '
             f'<a href="https://github.com/{username}">{username}</a></p>'
         )
-        return '\n'.join(parts)
+        return f"# {repo_name}\n\n{body}{footer}"
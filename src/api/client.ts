@@ -121,7 +121,11 @@ class ApiClient {
     ws.onmessage = (event) => {
       try {
         const data = JSON.parse(event.data);
-        onMessage(data);
+        // Bursts of updates arrive as a single { batch: [...] } frame
+        const updates: StatusUpdate[] = Array.isArray(data.batch) ? data.batch : [data];
+        for (const update of updates) {
+          onMessage(update);
+        }
       } catch (error) {
         console.error('Failed to parse WebSocket message:', error);
       }